@@ -1,6 +1,33 @@
 from django.contrib import admin
-from .models import CategoriaRecurso, Recurso
+from .models import BandaDiagnostico, CategoriaRecurso, ParametrosHot, Recurso, VersionBandas
+
+
+class BandaDiagnosticoInline(admin.TabularInline):
+    model = BandaDiagnostico
+    extra = 4
+
+    # Las bandas de una versión con resultados son de solo lectura: cambiarlas reescribiría
+    # diagnósticos y conteos ya guardados. Para otras bandas se crea una versión nueva
+    def has_add_permission(self, request, obj=None):
+        return super().has_add_permission(request, obj) and not (obj and obj.en_uso())
+
+    def has_change_permission(self, request, obj=None):
+        return super().has_change_permission(request, obj) and not (obj and obj.en_uso())
+
+    def has_delete_permission(self, request, obj=None):
+        return super().has_delete_permission(request, obj) and not (obj and obj.en_uso())
+
+
+@admin.register(VersionBandas)
+class VersionBandasAdmin(admin.ModelAdmin):
+    list_display = ('id', 'descripcion', 'creada_en')
+    inlines = [BandaDiagnosticoInline]
+
+    def has_delete_permission(self, request, obj=None):
+        return super().has_delete_permission(request, obj) and not (obj and obj.en_uso())
+
 
 # Register your models here.
 admin.site.register(CategoriaRecurso)
-admin.site.register(Recurso)
\ No newline at end of file
+admin.site.register(Recurso)
+admin.site.register(ParametrosHot)
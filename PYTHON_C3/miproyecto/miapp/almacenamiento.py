@@ -0,0 +1,249 @@
+"""
+Almacenamiento direccionado por contenido para los archivos subidos.
+
+Cada archivo se guarda con el SHA-256 de su contenido como nombre, en
+carpetas repartidas por los primeros caracteres del hash y dentro de la
+carpeta de su campo (upload_to):
+
+    portadas/3f/a2/3fa2...c9.png
+
+Subir dos veces el mismo archivo a la misma carpeta no ocupa más disco: la
+segunda subida reutiliza el archivo existente. Se mantiene la carpeta del
+campo para que los permisos por prefijo de medios.py (contenido_personalizado/)
+sigan valiendo. Como el nombre cambia si cambia el contenido, esos archivos
+se pueden cachear sin caducidad.
+
+ArchivoContenido lleva la cuenta de cuántos campos apuntan a cada archivo;
+las señales de abajo la actualizan al guardar y borrar los modelos con campos
+en este almacenamiento, y el archivo se borra cuando nadie lo usa. Los
+archivos anteriores a este almacenamiento (sin fila) no se tocan.
+
+Reutilizar un archivo y borrarlo se excluyen con el lock de su fila: la
+subida comprueba el archivo y toca actualizado_en con la fila bloqueada, y
+el borrado (tras el commit que dejó la fila a cero) solo borra si, con la
+fila bloqueada, sigue a cero y nadie la ha tocado desde entonces. Como las
+señales actualizan la cuenta después del save y no en su misma transacción,
+el comando recontar_archivos la recalcula desde los modelos.
+"""
+import hashlib
+import os
+import posixpath
+import tempfile
+from collections import Counter
+from datetime import timedelta
+
+from django.core.files.storage import FileSystemStorage
+from django.db import IntegrityError, transaction
+from django.db.models import F
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.utils import timezone
+
+TAMANO_BLOQUE = 64 * 1024
+HORAS_SIN_REFERENCIAS = 24
+
+
+class AlmacenamientoPorContenido(FileSystemStorage):
+
+    def get_available_name(self, name, max_length=None):
+        # El nombre definitivo lo decide el contenido en _save(); nunca se renombra para evitar colisiones
+        return name
+
+    def nombre_para(self, name, sha256):
+        carpeta = posixpath.dirname(name)
+        extension = os.path.splitext(name)[1].lower()
+        return posixpath.join(carpeta, sha256[:2], sha256[2:4], f'{sha256}{extension}')
+
+    def _save(self, name, content):
+        carpeta = os.path.dirname(self.path(name))
+        os.makedirs(carpeta, exist_ok=True)
+        sha = hashlib.sha256()
+        tamano = 0
+        # Se escribe a un temporal en el mismo sistema de archivos mientras se calcula el hash
+        with tempfile.NamedTemporaryFile(dir=carpeta, prefix='.subiendo-', delete=False) as temporal:
+            try:
+                for bloque in content.chunks(TAMANO_BLOQUE):
+                    if isinstance(bloque, str):
+                        bloque = bloque.encode()
+                    temporal.write(bloque)
+                    sha.update(bloque)
+                    tamano += len(bloque)
+            except BaseException:
+                temporal.close()
+                os.remove(temporal.name)
+                raise
+        return self._colocar(temporal.name, name, sha.hexdigest(), tamano)
+
+    def adoptar(self, ruta, name, sha256):
+        """Coloca el archivo local `ruta` (cuyo hash ya se conoce) con un rename, sin copiarlo. Devuelve el nombre"""
+        return self._colocar(ruta, name, sha256, os.path.getsize(ruta))
+
+    def _colocar(self, ruta, name, sha256, tamano):
+        nombre = self.nombre_para(name, sha256)
+        destino = self.path(nombre)
+        with transaction.atomic():
+            # Con la fila bloqueada un borrado simultáneo no puede quitar el archivo entre la comprobación y el uso
+            fila = _fila_bloqueada(nombre, sha256, tamano)
+            if os.path.exists(destino):
+                os.remove(ruta)  # Ya estaba: se reutiliza
+            else:
+                os.makedirs(os.path.dirname(destino), exist_ok=True)
+                if self.file_permissions_mode is not None:
+                    os.chmod(ruta, self.file_permissions_mode)
+                os.replace(ruta, destino)
+            # Se aleja de la purga de archivos sin usos hasta que el formulario lo guarde, y un borrado
+            # pendiente de la fila a cero ve que la tocaron y no borra
+            fila.save(update_fields=['actualizado_en'])
+        return nombre
+
+
+def por_contenido():
+    """Almacenamiento de los FileField de recursos y contenido personalizado (callable para las migraciones)"""
+    return _almacenamiento
+
+
+_almacenamiento = AlmacenamientoPorContenido()
+
+
+# ==================== REFERENCIAS ====================
+
+def _fila_bloqueada(nombre, sha256, tamano):
+    from .models import ArchivoContenido
+
+    fila = ArchivoContenido.objects.select_for_update().filter(nombre=nombre).first()
+    if fila is not None:
+        return fila
+    try:
+        with transaction.atomic():
+            return ArchivoContenido.objects.create(nombre=nombre, sha256=sha256, tamano=tamano)
+    except IntegrityError:
+        # Otra subida simultánea del mismo archivo creó la fila
+        return ArchivoContenido.objects.select_for_update().get(nombre=nombre)
+
+
+def _campos(modelo):
+    return [
+        campo.attname for campo in modelo._meta.concrete_fields
+        if isinstance(getattr(campo, 'storage', None), AlmacenamientoPorContenido)
+    ]
+
+
+def _nombres(instancia, campos):
+    return Counter(nombre for nombre in (getattr(instancia, campo).name for campo in campos) if nombre)
+
+
+def _borrar_sin_uso(marcas):
+    """
+    Borra archivo y fila de los {nombre: actualizado_en} que siguen a cero y sin tocar desde que se marcaron.
+
+    Se comprueba y se borra con la fila bloqueada: una subida que reutiliza el archivo espera a que
+    termine (y lo vuelve a colocar) o ya ha cambiado actualizado_en y el archivo se conserva.
+    """
+    from .models import ArchivoContenido
+
+    with transaction.atomic():
+        filas = [
+            fila for fila in ArchivoContenido.objects.select_for_update().filter(nombre__in=list(marcas), referencias=0)
+            if fila.actualizado_en == marcas[fila.nombre]
+        ]
+        for fila in filas:
+            _almacenamiento.delete(fila.nombre)
+        ArchivoContenido.objects.filter(pk__in=[fila.pk for fila in filas]).delete()
+    return len(filas)
+
+
+def cambiar_referencias(sumar=None, restar=None):
+    """Suma y resta usos (Counter nombre -> veces); borra tras el commit los archivos que quedan sin usos"""
+    from .models import ArchivoContenido
+
+    sumar, restar = sumar or Counter(), restar or Counter()
+    with transaction.atomic():
+        for nombre, veces in sumar.items():
+            ArchivoContenido.objects.filter(nombre=nombre).update(referencias=F('referencias') + veces)
+        marcas = {}
+        for fila in ArchivoContenido.objects.select_for_update().filter(nombre__in=list(restar)):
+            fila.referencias = max(0, fila.referencias - restar[fila.nombre])
+            fila.save(update_fields=['referencias', 'actualizado_en'])
+            if not fila.referencias:
+                # La fila se queda a cero hasta el borrado: es lo que bloquea una reutilización simultánea
+                marcas[fila.nombre] = fila.actualizado_en
+        if marcas:
+            transaction.on_commit(lambda: _borrar_sin_uso(marcas))
+
+
+def _afecta_archivos(campos, update_fields):
+    return update_fields is None or any(campo in update_fields for campo in campos)
+
+
+def _recordar_previos(sender, instance, update_fields=None, **kwargs):
+    campos = _campos(sender)
+    if not _afecta_archivos(campos, update_fields):
+        return
+    previos = Counter()
+    if instance.pk is not None and not instance._state.adding:
+        fila = sender._default_manager.filter(pk=instance.pk).values_list(*campos).first()
+        previos = Counter(nombre for nombre in (fila or ()) if nombre)
+    instance._archivos_previos = previos
+
+
+def _actualizar_referencias(sender, instance, update_fields=None, **kwargs):
+    campos = _campos(sender)
+    if not _afecta_archivos(campos, update_fields):
+        return
+    previos = getattr(instance, '_archivos_previos', Counter())
+    actuales = _nombres(instance, campos)
+    cambiar_referencias(sumar=actuales - previos, restar=previos - actuales)
+    instance._archivos_previos = actuales
+
+
+def _liberar_referencias(sender, instance, **kwargs):
+    cambiar_referencias(restar=_nombres(instance, _campos(sender)))
+
+
+def purgar_sin_referencias(horas=HORAS_SIN_REFERENCIAS):
+    """Borra los archivos que ningún modelo llegó a usar (p. ej. formularios que fallaron tras subir)"""
+    from .models import ArchivoContenido
+
+    limite = timezone.now() - timedelta(hours=horas)
+    return _borrar_sin_uso(dict(
+        ArchivoContenido.objects.filter(referencias=0, actualizado_en__lt=limite).values_list('nombre', 'actualizado_en')
+    ))
+
+
+def recontar_referencias():
+    """
+    Recalcula ArchivoContenido.referencias contando los campos de todos los modelos. Devuelve las filas corregidas.
+
+    Un save cuyo post_save todavía no actualizó la cuenta puede quedar contado dos veces o ninguna;
+    la siguiente ejecución lo corrige. Las filas que quedan a cero las borra purgar_sin_referencias.
+    """
+    from django.apps import apps
+
+    from .imagenes import rutas as rutas_variantes
+    from .models import ArchivoContenido, Recurso
+
+    with transaction.atomic():
+        filas = list(ArchivoContenido.objects.select_for_update().order_by('id'))
+        usos = Counter()
+        for modelo in apps.get_models():
+            campos = _campos(modelo)
+            if campos:
+                for valores in modelo._default_manager.values_list(*campos).iterator():
+                    usos.update(nombre for nombre in valores if nombre)
+        # Las variantes de las portadas también cuentan como usos (imagenes.py)
+        for variantes in Recurso.objects.exclude(variantes_portada={}).values_list('variantes_portada', flat=True).iterator():
+            usos.update(rutas_variantes(variantes))
+        corregidas = [fila for fila in filas if fila.referencias != usos[fila.nombre]]
+        for fila in corregidas:
+            fila.referencias = usos[fila.nombre]
+            fila.save(update_fields=['referencias', 'actualizado_en'])
+    return len(corregidas)
+
+
+def conectar():
+    """Conecta las señales de los modelos con algún campo en este almacenamiento (desde AppConfig.ready)"""
+    from django.apps import apps
+
+    for modelo in (modelo for modelo in apps.get_models() if _campos(modelo)):
+        pre_save.connect(_recordar_previos, sender=modelo, dispatch_uid=f'archivos_previos_{modelo.__name__}')
+        post_save.connect(_actualizar_referencias, sender=modelo, dispatch_uid=f'archivos_save_{modelo.__name__}')
+        post_delete.connect(_liberar_referencias, sender=modelo, dispatch_uid=f'archivos_delete_{modelo.__name__}')
@@ -0,0 +1,120 @@
+"""
+Analítica por cohortes del test personalizado.
+
+Las respuestas de un conjunto de resultados se cargan en arrays columnares de
+NumPy (resultado, sección, puntaje) y todos los cálculos se hacen sobre esos
+arrays: totales por sección con un único bincount, percentiles con
+np.percentile y distribuciones con digitize + bincount. No hay bucles de
+Python por respuesta ni por resultado. Las respuestas se leen de la base de
+datos por lotes y cada lote se copia en arrays reservados de antemano, así
+que nunca hay en memoria más de un lote como tuplas de Python.
+"""
+from itertools import islice
+
+import numpy as np
+
+from .models import PreguntaTestPersonalizado, RespuestaTestPersonalizado
+
+PERCENTILES = (25, 50, 75, 90)
+
+# Secciones del test; siempre tienen columna aunque ningún resultado las responda
+SECCIONES = ('A', 'B', 'C')
+
+# Los códigos de sección caben enteros en el array: tantos caracteres como admite el campo
+TIPO_SECCION = f"U{PreguntaTestPersonalizado._meta.get_field('seccion').max_length}"
+
+# Respuestas por lote al leerlas de la base de datos
+TAMANO_LOTE = 5000
+
+
+class Cohorte:
+    """
+    Totales por sección de un conjunto de resultados.
+
+    resultados: ids de resultado ordenados (una fila de `totales` por id).
+    secciones: códigos de sección ordenados (SECCIONES más cualquier otro observado).
+    totales: matriz int64 resultados x secciones.
+    """
+
+    def __init__(self, resultado_ids, secciones, puntajes):
+        resultado_ids = np.asarray(resultado_ids, dtype=np.int64)
+        puntajes = np.asarray(puntajes, dtype=np.int64)
+        self.resultados, fila = np.unique(resultado_ids, return_inverse=True)
+        secciones = np.asarray(secciones, dtype=TIPO_SECCION)
+        self.secciones = np.union1d(np.asarray(SECCIONES, dtype=TIPO_SECCION), secciones)
+        columna = np.searchsorted(self.secciones, secciones)
+
+        n, m = len(self.resultados), len(self.secciones)
+        celdas = np.bincount(fila * m + columna, weights=puntajes, minlength=n * m)
+        self.totales = celdas.astype(np.int64).reshape(n, m)
+
+    @classmethod
+    def desde_resultados(cls, resultados, tamano_lote=TAMANO_LOTE):
+        """Carga las respuestas de `resultados` (queryset o lista de ids) por lotes de `tamano_lote`"""
+        filas = RespuestaTestPersonalizado.objects.filter(resultado__in=resultados).values_list(
+            'resultado_id', 'pregunta__seccion', 'opcion_elegida__puntaje'
+        )
+        capacidad = filas.count()
+        columnas = [
+            np.empty(capacidad, dtype=np.int64),
+            np.empty(capacidad, dtype=TIPO_SECCION),
+            np.empty(capacidad, dtype=np.int64),
+        ]
+        leidas = 0
+        iterador = filas.iterator(chunk_size=tamano_lote)
+        while lote := list(islice(iterador, tamano_lote)):
+            fin = leidas + len(lote)
+            if fin > capacidad:
+                # Se guardaron respuestas entre el COUNT y la lectura
+                capacidad = max(fin, 2 * capacidad)
+                columnas = [np.resize(columna, capacidad) for columna in columnas]
+            for columna, valores in zip(columnas, zip(*lote)):
+                columna[leidas:fin] = valores
+            leidas = fin
+        return cls(*(columna[:leidas] for columna in columnas))
+
+    def __len__(self):
+        return len(self.resultados)
+
+    @property
+    def total(self):
+        """Puntaje total de cada resultado, alineado con `resultados`"""
+        return self.totales.sum(axis=1)
+
+    def resumen(self, resultado_id):
+        """
+        {sección: puntaje} de un resultado, como calcular_resumen_por_seccion.
+
+        Un resultado sin respuestas en la cohorte tiene todas sus secciones a cero.
+        """
+        fila = np.searchsorted(self.resultados, resultado_id)
+        if fila >= len(self.resultados) or self.resultados[fila] != resultado_id:
+            return dict.fromkeys(self.secciones.tolist(), 0)
+        return dict(zip(self.secciones.tolist(), self.totales[fila].tolist()))
+
+    def percentiles(self, q=PERCENTILES):
+        """{sección o 'total': {percentil: valor}} de la cohorte"""
+        if not len(self):
+            return {}
+        columnas = np.column_stack([self.totales, self.total])
+        valores = np.percentile(columnas, q, axis=0)
+        nombres = self.secciones.tolist() + ['total']
+        return {
+            nombre: dict(zip(q, valores[:, i].tolist()))
+            for i, nombre in enumerate(nombres)
+        }
+
+    def distribucion(self, limites):
+        """
+        Cuántos resultados caen en cada tramo de puntaje, por sección.
+
+        `limites` son los bordes crecientes de los tramos; devuelve una matriz
+        secciones x (len(limites) + 1): el primer tramo es < limites[0] y el
+        último >= limites[-1].
+        """
+        limites = np.asarray(limites)
+        tramos = len(limites) + 1
+        indices = np.digitize(self.totales, limites, right=False)
+        columna = np.arange(len(self.secciones))
+        conteo = np.bincount((columna * tramos + indices).ravel(), minlength=len(self.secciones) * tramos)
+        return conteo.reshape(len(self.secciones), tramos)
@@ -5,6 +5,11 @@ class MiappConfig(AppConfig):
     name = 'miapp'
 
     def ready(self):
+        # Registra las señales de búsqueda, estadísticas, ranking, tiempo real, portadas y caché de referencia
+        from miapp import busqueda, cache_referencia, estadisticas, imagenes, ranking, tendencias, tiempo_real  # noqa: F401
+        from miapp import almacenamiento
+        almacenamiento.conectar()
+
         from django.contrib.auth.models import User
         from miapp.models import UserProfile
         from django.db.utils import OperationalError
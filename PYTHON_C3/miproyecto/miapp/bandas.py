@@ -0,0 +1,127 @@
+"""
+Bandas de diagnóstico versionadas (VersionBandas / BandaDiagnostico).
+
+Cada versión se compila en una TablaBandas: los puntajes máximos ordenados
+en una lista y la búsqueda de un puntaje es un bisect sobre ella. La versión
+vigente (la más reciente) se guarda en la caché de referencia, así que
+clasificar un resultado no consulta la base de datos. de_resultado() da la
+tabla con la que se clasificó un resultado ya guardado (su version_bandas),
+para que los agregados resten lo mismo que sumaron aunque haya otra vigente.
+
+reclasificar() vuelve a calcular el diagnóstico de los resultados históricos
+con una versión dada, en UPDATEs por rangos de id con un CASE generado desde
+la misma tabla, y anota en cada resultado la versión usada.
+"""
+from bisect import bisect_left
+
+from django.db.models import Case, Max, Min, Value, When
+
+from . import cache_referencia
+from .models import ResultadoTestPersonalizado, VersionBandas
+
+TAMANO_LOTE_RECLASIFICACION = 50000
+
+
+class BandasInvalidas(ValueError):
+    pass
+
+
+class TablaBandas:
+    """Bandas de una versión precompiladas para búsqueda por bisect"""
+
+    def __init__(self, version_id, bandas):
+        """`bandas`: iterable de (puntaje_maximo o None, codigo, diagnostico)"""
+        acotadas = sorted((b for b in bandas if b[0] is not None), key=lambda b: b[0])
+        abiertas = [b for b in bandas if b[0] is None]
+        if len(abiertas) != 1:
+            raise BandasInvalidas('Debe haber exactamente una banda sin puntaje máximo')
+        self.version_id = version_id
+        self.maximos = [maximo for maximo, _, _ in acotadas]
+        if len(set(self.maximos)) != len(self.maximos):
+            raise BandasInvalidas('Hay bandas con el mismo puntaje máximo')
+        ordenadas = acotadas + abiertas
+        self.codigos = tuple(codigo for _, codigo, _ in ordenadas)
+        self.diagnosticos = tuple(diagnostico for _, _, diagnostico in ordenadas)
+
+    @classmethod
+    def de_version(cls, version):
+        return cls(version.id, [
+            (banda.puntaje_maximo, banda.codigo, banda.diagnostico) for banda in version.bandas.all()
+        ])
+
+    def indice(self, puntaje_total):
+        # Primera banda cuyo máximo es >= puntaje; si no hay ninguna, la banda abierta (la última)
+        return bisect_left(self.maximos, puntaje_total)
+
+    def banda(self, puntaje_total):
+        return self.codigos[self.indice(puntaje_total)]
+
+    def diagnostico(self, puntaje_total):
+        return self.diagnosticos[self.indice(puntaje_total)]
+
+    def expresion_sql(self):
+        """CASE equivalente a la búsqueda, para clasificar en la base de datos"""
+        return Case(
+            *[When(puntaje_total__lte=maximo, then=Value(texto)) for maximo, texto in zip(self.maximos, self.diagnosticos)],
+            default=Value(self.diagnosticos[-1]),
+        )
+
+
+def tabla(version_id):
+    version = VersionBandas.objects.prefetch_related('bandas').get(pk=version_id)
+    return TablaBandas.de_version(version)
+
+
+def vigente():
+    """Tabla de la versión más reciente, memorizada en la caché de referencia"""
+    def cargar():
+        # Una versión recién creada en el admin todavía sin bandas no se considera vigente
+        version = VersionBandas.objects.filter(bandas__isnull=False).distinct().prefetch_related(
+            'bandas'
+        ).order_by('-id').first()
+        if version is None:
+            raise BandasInvalidas('No hay bandas de diagnóstico definidas')
+        return TablaBandas.de_version(version)
+    return cache_referencia.obtener('bandas_diagnostico', cargar)
+
+
+def por_version():
+    """{version_id: TablaBandas} de todas las versiones válidas con bandas, en la caché de referencia"""
+    def cargar():
+        tablas = {}
+        for version in VersionBandas.objects.filter(bandas__isnull=False).distinct().prefetch_related('bandas'):
+            try:
+                tablas[version.id] = TablaBandas.de_version(version)
+            except BandasInvalidas:
+                # Versión a medio editar en el admin: ningún resultado puede usarla todavía
+                pass
+        return tablas
+    return cache_referencia.obtener('bandas_por_version', cargar)
+
+
+def de_resultado(version_id):
+    """Tabla con la que se clasificó un resultado (su version_bandas); la vigente si no la registró"""
+    return por_version().get(version_id) or vigente()
+
+
+def reclasificar(tabla_bandas=None, tamano_lote=TAMANO_LOTE_RECLASIFICACION, progreso=None):
+    """
+    Reescribe diagnostico y version_bandas de los resultados que no usan ya `tabla_bandas`.
+
+    Cada lote es un único UPDATE sobre un rango de ids, así que se puede
+    interrumpir y relanzar: los resultados ya reclasificados se saltan.
+    """
+    tabla_bandas = tabla_bandas or vigente()
+    pendientes = ResultadoTestPersonalizado.objects.exclude(version_bandas=tabla_bandas.version_id)
+    rango = pendientes.aggregate(minimo=Min('id'), maximo=Max('id'))
+    if rango['minimo'] is None:
+        return 0
+    expresion = tabla_bandas.expresion_sql()
+    total = 0
+    for inicio in range(rango['minimo'], rango['maximo'] + 1, tamano_lote):
+        total += pendientes.filter(pk__gte=inicio, pk__lt=inicio + tamano_lote).update(
+            diagnostico=expresion, version_bandas=tabla_bandas.version_id
+        )
+        if progreso:
+            progreso(total)
+    return total
@@ -0,0 +1,73 @@
+"""
+Borradores del test personalizado guardados en la sesión del paciente.
+
+Mientras el paciente responde, la página envía al endpoint de autoguardado
+solo los cambios desde el último guardado ({pregunta_id: opcion_id o null}),
+agrupados por el cliente cada pocos segundos. El borrador queda en la sesión
+(backend de sesiones de Django), ligado a la huella del cuestionario con la
+que se empezó: si el cuestionario cambia, el borrador se descarta.
+
+Al terminar, el borrador se corrige con evaluacion.registrar_envio como un
+envío normal, sin que el navegador tenga que volver a mandar todas las
+respuestas.
+"""
+from django.utils import timezone
+
+from . import cuestionario as cuestionarios
+from .evaluacion import CAMPO_VERSION, PREFIJO_PREGUNTA, EnvioInvalido
+
+CLAVE_SESION = 'borrador_test'
+
+
+def leer(request):
+    """Borrador vigente de la sesión: {'version', 'respuestas': {str(pregunta_id): opcion_id}}"""
+    huella = cuestionarios.actual().huella
+    borrador = request.session.get(CLAVE_SESION)
+    if not borrador or borrador.get('version') != huella:
+        return {'version': huella, 'respuestas': {}}
+    return borrador
+
+
+def aplicar(request, version, cambios):
+    """Valida y aplica `cambios` al borrador de la sesión. Devuelve las respuestas guardadas"""
+    cuestionario = cuestionarios.actual()
+    if version != cuestionario.huella:
+        descartar(request)
+        raise EnvioInvalido('El test se actualizó mientras respondías. Recarga la página para continuar.')
+    if not isinstance(cambios, dict):
+        raise EnvioInvalido('Formato de respuestas inválido.')
+
+    respuestas = dict(leer(request)['respuestas'])
+    for pregunta_id, opcion_id in cambios.items():
+        try:
+            pregunta_id = int(pregunta_id)
+            opcion_id = None if opcion_id is None else int(opcion_id)
+        except (TypeError, ValueError):
+            raise EnvioInvalido('Formato de respuestas inválido.')
+        if opcion_id is None:
+            respuestas.pop(str(pregunta_id), None)
+            continue
+        opcion = cuestionario.opciones.get(opcion_id)
+        if opcion is None or opcion.pregunta_id != pregunta_id:
+            raise EnvioInvalido('Alguna de las opciones elegidas no corresponde a su pregunta.')
+        respuestas[str(pregunta_id)] = opcion_id
+
+    if cambios:
+        request.session[CLAVE_SESION] = {
+            'version': cuestionario.huella,
+            'respuestas': respuestas,
+            'actualizado_en': timezone.now().isoformat(),
+        }
+    return respuestas
+
+
+def como_envio(request):
+    """El borrador en el formato del POST del test (pregunta_<id> y version_cuestionario)"""
+    borrador = leer(request)
+    datos = {f'{PREFIJO_PREGUNTA}{pregunta_id}': opcion_id for pregunta_id, opcion_id in borrador['respuestas'].items()}
+    datos[CAMPO_VERSION] = borrador['version']
+    return datos
+
+
+def descartar(request):
+    request.session.pop(CLAVE_SESION, None)
@@ -0,0 +1,181 @@
+"""
+Búsqueda de texto completo en el foro (hilos y respuestas).
+
+En PostgreSQL se usa la columna `busqueda` (tsvector con índice GIN) de
+HiloForo y RespuestaForo. En SQLite, que es lo que usan las instalaciones
+de desarrollo y pruebas, se usa la tabla virtual FTS5 `miapp_busqueda_fts`.
+Ambos índices se actualizan de forma incremental al guardar o borrar.
+"""
+from django.contrib.postgres.search import SearchQuery, SearchRank, SearchVector
+from django.db import connection
+from django.db.models import Case, Exists, F, FloatField, OuterRef, Q, Subquery, Value, When
+from django.db.models.functions import Coalesce
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .models import HiloForo, RespuestaForo
+
+CONFIG_BUSQUEDA = 'spanish'
+TABLA_FTS = 'miapp_busqueda_fts'
+
+# Tope de hilos que devuelve el respaldo FTS5 de SQLite (solo desarrollo)
+MAX_RESULTADOS_SQLITE = 500
+
+
+def _es_postgres():
+    return connection.vendor == 'postgresql'
+
+
+def vector_hilo():
+    return (
+        SearchVector('titulo', weight='A', config=CONFIG_BUSQUEDA)
+        + SearchVector('contenido', weight='B', config=CONFIG_BUSQUEDA)
+    )
+
+
+def vector_respuesta():
+    return SearchVector('contenido', weight='B', config=CONFIG_BUSQUEDA)
+
+
+# ==================== ÍNDICE INCREMENTAL ====================
+
+def _fts_borrar(cursor, tipo, objeto_id):
+    cursor.execute(f'DELETE FROM {TABLA_FTS} WHERE tipo = %s AND objeto_id = %s', [tipo, objeto_id])
+
+
+def _fts_insertar(cursor, tipo, objeto_id, hilo_id, titulo, contenido):
+    cursor.execute(
+        f'INSERT INTO {TABLA_FTS} (titulo, contenido, tipo, objeto_id, hilo_id) VALUES (%s, %s, %s, %s, %s)',
+        [titulo, contenido, tipo, objeto_id, hilo_id]
+    )
+
+
+@receiver(post_save, sender=HiloForo)
+def indexar_hilo(sender, instance, update_fields=None, **kwargs):
+    # Los UPDATE de contadores (visitas, votos...) no pasan por save(); aquí solo llegan ediciones reales
+    if update_fields and not {'titulo', 'contenido'} & set(update_fields):
+        return
+    if _es_postgres():
+        HiloForo.objects.filter(pk=instance.pk).update(busqueda=vector_hilo())
+    elif connection.vendor == 'sqlite':
+        with connection.cursor() as cursor:
+            _fts_borrar(cursor, 'hilo', instance.pk)
+            _fts_insertar(cursor, 'hilo', instance.pk, instance.pk, instance.titulo, instance.contenido)
+
+
+@receiver(post_save, sender=RespuestaForo)
+def indexar_respuesta(sender, instance, update_fields=None, **kwargs):
+    if update_fields and 'contenido' not in update_fields:
+        return
+    if _es_postgres():
+        RespuestaForo.objects.filter(pk=instance.pk).update(busqueda=vector_respuesta())
+    elif connection.vendor == 'sqlite':
+        with connection.cursor() as cursor:
+            _fts_borrar(cursor, 'respuesta', instance.pk)
+            _fts_insertar(cursor, 'respuesta', instance.pk, instance.hilo_id, '', instance.contenido)
+
+
+@receiver(post_delete, sender=HiloForo)
+def desindexar_hilo(sender, instance, **kwargs):
+    if connection.vendor == 'sqlite':
+        with connection.cursor() as cursor:
+            _fts_borrar(cursor, 'hilo', instance.pk)
+
+
+@receiver(post_delete, sender=RespuestaForo)
+def desindexar_respuesta(sender, instance, **kwargs):
+    if connection.vendor == 'sqlite':
+        with connection.cursor() as cursor:
+            _fts_borrar(cursor, 'respuesta', instance.pk)
+
+
+def reconstruir_indice():
+    """Regenera el índice de búsqueda completo; devuelve (hilos, respuestas) indexados"""
+    if _es_postgres():
+        return (
+            HiloForo.objects.update(busqueda=vector_hilo()),
+            RespuestaForo.objects.update(busqueda=vector_respuesta()),
+        )
+    with connection.cursor() as cursor:
+        cursor.execute(f'DELETE FROM {TABLA_FTS}')
+        cursor.execute(
+            f"INSERT INTO {TABLA_FTS} (titulo, contenido, tipo, objeto_id, hilo_id) "
+            f"SELECT titulo, contenido, 'hilo', id, id FROM {HiloForo._meta.db_table}"
+        )
+        hilos = cursor.rowcount
+        cursor.execute(
+            f"INSERT INTO {TABLA_FTS} (titulo, contenido, tipo, objeto_id, hilo_id) "
+            f"SELECT '', contenido, 'respuesta', id, hilo_id FROM {RespuestaForo._meta.db_table}"
+        )
+        return hilos, cursor.rowcount
+
+
+# ==================== CONSULTA ====================
+
+def _consulta_fts5(texto):
+    """Convierte el texto del usuario en una consulta FTS5 segura (todas las palabras, entre comillas)"""
+    palabras = [palabra.replace('"', '""') for palabra in texto.split()]
+    return ' '.join(f'"{palabra}"' for palabra in palabras)
+
+
+def _filtros_hilos(hilos, categoria_id=None, estado=None, autor=None):
+    if categoria_id:
+        hilos = hilos.filter(categoria_id=categoria_id)
+    if estado:
+        hilos = hilos.filter(estado=estado)
+    if autor:
+        # Los hilos anónimos nunca se pueden encontrar por su autor
+        hilos = hilos.filter(creado_por__username=autor, es_anonimo=False)
+    return hilos
+
+
+def _buscar_postgres(texto, hilos):
+    consulta = SearchQuery(texto, config=CONFIG_BUSQUEDA, search_type='websearch')
+    respuestas = RespuestaForo.objects.filter(hilo=OuterRef('pk'), busqueda=consulta)
+    rango_respuestas = respuestas.annotate(
+        rango=SearchRank(F('busqueda'), consulta)
+    ).order_by('-rango').values('rango')[:1]
+    return hilos.filter(
+        Q(busqueda=consulta) | Exists(respuestas)
+    ).annotate(
+        # Coincidir en el propio hilo pesa el doble que coincidir en una de sus respuestas
+        rango=Coalesce(SearchRank(F('busqueda'), consulta), 0.0)
+        + Coalesce(Subquery(rango_respuestas, output_field=FloatField()), 0.0) * 0.5
+    ).order_by('-rango', '-id')
+
+
+def _buscar_sqlite(texto, hilos):
+    consulta = _consulta_fts5(texto)
+    if not consulta:
+        return hilos.none()
+    # bm25 (columna rank) es menor cuanto más relevante; el hilo toma su mejor coincidencia.
+    # El filtro sobre `hilos` se aplica dentro de la consulta para que el tope no recorte resultados válidos
+    sql_hilos, params_hilos = hilos.values('id').query.sql_with_params()
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'SELECT f.hilo_id, MIN(f.rank) FROM ('
+            f'  SELECT hilo_id, rank FROM {TABLA_FTS} WHERE {TABLA_FTS} MATCH %s'
+            f') f WHERE f.hilo_id IN ({sql_hilos}) '
+            f'GROUP BY f.hilo_id ORDER BY MIN(f.rank), f.hilo_id DESC LIMIT %s',
+            [consulta, *params_hilos, MAX_RESULTADOS_SQLITE]
+        )
+        rangos = cursor.fetchall()
+    if not rangos:
+        return hilos.none()
+    return hilos.filter(pk__in=[hilo_id for hilo_id, _ in rangos]).annotate(
+        rango=Case(
+            *[When(pk=hilo_id, then=Value(-rango)) for hilo_id, rango in rangos],
+            output_field=FloatField(),
+        )
+    ).order_by('-rango', '-id')
+
+
+def buscar_hilos(texto, categoria_id=None, estado=None, autor=None):
+    """Queryset de hilos que coinciden con `texto` (en el hilo o en sus respuestas), ordenado por relevancia"""
+    hilos = _filtros_hilos(HiloForo.objects.all(), categoria_id, estado, autor)
+    texto = (texto or '').strip()
+    if not texto:
+        return hilos.none()
+    if _es_postgres():
+        return _buscar_postgres(texto, hilos)
+    return _buscar_sqlite(texto, hilos)
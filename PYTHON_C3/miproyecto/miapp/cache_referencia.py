@@ -0,0 +1,134 @@
+"""
+Caché de datos de referencia (categorías, cuestionarios de los tests, bandas, parámetros,
+recomendaciones de recursos).
+
+Son tablas que casi nunca cambian pero se leen en casi todas las peticiones.
+Cada conjunto se guarda en un memo por proceso junto con su versión; la
+versión vigente vive en la caché compartida 'referencia' (settings.CACHES,
+una tabla de la base de datos común a todos los workers), así que cualquier
+escritura la cambia y todos los procesos recargan sin necesidad de reiniciar.
+Cada proceso vuelve a leer las versiones, todas en una consulta, como mucho
+cada INTERVALO_VERSIONES segundos: las lecturas entre medias no tocan la base
+de datos, y el proceso que escribe ve su propio cambio al instante.
+"""
+import threading
+import time
+import uuid
+
+from django.core.cache import caches
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+
+from .models import (
+    BandaDiagnostico, CategoriaForo, CategoriaRecurso, OpcionRespuesta, OpcionRespuestaPersonalizado,
+    ParametrosHot, PreguntaTest, PreguntaTestPersonalizado, Recurso, TestPsicologico, VersionBandas
+)
+
+PREFIJO_VERSION = 'referencia:version:'
+
+# Segundos que un proceso puede tardar en enterarse de una invalidación hecha en otro
+INTERVALO_VERSIONES = 2
+
+_lock = threading.Lock()
+_memo = {}
+_versiones = {}
+_comprobado_en = None
+
+
+def _nueva_version():
+    # Un valor que nunca se repite: ningún memo antiguo puede coincidir con él por casualidad
+    return uuid.uuid4().hex
+
+
+def _compartida():
+    return caches['referencia']
+
+
+def _refrescar_versiones():
+    """Relee de una vez las versiones compartidas de los conjuntos que conoce este proceso"""
+    global _comprobado_en
+    leidas = _compartida().get_many([PREFIJO_VERSION + nombre for nombre in _versiones])
+    with _lock:
+        for nombre in list(_versiones):
+            version = leidas.get(PREFIJO_VERSION + nombre)
+            if version is None:
+                # La clave se perdió (caché vaciada o desalojo): se creará otra en la próxima lectura
+                del _versiones[nombre]
+            else:
+                _versiones[nombre] = version
+        _comprobado_en = time.monotonic()
+
+
+def _version(nombre):
+    if _comprobado_en is None or time.monotonic() - _comprobado_en >= INTERVALO_VERSIONES:
+        _refrescar_versiones()
+    version = _versiones.get(nombre)
+    if version is None:
+        compartida = _compartida()
+        compartida.add(PREFIJO_VERSION + nombre, _nueva_version(), timeout=None)
+        version = compartida.get(PREFIJO_VERSION + nombre)
+        with _lock:
+            _versiones[nombre] = version
+    return version
+
+
+def invalidar(nombre):
+    """Cambia la versión compartida; todos los procesos recargarán `nombre`"""
+    # set() de un valor nuevo y no incr(): en la caché de base de datos incr() es leer y escribir,
+    # y dos invalidaciones simultáneas podrían dejar la misma versión que ya leyó otro proceso
+    version = _nueva_version()
+    _compartida().set(PREFIJO_VERSION + nombre, version, timeout=None)
+    with _lock:
+        _versiones[nombre] = version
+
+
+def obtener(nombre, cargar):
+    """Devuelve los datos memorizados de `nombre`, recargándolos con `cargar()` si cambió la versión"""
+    version = _version(nombre)
+    memo = _memo.get(nombre)
+    if memo is not None and memo[0] == version:
+        return memo[1]
+    datos = cargar()
+    with _lock:
+        _memo[nombre] = (version, datos)
+    return datos
+
+
+# ==================== CONJUNTOS DE REFERENCIA ====================
+
+def categorias_foro():
+    """Categorías activas del foro, en orden de presentación"""
+    return obtener('categorias_foro', lambda: tuple(
+        CategoriaForo.objects.filter(es_activa=True).order_by('orden')
+    ))
+
+
+def categorias_recurso():
+    return obtener('categorias_recurso', lambda: tuple(CategoriaRecurso.objects.all()))
+
+
+# Modelo -> conjuntos que dependen de él
+_DEPENDENCIAS = {
+    CategoriaForo: ['categorias_foro'],
+    CategoriaRecurso: ['categorias_recurso', 'recomendaciones'],
+    Recurso: ['recomendaciones', 'facetas_recursos'],
+    PreguntaTestPersonalizado: ['cuestionario'],
+    OpcionRespuestaPersonalizado: ['cuestionario'],
+    ParametrosHot: ['parametros_hot'],
+    VersionBandas: ['bandas_diagnostico', 'bandas_por_version', 'recomendaciones'],
+    BandaDiagnostico: ['bandas_diagnostico', 'bandas_por_version', 'recomendaciones'],
+    TestPsicologico: ['tests_psicologicos'],
+    PreguntaTest: ['tests_psicologicos'],
+    OpcionRespuesta: ['tests_psicologicos'],
+}
+
+
+def _invalidar_dependientes(sender, **kwargs):
+    # Tras el commit: si se invalidara antes, otro worker podría recargar los datos viejos con la versión nueva
+    for nombre in _DEPENDENCIAS[sender]:
+        transaction.on_commit(lambda nombre=nombre: invalidar(nombre))
+
+
+for _modelo in _DEPENDENCIAS:
+    post_save.connect(_invalidar_dependientes, sender=_modelo, dispatch_uid=f'referencia_save_{_modelo.__name__}')
+    post_delete.connect(_invalidar_dependientes, sender=_modelo, dispatch_uid=f'referencia_delete_{_modelo.__name__}')
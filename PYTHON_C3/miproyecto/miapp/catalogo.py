@@ -0,0 +1,109 @@
+"""
+Catálogo de recursos públicos: filtros, orden, páginas por cursor y facetas.
+
+Los filtros son el tipo de recurso y la categoría (parámetros GET 'tipo' y
+'categoria'); 'orden' elige entre ORDENES y 'cursor' continúa la página
+anterior (paginacion.py), así que no hay COUNT ni OFFSET por página.
+
+Las facetas (cuántos recursos hay por categoría y por tipo) salen de una
+sola consulta agrupada por (categoría, tipo), guardada en la caché de
+referencia e invalidada al guardar o borrar recursos o categorías. Cada
+faceta se cuenta aplicando el filtro de la otra dimensión, pero no el suyo:
+con ?tipo=video la lista de categorías dice cuántos videos hay en cada una,
+y la de tipos sigue mostrando todos los tipos para poder cambiar de filtro.
+"""
+from collections import Counter, namedtuple
+
+from django.db.models import Count
+
+from . import cache_referencia
+from .models import Recurso
+from .paginacion import paginar_keyset
+
+RECURSOS_POR_PAGINA = 12
+
+# Orden de cada modo; el 'id' final desempata para que el cursor sea estable.
+# Cada uno tiene su índice compuesto en Recurso.Meta.indexes
+ORDENES = {
+    'recientes': ['-creado_en', '-id'],
+    'antiguos': ['creado_en', 'id'],
+    'titulo': ['titulo', 'id'],
+}
+ORDEN_POR_DEFECTO = 'recientes'
+
+TIPOS = dict(Recurso.TIPO_RECURSO_CHOICES)
+
+Filtros = namedtuple('Filtros', 'tipo categoria orden cursor')
+Faceta = namedtuple('Faceta', 'valor nombre total')
+
+
+class Pagina(namedtuple('Pagina', 'recursos siguiente_cursor filtros categorias tipos total')):
+    """Una página del catálogo con las facetas de categoría y tipo (listas de Faceta) y el total filtrado"""
+
+    @property
+    def es_primera(self):
+        return not self.filtros.cursor
+
+
+def leer_filtros(parametros):
+    """Filtros válidos a partir de request.GET; los valores desconocidos se ignoran"""
+    tipo = parametros.get('tipo', '')
+    if tipo not in TIPOS:
+        tipo = ''
+    try:
+        categoria = int(parametros.get('categoria', ''))
+    except ValueError:
+        categoria = None
+    orden = parametros.get('orden', ORDEN_POR_DEFECTO)
+    if orden not in ORDENES:
+        orden = ORDEN_POR_DEFECTO
+    return Filtros(tipo, categoria, orden, parametros.get('cursor') or None)
+
+
+def recursos_publicos(filtros):
+    recursos = Recurso.objects.filter(es_publico=True).select_related('categoria')
+    if filtros.tipo:
+        recursos = recursos.filter(tipo_recurso=filtros.tipo)
+    if filtros.categoria is not None:
+        recursos = recursos.filter(categoria_id=filtros.categoria)
+    return recursos
+
+
+def conteos():
+    """Counter {(categoria_id, tipo_recurso): recursos públicos}, de una consulta agrupada en caché"""
+    return cache_referencia.obtener('facetas_recursos', lambda: Counter({
+        (fila['categoria_id'], fila['tipo_recurso']): fila['total']
+        for fila in Recurso.objects.filter(es_publico=True)
+        .values('categoria_id', 'tipo_recurso').annotate(total=Count('id')).order_by()
+    }))
+
+
+def facetas(filtros):
+    """(categorias, tipos, total): listas de Faceta y el número de recursos con ambos filtros aplicados"""
+    por_categoria = Counter()
+    por_tipo = Counter()
+    total = 0
+    for (categoria_id, tipo), cantidad in conteos().items():
+        if not filtros.tipo or tipo == filtros.tipo:
+            por_categoria[categoria_id] += cantidad
+        if filtros.categoria is None or categoria_id == filtros.categoria:
+            por_tipo[tipo] += cantidad
+            if not filtros.tipo or tipo == filtros.tipo:
+                total += cantidad
+    categorias = [
+        Faceta(categoria.id, categoria.nombre, por_categoria[categoria.id])
+        for categoria in cache_referencia.categorias_recurso()
+    ]
+    tipos = [Faceta(valor, nombre, por_tipo[valor]) for valor, nombre in TIPOS.items()]
+    return categorias, tipos, total
+
+
+def pagina(parametros, tamano=None):
+    """Página del catálogo para los parámetros GET `parametros` (RECURSOS_POR_PAGINA recursos si no se indica)"""
+    filtros = leer_filtros(parametros)
+    recursos, siguiente_cursor = paginar_keyset(
+        recursos_publicos(filtros), ORDENES[filtros.orden], filtros.cursor,
+        tamano=tamano or RECURSOS_POR_PAGINA, modo=filtros.orden
+    )
+    categorias, tipos, total = facetas(filtros)
+    return Pagina(recursos, siguiente_cursor, filtros, categorias, tipos, total)
@@ -0,0 +1,122 @@
+"""
+Instantánea inmutable del cuestionario del test personalizado.
+
+Preguntas (agrupadas por sección y ordenadas por número) y opciones se
+compilan una vez en tuplas y se guardan en la caché de referencia, que se
+invalida al cambiar cualquier pregunta u opción. La página del test se
+renderiza y se corrige solo con la instantánea, sin consultas.
+
+Cada instantánea tiene una huella (sha256 de su contenido). Al registrar un
+resultado se guarda la VersionCuestionario correspondiente, con el contenido
+completo, de modo que el puntaje pueda reproducirse aunque el cuestionario
+cambie después.
+"""
+import hashlib
+import json
+import threading
+from collections import namedtuple
+
+from django.db import IntegrityError, transaction
+
+from . import cache_referencia
+from .models import PreguntaTestPersonalizado, VersionCuestionario
+
+Opcion = namedtuple('Opcion', 'id valor texto puntaje pregunta_id')
+Pregunta = namedtuple('Pregunta', 'id numero texto seccion posicion opciones')
+Seccion = namedtuple('Seccion', 'codigo preguntas')
+
+
+class Cuestionario(namedtuple('Cuestionario', 'huella secciones preguntas opciones contenido')):
+    """
+    secciones: tupla de Seccion en orden de presentación.
+    preguntas: tupla plana de Pregunta ordenada por número.
+    opciones: {opcion_id: Opcion} para validar y puntuar un envío.
+    contenido: forma serializable (JSON) de todo lo anterior.
+    """
+
+    @property
+    def total(self):
+        return len(self.preguntas)
+
+
+def compilar():
+    """Lee preguntas y opciones (dos consultas) y construye la instantánea"""
+    preguntas_db = PreguntaTestPersonalizado.objects.order_by('seccion', 'numero', 'id').prefetch_related(
+        'opcionrespuestapersonalizado_set'
+    )
+    contenido = [
+        {
+            'id': pregunta.id,
+            'numero': pregunta.numero,
+            'texto': pregunta.texto,
+            'seccion': pregunta.seccion,
+            'opciones': [
+                {'id': opcion.id, 'valor': opcion.valor, 'texto': opcion.texto, 'puntaje': opcion.puntaje}
+                for opcion in sorted(pregunta.opcionrespuestapersonalizado_set.all(), key=lambda o: o.id)
+            ],
+        }
+        for pregunta in preguntas_db
+    ]
+    return desde_contenido(contenido)
+
+
+def desde_contenido(contenido):
+    """Reconstruye una instantánea a partir de su forma JSON (p. ej. la guardada en VersionCuestionario)"""
+    serializado = json.dumps(contenido, sort_keys=True, ensure_ascii=False, separators=(',', ':'))
+    huella = hashlib.sha256(serializado.encode('utf-8')).hexdigest()
+
+    secciones = {}
+    opciones = {}
+    for posicion, datos in enumerate(contenido, start=1):
+        pregunta = Pregunta(
+            id=datos['id'],
+            numero=datos['numero'],
+            texto=datos['texto'],
+            seccion=datos['seccion'],
+            posicion=posicion,
+            opciones=tuple(
+                Opcion(o['id'], o['valor'], o['texto'], o['puntaje'], datos['id']) for o in datos['opciones']
+            ),
+        )
+        secciones.setdefault(pregunta.seccion, []).append(pregunta)
+        opciones.update((opcion.id, opcion) for opcion in pregunta.opciones)
+
+    secciones = tuple(Seccion(codigo, tuple(preguntas)) for codigo, preguntas in secciones.items())
+    return Cuestionario(
+        huella=huella,
+        secciones=secciones,
+        preguntas=tuple(pregunta for seccion in secciones for pregunta in seccion.preguntas),
+        opciones=opciones,
+        contenido=contenido,
+    )
+
+
+def actual():
+    """Instantánea vigente; sin acceso a la base de datos mientras la caché esté caliente"""
+    return cache_referencia.obtener('cuestionario', compilar)
+
+
+_lock = threading.Lock()
+_versiones = {}
+
+
+def registrar_version(cuestionario):
+    """Id de la VersionCuestionario de la instantánea, creándola la primera vez que se usa"""
+    version_id = _versiones.get(cuestionario.huella)
+    if version_id is not None:
+        return version_id
+    try:
+        with transaction.atomic():
+            version, _ = VersionCuestionario.objects.get_or_create(
+                huella=cuestionario.huella, defaults={'contenido': cuestionario.contenido}
+            )
+    except IntegrityError:
+        # Otro proceso la creó a la vez
+        version = VersionCuestionario.objects.get(huella=cuestionario.huella)
+
+    def recordar():
+        with _lock:
+            _versiones[cuestionario.huella] = version.id
+    # Solo se memoriza si la fila llega a confirmarse
+    transaction.on_commit(recordar)
+    return version.id
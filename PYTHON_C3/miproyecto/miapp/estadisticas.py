@@ -0,0 +1,211 @@
+"""
+Almacén de estadísticas materializadas (tabla Estadistica, una fila por métrica).
+
+Las señales de este módulo ajustan los contadores con UPDATE + F() en cada
+alta, baja o cambio de estado, de modo que los dashboards leen todas sus
+cifras con una sola consulta en lugar de hacer un COUNT por tabla. Las
+operaciones masivas (queryset.update/bulk_create) no disparan señales; el
+comando recontar_estadisticas corrige esa deriva con un recuento completo.
+"""
+from django.contrib.auth.models import User
+from django.db import transaction
+from django.db.models import F
+from django.db.models.signals import post_delete, post_init, post_save
+from django.dispatch import receiver
+
+from .models import Estadistica, FormularioContacto, HiloForo, Recurso, RespuestaForo
+
+# Métricas globales: clave -> función que la recalcula desde cero
+METRICAS_GLOBALES = {
+    'usuarios': lambda: User.objects.count(),
+    'recursos': lambda: Recurso.objects.count(),
+    'consultas': lambda: FormularioContacto.objects.count(),
+    'consultas_sin_responder': lambda: FormularioContacto.objects.filter(respondido=False).count(),
+    'hilos': lambda: HiloForo.objects.count(),
+    'hilos_abiertos': lambda: HiloForo.objects.filter(estado='abierto').count(),
+    'respuestas': lambda: RespuestaForo.objects.count(),
+}
+
+# Métricas por usuario: nombre -> función(usuario_id)
+METRICAS_USUARIO = {
+    'consultas': lambda uid: FormularioContacto.objects.filter(usuario_id=uid).count(),
+    'consultas_respondidas': lambda uid: FormularioContacto.objects.filter(usuario_id=uid, respondido=True).count(),
+    'hilos': lambda uid: HiloForo.objects.filter(creado_por_id=uid).count(),
+    'respuestas': lambda uid: RespuestaForo.objects.filter(creado_por_id=uid).count(),
+}
+
+
+def clave_usuario(usuario_id, nombre):
+    return f'usuario:{usuario_id}:{nombre}'
+
+
+def _recalcular(clave):
+    if clave in METRICAS_GLOBALES:
+        return METRICAS_GLOBALES[clave]()
+    _, usuario_id, nombre = clave.split(':', 2)
+    return METRICAS_USUARIO[nombre](int(usuario_id))
+
+
+def leer(claves):
+    """Devuelve {clave: valor} con una consulta; las métricas que aún no existen se calculan y guardan"""
+    valores = dict(Estadistica.objects.filter(clave__in=claves).values_list('clave', 'valor'))
+    faltantes = [clave for clave in claves if clave not in valores]
+    if faltantes:
+        # La fila se crea antes de contar: un incrementar() concurrente ya no se pierde por
+        # caer entre el recuento y el INSERT, y el bloqueo serializa los recuentos de la misma clave
+        Estadistica.objects.bulk_create(
+            [Estadistica(clave=clave, valor=0) for clave in faltantes], ignore_conflicts=True
+        )
+        for clave in faltantes:
+            with transaction.atomic():
+                Estadistica.objects.select_for_update().filter(clave=clave).first()
+                valores[clave] = _recalcular(clave)
+                Estadistica.objects.filter(clave=clave).update(valor=valores[clave])
+    return valores
+
+
+def leer_globales(*nombres):
+    return leer(list(nombres))
+
+
+def leer_de_usuario(usuario_id, *nombres):
+    valores = leer([clave_usuario(usuario_id, nombre) for nombre in nombres])
+    return {nombre: valores[clave_usuario(usuario_id, nombre)] for nombre in nombres}
+
+
+def incrementar(clave, delta=1):
+    """Ajusta un contador existente; si la fila no existe se calculará completa en la próxima lectura"""
+    if delta:
+        Estadistica.objects.filter(clave=clave).update(valor=F('valor') + delta)
+
+
+def recontar_todo():
+    """Recalcula todas las métricas materializadas (globales y las de usuario ya creadas)"""
+    claves = list(METRICAS_GLOBALES) + list(
+        Estadistica.objects.filter(clave__startswith='usuario:').values_list('clave', flat=True)
+    )
+    for clave in claves:
+        Estadistica.objects.update_or_create(clave=clave, defaults={'valor': _recalcular(clave)})
+    return len(claves)
+
+
+# ==================== SEÑALES ====================
+
+# Las transiciones de estado se detectan comparando con el valor que tenía la instancia al
+# cargarse (post_init) o en su último save(), sin volver a leer la fila antes de guardar
+
+def _recordar(instance, campo):
+    """Anota el valor guardado de `campo`; si la instancia es nueva o el campo está diferido no anota nada"""
+    if instance.pk is not None and campo in instance.__dict__:
+        setattr(instance, f'_{campo}_guardado', instance.__dict__[campo])
+
+
+def _transicion(instance, campo, created, update_fields):
+    """(anterior, actual) si el save() cambió `campo`; None si no cambió o no se sabe el valor anterior"""
+    atributo = f'_{campo}_guardado'
+    if update_fields is not None and campo not in update_fields:
+        return None
+    if created:
+        anterior = None
+    elif hasattr(instance, atributo):
+        anterior = getattr(instance, atributo)
+    else:
+        return None
+    actual = getattr(instance, campo)
+    setattr(instance, atributo, actual)
+    return None if anterior == actual else (anterior, actual)
+
+
+@receiver(post_save, sender=User)
+def contar_usuario(sender, instance, created, **kwargs):
+    if created:
+        incrementar('usuarios')
+
+
+@receiver(post_delete, sender=User)
+def descontar_usuario(sender, instance, **kwargs):
+    incrementar('usuarios', -1)
+    Estadistica.objects.filter(clave__startswith=clave_usuario(instance.pk, '')).delete()
+
+
+@receiver(post_save, sender=Recurso)
+def contar_recurso(sender, instance, created, **kwargs):
+    if created:
+        incrementar('recursos')
+
+
+@receiver(post_delete, sender=Recurso)
+def descontar_recurso(sender, instance, **kwargs):
+    incrementar('recursos', -1)
+
+
+@receiver(post_init, sender=FormularioContacto)
+def recordar_respondido(sender, instance, **kwargs):
+    _recordar(instance, 'respondido')
+
+
+@receiver(post_save, sender=FormularioContacto)
+def contar_consulta(sender, instance, created, update_fields=None, **kwargs):
+    transicion = _transicion(instance, 'respondido', created, update_fields)
+    if created:
+        incrementar('consultas')
+        incrementar(clave_usuario(instance.usuario_id, 'consultas'))
+        if instance.respondido:
+            incrementar(clave_usuario(instance.usuario_id, 'consultas_respondidas'))
+        else:
+            incrementar('consultas_sin_responder')
+        return
+    if transicion:
+        delta = 1 if instance.respondido else -1
+        incrementar('consultas_sin_responder', -delta)
+        incrementar(clave_usuario(instance.usuario_id, 'consultas_respondidas'), delta)
+
+
+@receiver(post_delete, sender=FormularioContacto)
+def descontar_consulta(sender, instance, **kwargs):
+    incrementar('consultas', -1)
+    incrementar(clave_usuario(instance.usuario_id, 'consultas'), -1)
+    if instance.respondido:
+        incrementar(clave_usuario(instance.usuario_id, 'consultas_respondidas'), -1)
+    else:
+        incrementar('consultas_sin_responder', -1)
+
+
+@receiver(post_init, sender=HiloForo)
+def recordar_estado_hilo(sender, instance, **kwargs):
+    _recordar(instance, 'estado')
+
+
+@receiver(post_save, sender=HiloForo)
+def contar_hilo(sender, instance, created, update_fields=None, **kwargs):
+    if created:
+        incrementar('hilos')
+        incrementar(clave_usuario(instance.creado_por_id, 'hilos'))
+    transicion = _transicion(instance, 'estado', created, update_fields)
+    if transicion:
+        anterior = transicion[0]
+        if anterior == 'abierto':
+            incrementar('hilos_abiertos', -1)
+        elif instance.estado == 'abierto':
+            incrementar('hilos_abiertos')
+
+
+@receiver(post_delete, sender=HiloForo)
+def descontar_hilo(sender, instance, **kwargs):
+    incrementar('hilos', -1)
+    incrementar(clave_usuario(instance.creado_por_id, 'hilos'), -1)
+    if instance.estado == 'abierto':
+        incrementar('hilos_abiertos', -1)
+
+
+@receiver(post_save, sender=RespuestaForo)
+def contar_respuesta(sender, instance, created, **kwargs):
+    if created:
+        incrementar('respuestas')
+        incrementar(clave_usuario(instance.creado_por_id, 'respuestas'))
+
+
+@receiver(post_delete, sender=RespuestaForo)
+def descontar_respuesta(sender, instance, **kwargs):
+    incrementar('respuestas', -1)
+    incrementar(clave_usuario(instance.creado_por_id, 'respuestas'), -1)
@@ -0,0 +1,97 @@
+"""
+Corrección de los envíos del test personalizado.
+
+Un envío se valida completo antes de escribir nada contra la instantánea
+del cuestionario (cuestionario.py): cada opción debe pertenecer a su
+pregunta y no puede faltar ninguna. Antes se aceptaban envíos parciales y
+las preguntas sin responder puntuaban 0; ahora se rechazan, igual que ya
+hacía el formulario (todas las preguntas son obligatorias). El puntaje se suma en memoria y las
+respuestas y el resultado, con la versión del cuestionario usada, se
+guardan en una sola transacción. El número de consultas no depende de la
+longitud del cuestionario.
+"""
+from django.db import IntegrityError, transaction
+
+from . import bandas
+from . import cuestionario as cuestionarios
+from .models import RespuestaTestPersonalizado, ResultadoTestPersonalizado
+
+PREFIJO_PREGUNTA = 'pregunta_'
+CAMPO_VERSION = 'version_cuestionario'
+
+
+class EnvioInvalido(ValueError):
+    pass
+
+
+def banda_diagnostico(puntaje_total):
+    """Código de la banda de diagnóstico vigente ('adecuado', 'leve', ...) de un puntaje"""
+    return bandas.vigente().banda(puntaje_total)
+
+
+def calcular_diagnostico(puntaje_total):
+    """Función para calcular el diagnóstico basado en el puntaje"""
+    return bandas.vigente().diagnostico(puntaje_total)
+
+
+def leer_envio(datos):
+    """Extrae {pregunta_id: opcion_id} de los campos pregunta_<id> del POST"""
+    elegidas = {}
+    for clave, valor in datos.items():
+        if not clave.startswith(PREFIJO_PREGUNTA):
+            continue
+        try:
+            elegidas[int(clave[len(PREFIJO_PREGUNTA):])] = int(valor)
+        except (TypeError, ValueError):
+            raise EnvioInvalido('Hay respuestas con un formato no válido.')
+    return elegidas
+
+
+def validar_envio(elegidas, cuestionario):
+    """Devuelve {pregunta_id: Opcion} tras comprobar que el envío está completo y es coherente"""
+    preguntas = {pregunta.id for pregunta in cuestionario.preguntas}
+    faltantes = preguntas - elegidas.keys()
+    if faltantes:
+        raise EnvioInvalido(f'Quedan {len(faltantes)} pregunta(s) sin responder.')
+    if elegidas.keys() - preguntas:
+        raise EnvioInvalido('El envío incluye preguntas que no pertenecen al test.')
+
+    validas = {}
+    for pregunta_id, opcion_id in elegidas.items():
+        opcion = cuestionario.opciones.get(opcion_id)
+        if opcion is None or opcion.pregunta_id != pregunta_id:
+            raise EnvioInvalido('Alguna de las opciones elegidas no corresponde a su pregunta.')
+        validas[pregunta_id] = opcion
+    return validas
+
+
+def registrar_envio(paciente, datos):
+    """Valida, puntúa y guarda un envío completo. Devuelve el ResultadoTestPersonalizado creado"""
+    cuestionario = cuestionarios.actual()
+    huella = datos.get(CAMPO_VERSION)
+    if huella and huella != cuestionario.huella:
+        raise EnvioInvalido('El test se actualizó mientras respondías. Revisa tus respuestas y envíalo de nuevo.')
+    opciones = validar_envio(leer_envio(datos), cuestionario)
+    puntaje_total = sum(opcion.puntaje for opcion in opciones.values())
+    version_id = cuestionarios.registrar_version(cuestionario)
+    tabla_bandas = bandas.vigente()
+
+    try:
+        with transaction.atomic():
+            resultado = ResultadoTestPersonalizado.objects.create(
+                paciente=paciente,
+                version_cuestionario_id=version_id,
+                version_bandas_id=tabla_bandas.version_id,
+                puntaje_total=puntaje_total,
+                diagnostico=tabla_bandas.diagnostico(puntaje_total),
+            )
+            RespuestaTestPersonalizado.objects.bulk_create([
+                RespuestaTestPersonalizado(
+                    paciente=paciente, resultado=resultado, pregunta_id=pregunta_id, opcion_elegida_id=opcion.id
+                )
+                for pregunta_id, opcion in opciones.items()
+            ])
+    except IntegrityError:
+        # Se borró una pregunta u opción después de compilar la instantánea
+        raise EnvioInvalido('El test se actualizó mientras respondías. Revisa tus respuestas y envíalo de nuevo.')
+    return resultado
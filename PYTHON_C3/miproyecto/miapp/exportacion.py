@@ -0,0 +1,80 @@
+"""
+Exportación de resultados del test con sus respuestas (CSV y JSON Lines).
+
+El CSV devuelve su cabecera antes de lanzar la consulta, para que los
+primeros bytes salgan de inmediato. Ambos formatos leen una fila por respuesta
+(LEFT JOIN resultado-respuestas) con .iterator(chunk_size=...), que usa un
+cursor de servidor en PostgreSQL. Nada se acumula en memoria salvo las
+respuestas del resultado en curso, así que el consumo no depende del tamaño
+de la exportación.
+"""
+import csv
+import json
+from itertools import groupby
+
+from django.core.serializers.json import DjangoJSONEncoder
+
+TAMANO_LOTE_EXPORTACION = 2000
+
+COLUMNAS_RESULTADO = ('id', 'paciente__username', 'fecha_test', 'puntaje_total', 'diagnostico', 'version_cuestionario__huella')
+COLUMNAS_RESPUESTA = (
+    'respuestas__pregunta__numero', 'respuestas__pregunta__seccion', 'respuestas__pregunta__texto',
+    'respuestas__opcion_elegida__texto', 'respuestas__opcion_elegida__puntaje',
+)
+
+CABECERA_CSV = (
+    'resultado_id', 'paciente', 'fecha_test', 'puntaje_total', 'diagnostico', 'version_cuestionario',
+    'pregunta_numero', 'seccion', 'pregunta', 'respuesta', 'puntaje_respuesta',
+)
+
+
+class _Eco:
+    """Pseudo-archivo para csv.writer: devuelve la línea en lugar de guardarla"""
+
+    def write(self, valor):
+        return valor
+
+
+def _filas(resultados):
+    """Una tupla por respuesta (o una por resultado sin respuestas), agrupables por resultado"""
+    return resultados.order_by('-fecha_test', '-id', 'respuestas__pregunta__numero').values_list(
+        *COLUMNAS_RESULTADO, *COLUMNAS_RESPUESTA
+    ).iterator(chunk_size=TAMANO_LOTE_EXPORTACION)
+
+
+def generar_csv(resultados):
+    escritor = csv.writer(_Eco())
+    # BOM para que Excel detecte UTF-8
+    yield '\ufeff' + escritor.writerow(CABECERA_CSV)
+    for fila in _filas(resultados):
+        fila = list(fila)
+        fila[2] = fila[2].isoformat()
+        yield escritor.writerow(fila)
+
+
+def generar_jsonl(resultados):
+    """Un objeto JSON por resultado con la lista de sus respuestas"""
+    n = len(COLUMNAS_RESULTADO)
+    for cabecera, filas in groupby(_filas(resultados), key=lambda fila: fila[:n]):
+        resultado_id, paciente, fecha_test, puntaje_total, diagnostico, version = cabecera
+        respuestas = [
+            {'numero': numero, 'seccion': seccion, 'pregunta': pregunta, 'respuesta': respuesta, 'puntaje': puntaje}
+            for numero, seccion, pregunta, respuesta, puntaje in (fila[n:] for fila in filas)
+            if numero is not None
+        ]
+        yield json.dumps({
+            'id': resultado_id,
+            'paciente': paciente,
+            'fecha_test': fecha_test,
+            'puntaje_total': puntaje_total,
+            'diagnostico': diagnostico,
+            'version_cuestionario': version,
+            'respuestas': respuestas,
+        }, cls=DjangoJSONEncoder, ensure_ascii=False) + '\n'
+
+
+# formato -> (generador, content type)
+FORMATOS = {
+    'csv': (generar_csv, 'text/csv; charset=utf-8'),
+    'jsonl': (generar_jsonl, 'application/x-ndjson; charset=utf-8'),
+}
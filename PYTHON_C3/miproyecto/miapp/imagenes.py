@@ -0,0 +1,193 @@
+"""
+Variantes redimensionadas de Recurso.imagen_portada (WebP y JPEG a varios anchos).
+
+Al guardar un recurso con una portada nueva, el trabajo se encola tras el
+commit en un pool de hilos del proceso, así que la petición no espera al
+redimensionado (Pillow libera el GIL al decodificar, escalar y codificar).
+Las variantes se guardan sin metadatos (EXIF, XMP, perfil ICC) en el mismo
+almacenamiento que la portada, en portadas/variantes/, y sus rutas quedan en
+Recurso.variantes_portada:
+
+    {'origen': 'portadas/foto.png', 'webp': [[320, 'portadas/variantes/foto-320.webp'], ...], 'jpeg': [...]}
+
+'origen' indica de qué portada salen; si no coincide con la actual, las
+variantes están pendientes. El comando generar_variantes_portada procesa en
+paralelo las portadas que ya existían.
+
+En el almacenamiento por contenido dos portadas iguales comparten variantes,
+así que estas cuentan como usos en ArchivoContenido igual que los campos: al
+reemplazarlas o borrar el recurso se descuentan y el archivo se borra cuando
+nadie más lo usa.
+"""
+import logging
+import os
+import threading
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+
+from django.core.files.base import ContentFile
+from django.db import connections, transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from PIL import Image, ImageOps, UnidentifiedImageError
+
+from .almacenamiento import AlmacenamientoPorContenido, cambiar_referencias
+from .models import Recurso
+
+logger = logging.getLogger(__name__)
+
+ANCHOS = (320, 640, 1280)
+CARPETA_VARIANTES = 'portadas/variantes'
+HILOS_PROCESADO = 2
+
+# formato -> (formato de Pillow, extensión, opciones de guardado)
+FORMATOS = {
+    'webp': ('WEBP', 'webp', {'quality': 80, 'method': 4}),
+    'jpeg': ('JPEG', 'jpg', {'quality': 82, 'optimize': True, 'progressive': True}),
+}
+
+_pool = None
+_lock = threading.Lock()
+
+
+def almacenamiento_portadas():
+    """Almacenamiento de Recurso.imagen_portada, donde también viven sus variantes"""
+    return Recurso._meta.get_field('imagen_portada').storage
+
+
+def rutas(variantes):
+    """Rutas de todas las variantes de un dict de variantes_portada"""
+    return [ruta for clave in FORMATOS for _, ruta in (variantes or {}).get(clave, ())]
+
+
+def _anchos_para(ancho_original):
+    """Anchos de ANCHOS menores que el original, más el original si es menor que el mayor (nunca se amplía)"""
+    anchos = [ancho for ancho in ANCHOS if ancho < ancho_original]
+    if ancho_original <= ANCHOS[-1]:
+        anchos.append(ancho_original)
+    return anchos or [ANCHOS[-1]]
+
+
+def _sin_metadatos(imagen, formato):
+    """Copia solo con los píxeles: no arrastra EXIF, XMP ni perfil ICC del original"""
+    if formato == 'JPEG' and imagen.mode == 'RGBA':
+        limpia = Image.new('RGB', imagen.size, (255, 255, 255))
+        limpia.paste(imagen, mask=imagen.getchannel('A'))
+        return limpia
+    limpia = Image.new(imagen.mode, imagen.size)
+    limpia.paste(imagen)
+    return limpia
+
+
+def generar_variantes(nombre, almacenamiento=None):
+    """Crea las variantes de la imagen `nombre` del almacenamiento y devuelve el dict de variantes_portada"""
+    almacenamiento = almacenamiento or almacenamiento_portadas()
+    with almacenamiento.open(nombre, 'rb') as archivo:
+        with Image.open(archivo) as original:
+            original.seek(0)  # GIF/WebP animados: primer fotograma
+            imagen = ImageOps.exif_transpose(original)
+            if imagen.mode not in ('RGB', 'RGBA'):
+                imagen = imagen.convert('RGBA' if imagen.has_transparency_data else 'RGB')
+
+    base = os.path.splitext(os.path.basename(nombre))[0]
+    variantes = {'origen': nombre}
+    for clave, (formato, extension, opciones) in FORMATOS.items():
+        variantes[clave] = []
+        for ancho in _anchos_para(imagen.width):
+            alto = max(1, round(imagen.height * ancho / imagen.width))
+            escalada = _sin_metadatos(imagen.resize((ancho, alto), Image.Resampling.LANCZOS), formato)
+            contenido = BytesIO()
+            escalada.save(contenido, formato, **opciones)
+            ruta = almacenamiento.save(
+                f'{CARPETA_VARIANTES}/{base}-{ancho}.{extension}', ContentFile(contenido.getvalue())
+            )
+            variantes[clave].append([ancho, ruta])
+    return variantes
+
+
+def borrar_variantes(variantes, almacenamiento=None):
+    """Deja de usar las variantes de un recurso; en el almacenamiento por contenido se borran al quedar sin usos"""
+    almacenamiento = almacenamiento or almacenamiento_portadas()
+    if isinstance(almacenamiento, AlmacenamientoPorContenido):
+        cambiar_referencias(restar=Counter(rutas(variantes)))
+        return
+    for ruta in rutas(variantes):
+        almacenamiento.delete(ruta)
+
+
+def procesar_recurso(recurso_id, forzar=False):
+    """Genera (o elimina, si ya no hay portada) las variantes de un recurso. Devuelve True si cambiaron"""
+    fila = Recurso.objects.filter(pk=recurso_id).values_list('imagen_portada', 'variantes_portada').first()
+    if fila is None:
+        return False
+    nombre, previas = fila
+    previas = previas or {}
+    if (nombre or '') == previas.get('origen', '') and not forzar:
+        return False
+
+    if nombre:
+        try:
+            variantes = generar_variantes(nombre)
+        except (OSError, UnidentifiedImageError, Image.DecompressionBombError) as error:
+            # Se anota el origen igualmente para no reintentar una portada ilegible en cada pasada
+            logger.warning('No se pudieron generar las variantes de %s: %s', nombre, error)
+            variantes = {'origen': nombre}
+    else:
+        variantes = {}
+
+    almacenamiento = almacenamiento_portadas()
+    por_contenido = isinstance(almacenamiento, AlmacenamientoPorContenido)
+    # Solo si la portada no cambió mientras se procesaba; si cambió, esas variantes ya no sirven
+    with transaction.atomic():
+        if Recurso.objects.filter(pk=recurso_id, imagen_portada=nombre or '').update(variantes_portada=variantes):
+            if por_contenido:
+                # Se suman antes de descontar las previas: regenerar las mismas variantes no las deja a cero
+                cambiar_referencias(sumar=Counter(rutas(variantes)))
+            borrar_variantes(previas, almacenamiento)
+            return True
+    # Sin usos sumados, purgar_sin_referencias retira las del almacenamiento por contenido
+    if not por_contenido:
+        borrar_variantes(variantes, almacenamiento)
+    return False
+
+
+def _procesar_en_segundo_plano(recurso_id):
+    try:
+        procesar_recurso(recurso_id)
+    except Exception:
+        logger.exception('Error procesando la portada del recurso %s', recurso_id)
+    finally:
+        # Cada hilo del pool abre su propia conexión
+        connections.close_all()
+
+
+def encolar(recurso_id):
+    global _pool
+    with _lock:
+        if _pool is None:
+            _pool = ThreadPoolExecutor(max_workers=HILOS_PROCESADO, thread_name_prefix='portadas')
+    return _pool.submit(_procesar_en_segundo_plano, recurso_id)
+
+
+def srcset(variantes, formato):
+    """Atributo srcset ('url 320w, url 640w') de las variantes de un formato; vacío si no hay"""
+    almacenamiento = almacenamiento_portadas()
+    return ', '.join(
+        f'{almacenamiento.url(ruta)} {ancho}w' for ancho, ruta in (variantes or {}).get(formato, ())
+    )
+
+
+# ==================== SEÑALES ====================
+
+@receiver(post_save, sender=Recurso)
+def portada_guardada(sender, instance, **kwargs):
+    nombre = instance.imagen_portada.name or ''
+    if nombre != (instance.variantes_portada or {}).get('origen', ''):
+        transaction.on_commit(lambda: encolar(instance.pk))
+
+
+@receiver(post_delete, sender=Recurso)
+def recurso_borrado(sender, instance, **kwargs):
+    variantes = instance.variantes_portada or {}
+    transaction.on_commit(lambda: borrar_variantes(variantes))
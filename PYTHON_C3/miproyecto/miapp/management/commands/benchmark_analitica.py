@@ -0,0 +1,41 @@
+import time
+
+import numpy as np
+from django.core.management.base import BaseCommand
+
+from miapp.analitica import Cohorte
+
+
+class Command(BaseCommand):
+    # La equivalencia con calcular_resumen_por_seccion se comprueba en miapp/tests.py
+    help = 'Mide el motor de analítica por cohortes con respuestas sintéticas'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--respuestas', type=int, default=500000, help='Respuestas a generar')
+        parser.add_argument('--preguntas', type=int, default=30, help='Preguntas por resultado')
+        parser.add_argument('--repeticiones', type=int, default=5)
+        parser.add_argument('--semilla', type=int, default=0)
+
+    def handle(self, *args, **options):
+        preguntas = options['preguntas']
+        n_resultados = max(options['respuestas'] // preguntas, 1)
+        rng = np.random.default_rng(options['semilla'])
+
+        # Cada resultado responde a todas las preguntas; las secciones se reparten A, B, C en orden
+        resultado_ids = np.repeat(np.arange(1, n_resultados + 1), preguntas)
+        secciones = np.tile(np.array(['A', 'B', 'C'])[np.arange(preguntas) * 3 // preguntas], n_resultados)
+        puntajes = rng.integers(0, 4, size=len(resultado_ids))
+        self.stdout.write(f'{len(resultado_ids)} respuestas de {n_resultados} resultados')
+
+        tiempos = []
+        for _ in range(options['repeticiones']):
+            inicio = time.perf_counter()
+            cohorte = Cohorte(resultado_ids, secciones, puntajes)
+            cohorte.percentiles()
+            cohorte.distribucion([10, 20, 30])
+            tiempos.append(time.perf_counter() - inicio)
+        self.stdout.write(
+            f'Cohorte + percentiles + distribución: mejor {min(tiempos) * 1000:.1f} ms, '
+            f'mediana {sorted(tiempos)[len(tiempos) // 2] * 1000:.1f} ms'
+        )
+
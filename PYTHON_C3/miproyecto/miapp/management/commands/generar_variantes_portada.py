@@ -0,0 +1,34 @@
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.management.base import BaseCommand
+from django.db import connections
+
+from miapp.imagenes import procesar_recurso
+from miapp.models import Recurso
+
+
+def _procesar(recurso_id, forzar):
+    try:
+        return procesar_recurso(recurso_id, forzar)
+    finally:
+        connections.close_all()
+
+
+class Command(BaseCommand):
+    help = 'Genera en paralelo las variantes WebP/JPEG de las portadas que aún no las tienen'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--hilos', type=int, default=4, help='Imágenes procesadas a la vez')
+        parser.add_argument('--todas', action='store_true', help='Regenera también las portadas ya procesadas')
+
+    def handle(self, *args, **options):
+        forzar = options['todas']
+        pendientes = [
+            recurso_id
+            for recurso_id, nombre, variantes in Recurso.objects.values_list('id', 'imagen_portada', 'variantes_portada')
+            if (nombre or '') != (variantes or {}).get('origen', '') or (forzar and nombre)
+        ]
+        # Pillow libera el GIL al decodificar, escalar y codificar: los hilos trabajan en paralelo
+        with ThreadPoolExecutor(max_workers=options['hilos']) as pool:
+            procesados = sum(pool.map(_procesar, pendientes, [forzar] * len(pendientes)))
+        self.stdout.write(self.style.SUCCESS(f'{procesados} de {len(pendientes)} portadas procesadas'))
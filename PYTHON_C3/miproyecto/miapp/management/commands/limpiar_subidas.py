@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+
+from miapp.almacenamiento import purgar_sin_referencias
+from miapp.subidas import HORAS_ABANDONO, limpiar
+
+
+class Command(BaseCommand):
+    help = 'Borra las subidas por fragmentos abandonadas, los parciales huérfanos y los archivos subidos sin usar'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--horas', type=int, default=HORAS_ABANDONO, help='Horas sin actividad para darla por abandonada')
+
+    def handle(self, *args, **options):
+        total = limpiar(options['horas'])
+        sin_uso = purgar_sin_referencias(options['horas'])
+        self.stdout.write(self.style.SUCCESS(f'{total} subidas abandonadas y {sin_uso} archivos sin usar eliminados'))
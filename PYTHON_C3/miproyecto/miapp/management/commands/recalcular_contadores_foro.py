@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+
+from miapp.models import HiloForo, recalcular_contadores_hilos
+
+
+class Command(BaseCommand):
+    help = 'Reconstruye desde cero los contadores de respuestas y la última respuesta de cada hilo del foro'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--hilo', type=int, action='append', help='Limitar a uno o más ids de hilo')
+
+    def handle(self, *args, **options):
+        hilos = HiloForo.objects.all()
+        if options['hilo']:
+            hilos = hilos.filter(pk__in=options['hilo'])
+        actualizados = recalcular_contadores_hilos(hilos)
+        self.stdout.write(self.style.SUCCESS(f'{actualizados} hilos recalculados'))
@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand
+
+from miapp.ranking import TAMANO_LOTE_HOT, parametros, recalcular_todo
+
+
+class Command(BaseCommand):
+    help = (
+        'Recalcula la puntuación hot de todos los hilos con los ParametrosHot vigentes. '
+        'Ejecutar después de cambiar los pesos o la vida media'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--lote', type=int, default=TAMANO_LOTE_HOT, help='Hilos por UPDATE')
+
+    def handle(self, *args, **options):
+        params = parametros()
+        self.stdout.write(f'Parámetros: {params}')
+        total = recalcular_todo(options['lote'])
+        self.stdout.write(self.style.SUCCESS(f'{total} hilos recalculados'))
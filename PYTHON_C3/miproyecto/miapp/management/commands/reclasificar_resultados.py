@@ -0,0 +1,39 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from miapp import bandas, tendencias
+from miapp.models import VersionBandas
+
+
+class Command(BaseCommand):
+    help = (
+        'Recalcula el diagnóstico de los resultados históricos con una versión de bandas '
+        '(por defecto la vigente) y registra en cada resultado la versión usada'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--bandas', type=int, help='Id de VersionBandas a aplicar')
+        parser.add_argument('--lote', type=int, default=bandas.TAMANO_LOTE_RECLASIFICACION, help='Rango de ids por UPDATE')
+        parser.add_argument('--sin-tendencias', action='store_true', help='No reconstruir los agregados de tendencias')
+
+    def handle(self, *args, **options):
+        try:
+            tabla = bandas.tabla(options['bandas']) if options['bandas'] else bandas.vigente()
+        except VersionBandas.DoesNotExist:
+            raise CommandError(f"No existe la versión de bandas {options['bandas']}")
+        except bandas.BandasInvalidas as e:
+            raise CommandError(str(e))
+
+        self.stdout.write(f'Aplicando bandas v{tabla.version_id}: máximos {tabla.maximos}')
+        inicio = time.perf_counter()
+        total = bandas.reclasificar(
+            tabla, options['lote'], progreso=lambda n: self.stdout.write(f'  {n} resultados reclasificados')
+        )
+        self.stdout.write(self.style.SUCCESS(
+            f'{total} resultados reclasificados en {time.perf_counter() - inicio:.1f} s'
+        ))
+        if total and not options['sin_tendencias']:
+            # Los conteos por banda de las tendencias dependen del diagnóstico
+            filas = tendencias.reconstruir()
+            self.stdout.write(self.style.SUCCESS(f'{filas} filas de tendencias reconstruidas'))
@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+
+from miapp.ranking import recalcular_todo
+from miapp.votos import reconciliar_contadores
+
+
+class Command(BaseCommand):
+    help = 'Recalcula los contadores de votos de hilos y respuestas a partir de las tablas de votos'
+
+    def handle(self, *args, **options):
+        actualizados = reconciliar_contadores()
+        for tipo_objeto, total in actualizados.items():
+            self.stdout.write(self.style.SUCCESS(f'{total} registros de tipo {tipo_objeto} reconciliados'))
+        # Los votos de los hilos forman parte de la puntuación hot
+        self.stdout.write(self.style.SUCCESS(f'{recalcular_todo()} puntuaciones hot recalculadas'))
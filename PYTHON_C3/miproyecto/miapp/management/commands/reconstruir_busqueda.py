@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from miapp.busqueda import reconstruir_indice
+
+
+class Command(BaseCommand):
+    help = 'Regenera el índice de búsqueda del foro (tsvector en PostgreSQL, FTS5 en SQLite)'
+
+    def handle(self, *args, **options):
+        hilos, respuestas = reconstruir_indice()
+        self.stdout.write(self.style.SUCCESS(f'Indexados {hilos} hilos y {respuestas} respuestas'))
@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from miapp.tendencias import reconstruir
+
+
+class Command(BaseCommand):
+    help = 'Rehace desde cero los agregados diarios y semanales de los resultados del test'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--lote', type=int, default=2000, help='Resultados por consulta de secciones')
+
+    def handle(self, *args, **options):
+        total = reconstruir(options['lote'])
+        self.stdout.write(self.style.SUCCESS(f'{total} filas de tendencias generadas'))
@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from miapp.almacenamiento import recontar_referencias
+
+
+class Command(BaseCommand):
+    help = 'Recalcula cuántos campos usan cada archivo guardado por contenido a partir de los modelos'
+
+    def handle(self, *args, **options):
+        corregidas = recontar_referencias()
+        self.stdout.write(self.style.SUCCESS(f'{corregidas} archivos con el número de usos corregido'))
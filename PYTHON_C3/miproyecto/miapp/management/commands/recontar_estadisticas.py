@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from miapp.estadisticas import recontar_todo
+
+
+class Command(BaseCommand):
+    help = 'Recalcula desde cero las estadísticas materializadas para corregir posibles desviaciones'
+
+    def handle(self, *args, **options):
+        total = recontar_todo()
+        self.stdout.write(self.style.SUCCESS(f'{total} métricas recalculadas'))
@@ -0,0 +1,207 @@
+"""
+Servicio de los archivos de MEDIA_ROOT con GET condicional, rangos y caché HTTP.
+
+- ETag ("tamaño-mtime") y Last-Modified: If-None-Match / If-Modified-Since
+  responden 304 sin abrir el archivo.
+- Range: un único rango de bytes por petición (206 / 416), respetando If-Range.
+  Varios rangos a la vez se responden con el archivo completo, como permite
+  la RFC 9110.
+- El archivo completo se entrega con FileResponse sobre el archivo real, así
+  que el servidor WSGI puede usar sendfile (wsgi.file_wrapper) sin copiarlo
+  por Python.
+- Nombres inmutables (con un hash o un UUID) se cachean un año; el resto se
+  revalida cada hora.
+- Los archivos de contenido_personalizado/ solo los ven el paciente al que
+  van dirigidos, el pasante que los subió y los pasantes/administradores, y
+  nunca se guardan en cachés compartidas.
+- Solo se sirven rutas canónicas: con '..', '.', '//' o '\\' (también
+  codificados, p. ej. %2e%2e) la respuesta es 404, para que los permisos y los
+  prefijos ocultos se comprueben sobre la misma ruta que se abre.
+
+Con MEDIA_DESCARGA = 'x-accel-redirect' (nginx) o 'x-sendfile' (Apache,
+lighttpd) Django solo comprueba los permisos y delega el envío al servidor web
+(MEDIA_ACCEL_PREFIJO es la location interna de nginx que apunta a MEDIA_ROOT).
+"""
+import mimetypes
+import os
+import posixpath
+import re
+from urllib.parse import quote
+
+from django.conf import settings
+from django.core.exceptions import SuspiciousFileOperation
+from django.http import FileResponse, Http404, HttpResponse, StreamingHttpResponse
+from django.utils._os import safe_join
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, parse_http_date_safe
+
+from .models import ContenidoPersonalizado
+
+PREFIJOS_PRIVADOS = ('contenido_personalizado/',)
+PREFIJOS_OCULTOS = ('subidas_parciales/',)  # Subidas por fragmentos a medias (subidas.py)
+CACHE_INMUTABLE = 'public, max-age=31536000, immutable'
+CACHE_PUBLICA = 'public, max-age=3600'
+CACHE_PRIVADA = 'private, no-cache'
+TAMANO_BLOQUE = 64 * 1024
+
+_INMUTABLE = re.compile(r'[0-9a-f]{16,}|[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12}', re.IGNORECASE)
+_RANGO = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+
+def es_canonica(ruta):
+    """La ruta relativa no cambia al normalizarla ni sale de MEDIA_ROOT"""
+    return (
+        '\\' not in ruta
+        and not ruta.startswith('/')
+        and posixpath.normpath(ruta) == ruta
+        and ruta != '..' and not ruta.startswith('../')
+    )
+
+
+def es_privado(ruta):
+    return ruta.startswith(PREFIJOS_PRIVADOS)
+
+
+def puede_ver(usuario, ruta):
+    if not es_privado(ruta):
+        return True
+    if not usuario.is_authenticated:
+        return False
+    perfil = getattr(usuario, 'userprofile', None)
+    if perfil is not None and (perfil.es_pasante() or perfil.es_admin()):
+        return True
+    return ContenidoPersonalizado.objects.filter(archivo=ruta, paciente=usuario).exists()
+
+
+def _cache_control(ruta):
+    if es_privado(ruta):
+        return CACHE_PRIVADA
+    return CACHE_INMUTABLE if _INMUTABLE.search(os.path.basename(ruta)) else CACHE_PUBLICA
+
+
+def leer_rango(cabecera, tamano):
+    """
+    (inicio, fin) incluidos del único rango de `cabecera`; None si no hay rango
+    aplicable (se sirve completo) y ValueError si no se puede satisfacer (416).
+    """
+    if not cabecera:
+        return None
+    coincidencia = _RANGO.match(cabecera.strip())
+    if coincidencia is None:
+        return None  # Varios rangos u otra unidad
+    inicio, fin = coincidencia.groups()
+    if not inicio:
+        if not fin:
+            return None
+        sufijo = int(fin)
+        if not sufijo:
+            raise ValueError
+        return max(0, tamano - sufijo), tamano - 1
+    inicio = int(inicio)
+    fin = min(int(fin), tamano - 1) if fin else tamano - 1
+    if inicio >= tamano or fin < inicio:
+        raise ValueError
+    return inicio, fin
+
+
+def _if_range_vale(request, etag, mtime):
+    """If-Range: el rango solo se aplica si el archivo no cambió desde la copia parcial del cliente"""
+    valor = request.headers.get('If-Range')
+    if not valor:
+        return True
+    if valor.startswith(('"', 'W/')):
+        return valor == etag
+    fecha = parse_http_date_safe(valor)
+    return fecha is not None and int(mtime) <= fecha
+
+
+def _leer_tramo(archivo, inicio, longitud):
+    try:
+        archivo.seek(inicio)
+        while longitud > 0:
+            bloque = archivo.read(min(TAMANO_BLOQUE, longitud))
+            if not bloque:
+                break
+            longitud -= len(bloque)
+            yield bloque
+    finally:
+        archivo.close()
+
+
+def _delegar(ruta, absoluta, tipo, modo):
+    respuesta = HttpResponse(content_type=tipo)
+    if modo == 'x-accel-redirect':
+        prefijo = getattr(settings, 'MEDIA_ACCEL_PREFIJO', '/media-interno/')
+        respuesta['X-Accel-Redirect'] = prefijo.rstrip('/') + '/' + quote(ruta)
+    else:
+        respuesta['X-Sendfile'] = absoluta
+    return respuesta
+
+
+def servir(request, ruta):
+    """Respuesta para el archivo `ruta` (relativa a MEDIA_ROOT) o Http404 si no existe o no se puede ver"""
+    # Sin normalizar, 'recursos/../contenido_personalizado/x' pasaría el control de permisos
+    # como pública y safe_join abriría el archivo privado
+    if not es_canonica(ruta):
+        raise Http404
+    try:
+        absoluta = safe_join(settings.MEDIA_ROOT, ruta)
+    except SuspiciousFileOperation:
+        raise Http404
+    if ruta.startswith(PREFIJOS_OCULTOS) or not puede_ver(request.user, ruta):
+        # 404 y no 403: no se revela qué archivos privados existen
+        raise Http404
+    try:
+        estado = os.stat(absoluta)
+    except OSError:
+        raise Http404
+    if not os.path.isfile(absoluta):
+        raise Http404
+
+    tipo, codificacion = mimetypes.guess_type(absoluta)
+    tipo = tipo or 'application/octet-stream'
+    cache_control = _cache_control(ruta)
+
+    modo = getattr(settings, 'MEDIA_DESCARGA', None)
+    if modo:
+        respuesta = _delegar(ruta, absoluta, tipo, modo)
+        respuesta['Cache-Control'] = cache_control
+        return respuesta
+
+    etag = f'"{estado.st_size:x}-{estado.st_mtime_ns:x}"'
+    ultima_modificacion = http_date(estado.st_mtime)
+    no_modificado = get_conditional_response(request, etag=etag, last_modified=int(estado.st_mtime))
+    if no_modificado is not None:
+        # El 304 lleva los validadores para que el cliente actualice su copia (RFC 9110 §15.4.5)
+        no_modificado['ETag'] = etag
+        no_modificado['Last-Modified'] = ultima_modificacion
+        no_modificado['Cache-Control'] = cache_control
+        return no_modificado
+
+    tamano = estado.st_size
+    rango = None
+    if request.method == 'GET' and _if_range_vale(request, etag, estado.st_mtime):
+        try:
+            rango = leer_rango(request.headers.get('Range'), tamano)
+        except ValueError:
+            respuesta = HttpResponse(status=416)
+            respuesta['Content-Range'] = f'bytes */{tamano}'
+            return respuesta
+
+    if rango is None:
+        respuesta = FileResponse(open(absoluta, 'rb'), content_type=tipo)
+    else:
+        inicio, fin = rango
+        # Sin fileno: el servidor no puede usar sendfile sobre un tramo, se copia por bloques
+        respuesta = StreamingHttpResponse(
+            _leer_tramo(open(absoluta, 'rb'), inicio, fin - inicio + 1), status=206, content_type=tipo
+        )
+        respuesta['Content-Range'] = f'bytes {inicio}-{fin}/{tamano}'
+        respuesta['Content-Length'] = str(fin - inicio + 1)
+    if codificacion:
+        respuesta['Content-Encoding'] = codificacion
+    respuesta['Accept-Ranges'] = 'bytes'
+    respuesta['ETag'] = etag
+    respuesta['Last-Modified'] = ultima_modificacion
+    respuesta['Cache-Control'] = cache_control
+    return respuesta
@@ -0,0 +1,52 @@
+# Generated by Django 5.2.18 on 2026-10-18 08:54
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models.functions import Coalesce
+
+
+def poblar_contadores(apps, schema_editor):
+    HiloForo = apps.get_model('miapp', 'HiloForo')
+    RespuestaForo = apps.get_model('miapp', 'RespuestaForo')
+    respuestas = RespuestaForo.objects.filter(hilo=models.OuterRef('pk'))
+    ultimas = respuestas.order_by('-creado_en', '-id')
+    conteo = respuestas.order_by().values('hilo').annotate(total=models.Count('id')).values('total')
+    HiloForo.objects.update(
+        num_respuestas=Coalesce(models.Subquery(conteo), 0),
+        ultima_respuesta_ref=models.Subquery(ultimas.values('id')[:1]),
+        ultima_respuesta_por=models.Subquery(ultimas.values('creado_por')[:1]),
+        ultima_respuesta_en=models.Subquery(ultimas.values('creado_en')[:1]),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('miapp', '0007_alter_categoriaforo_options_alter_hiloforo_options_and_more'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='hiloforo',
+            name='num_respuestas',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='hiloforo',
+            name='ultima_respuesta_en',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='hiloforo',
+            name='ultima_respuesta_por',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AddField(
+            model_name='hiloforo',
+            name='ultima_respuesta_ref',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='miapp.respuestaforo'),
+        ),
+        migrations.RunPython(poblar_contadores, migrations.RunPython.noop),
+    ]
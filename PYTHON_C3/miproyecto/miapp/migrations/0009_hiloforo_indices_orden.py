@@ -0,0 +1,31 @@
+# Generated by Django 5.2.18 on 2026-10-18 08:54
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('miapp', '0008_hiloforo_contadores_respuestas'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='hiloforo',
+            index=models.Index(fields=['creado_en', 'id'], name='hilo_creado_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='hiloforo',
+            index=models.Index(fields=['categoria', 'creado_en', 'id'], name='hilo_cat_creado_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='hiloforo',
+            index=models.Index(fields=['-votos_positivos', '-visitas', '-actualizado_en', '-id'], name='hilo_populares_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='hiloforo',
+            index=models.Index(fields=['categoria', '-votos_positivos', '-visitas', '-actualizado_en', '-id'], name='hilo_cat_populares_idx'),
+        ),
+    ]
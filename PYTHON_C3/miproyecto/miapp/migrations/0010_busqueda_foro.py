@@ -0,0 +1,68 @@
+# Generated by Django 5.2.18 on 2026-10-18 08:57
+
+import django.contrib.postgres.search
+from django.contrib.postgres.search import SearchVector
+from django.db import migrations
+
+CONFIG_BUSQUEDA = 'spanish'
+
+
+def crear_indices(apps, schema_editor):
+    """GIN sobre tsvector en PostgreSQL; tabla virtual FTS5 como respaldo en SQLite"""
+    HiloForo = apps.get_model('miapp', 'HiloForo')
+    RespuestaForo = apps.get_model('miapp', 'RespuestaForo')
+    vendor = schema_editor.connection.vendor
+    if vendor == 'postgresql':
+        schema_editor.execute('CREATE INDEX hilo_busqueda_gin ON miapp_hiloforo USING gin (busqueda)')
+        schema_editor.execute('CREATE INDEX respuesta_busqueda_gin ON miapp_respuestaforo USING gin (busqueda)')
+        HiloForo.objects.update(
+            busqueda=SearchVector('titulo', weight='A', config=CONFIG_BUSQUEDA)
+            + SearchVector('contenido', weight='B', config=CONFIG_BUSQUEDA)
+        )
+        RespuestaForo.objects.update(busqueda=SearchVector('contenido', weight='B', config=CONFIG_BUSQUEDA))
+    elif vendor == 'sqlite':
+        schema_editor.execute(
+            "CREATE VIRTUAL TABLE miapp_busqueda_fts USING fts5("
+            "titulo, contenido, tipo UNINDEXED, objeto_id UNINDEXED, hilo_id UNINDEXED, "
+            "tokenize='unicode61 remove_diacritics 2')"
+        )
+        # Las coincidencias en el título pesan el doble que en el contenido
+        schema_editor.execute("INSERT INTO miapp_busqueda_fts (miapp_busqueda_fts, rank) VALUES ('rank', 'bm25(2.0, 1.0)')")
+        schema_editor.execute(
+            "INSERT INTO miapp_busqueda_fts (titulo, contenido, tipo, objeto_id, hilo_id) "
+            "SELECT titulo, contenido, 'hilo', id, id FROM miapp_hiloforo"
+        )
+        schema_editor.execute(
+            "INSERT INTO miapp_busqueda_fts (titulo, contenido, tipo, objeto_id, hilo_id) "
+            "SELECT '', contenido, 'respuesta', id, hilo_id FROM miapp_respuestaforo"
+        )
+
+
+def borrar_indices(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == 'postgresql':
+        schema_editor.execute('DROP INDEX IF EXISTS hilo_busqueda_gin')
+        schema_editor.execute('DROP INDEX IF EXISTS respuesta_busqueda_gin')
+    elif vendor == 'sqlite':
+        schema_editor.execute('DROP TABLE IF EXISTS miapp_busqueda_fts')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('miapp', '0009_hiloforo_indices_orden'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='hiloforo',
+            name='busqueda',
+            field=django.contrib.postgres.search.SearchVectorField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='respuestaforo',
+            name='busqueda',
+            field=django.contrib.postgres.search.SearchVectorField(blank=True, editable=False, null=True),
+        ),
+        migrations.RunPython(crear_indices, borrar_indices),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 5.2.18 on 2026-10-18 08:59
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('miapp', '0010_busqueda_foro'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='respuestaforo',
+            index=models.Index(fields=['hilo', 'creado_en', 'id'], name='respuesta_hilo_creado_idx'),
+        ),
+    ]
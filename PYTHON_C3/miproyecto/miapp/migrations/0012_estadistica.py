@@ -0,0 +1,25 @@
+# Generated by Django 5.2.18 on 2026-10-18 08:59
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('miapp', '0011_respuestaforo_indice_hilo'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Estadistica',
+            fields=[
+                ('clave', models.CharField(max_length=100, primary_key=True, serialize=False)),
+                ('valor', models.BigIntegerField(default=0)),
+                ('actualizado_en', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'verbose_name': 'Estadística',
+                'verbose_name_plural': 'Estadísticas',
+            },
+        ),
+    ]
@@ -0,0 +1,27 @@
+from django.db import migrations
+
+CATEGORIAS_INICIALES = [
+    {'nombre': 'Experiencias Personales', 'color': '#6C63FF', 'orden': 1},
+    {'nombre': 'Consejos y Estrategias', 'color': '#4CAF50', 'orden': 2},
+    {'nombre': 'Apoyo Emocional', 'color': '#FF6B6B', 'orden': 3},
+    {'nombre': 'Preguntas y Dudas', 'color': '#FFA726', 'orden': 4},
+]
+
+
+def crear_categorias(apps, schema_editor):
+    """Crea las categorías por defecto del foro (antes se sembraban en cada visita al foro)"""
+    CategoriaForo = apps.get_model('miapp', 'CategoriaForo')
+    if CategoriaForo.objects.exists():
+        return
+    CategoriaForo.objects.bulk_create([CategoriaForo(**datos) for datos in CATEGORIAS_INICIALES])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('miapp', '0012_estadistica'),
+    ]
+
+    operations = [
+        migrations.RunPython(crear_categorias, migrations.RunPython.noop),
+    ]
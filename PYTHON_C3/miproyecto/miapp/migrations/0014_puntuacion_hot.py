@@ -0,0 +1,100 @@
+# Generated by Django 5.2.18 on 2026-10-18 09:01
+
+import math
+from datetime import datetime, timezone
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models.functions import Cast, Greatest, Ln
+
+# Copia congelada de miapp/ranking.py en el momento de esta migración: una migración no debe
+# importar código de la app, que puede cambiar o renombrarse después
+EPOCA = datetime(2025, 1, 1, tzinfo=timezone.utc)
+TAMANO_LOTE_HOT = 20000
+
+
+class SegundosDesdeEpoca(models.Func):
+    output_field = models.FloatField()
+
+    def as_postgresql(self, compiler, connection, **extra_context):
+        return self.as_sql(compiler, connection, template='EXTRACT(EPOCH FROM %(expressions)s)', **extra_context)
+
+    def as_sqlite(self, compiler, connection, **extra_context):
+        return self.as_sql(compiler, connection, template='((julianday(%(expressions)s) - 2440587.5) * 86400.0)', **extra_context)
+
+    def as_mysql(self, compiler, connection, **extra_context):
+        return self.as_sql(compiler, connection, template='UNIX_TIMESTAMP(%(expressions)s)', **extra_context)
+
+
+def expresion_hot(params):
+    tau = params.vida_media_horas * 3600 / math.log(2)
+    actividad = (
+        (models.F('votos_positivos') - models.F('votos_negativos')) * models.Value(params.peso_votos)
+        + models.F('num_respuestas') * models.Value(params.peso_respuestas)
+        + models.F('visitas') * models.Value(params.peso_visitas)
+    )
+    return (
+        Ln(models.Value(1.0) + Greatest(Cast(actividad, models.FloatField()), models.Value(0.0)))
+        + (SegundosDesdeEpoca('creado_en') - models.Value(EPOCA.timestamp())) / models.Value(tau)
+    )
+
+
+def puntuar_hilos(apps, schema_editor):
+    """Crea los parámetros por defecto y calcula la puntuación hot inicial de todos los hilos"""
+    ParametrosHot = apps.get_model('miapp', 'ParametrosHot')
+    HiloForo = apps.get_model('miapp', 'HiloForo')
+    params = ParametrosHot.objects.create()
+    expresion = expresion_hot(params)
+    rango = HiloForo.objects.aggregate(minimo=models.Min('id'), maximo=models.Max('id'))
+    if rango['minimo'] is None:
+        return
+    for inicio in range(rango['minimo'], rango['maximo'] + 1, TAMANO_LOTE_HOT):
+        HiloForo.objects.filter(pk__gte=inicio, pk__lt=inicio + TAMANO_LOTE_HOT).update(puntuacion_hot=expresion)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('miapp', '0013_categorias_foro_iniciales'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ParametrosHot',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('peso_votos', models.FloatField(default=1.0)),
+                ('peso_respuestas', models.FloatField(default=2.0)),
+                ('peso_visitas', models.FloatField(default=0.05)),
+                ('vida_media_horas', models.FloatField(default=48.0)),
+                ('creado_en', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'verbose_name': 'Parámetros de Popularidad',
+                'verbose_name_plural': 'Parámetros de Popularidad',
+            },
+        ),
+        migrations.RemoveIndex(
+            model_name='hiloforo',
+            name='hilo_populares_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='hiloforo',
+            name='hilo_cat_populares_idx',
+        ),
+        migrations.AddField(
+            model_name='hiloforo',
+            name='puntuacion_hot',
+            field=models.FloatField(default=0, editable=False),
+        ),
+        migrations.AddIndex(
+            model_name='hiloforo',
+            index=models.Index(fields=['-puntuacion_hot', '-id'], name='hilo_hot_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='hiloforo',
+            index=models.Index(fields=['categoria', '-puntuacion_hot', '-id'], name='hilo_cat_hot_idx'),
+        ),
+        migrations.RunPython(puntuar_hilos, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,44 @@
+# Generated by Django 5.2.18 on 2026-10-18 09:05
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+def enlazar_respuestas(apps, schema_editor):
+    # Antes las respuestas se guardaban justo antes que su resultado, en la misma petición:
+    # cada respuesta pertenece al primer resultado del paciente registrado a partir de ella
+    RespuestaTestPersonalizado = apps.get_model('miapp', 'RespuestaTestPersonalizado')
+    ResultadoTestPersonalizado = apps.get_model('miapp', 'ResultadoTestPersonalizado')
+    siguiente = ResultadoTestPersonalizado.objects.filter(
+        paciente=models.OuterRef('paciente'),
+        fecha_test__gte=models.OuterRef('fecha_respuesta'),
+    ).order_by('fecha_test', 'id')
+    RespuestaTestPersonalizado.objects.filter(resultado__isnull=True).update(
+        resultado=models.Subquery(siguiente.values('id')[:1])
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('miapp', '0014_puntuacion_hot'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='respuestatestpersonalizado',
+            name='resultado',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='respuestas', to='miapp.resultadotestpersonalizado'),
+        ),
+        migrations.AddIndex(
+            model_name='resultadotestpersonalizado',
+            index=models.Index(fields=['fecha_test', 'id'], name='resultado_fecha_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='resultadotestpersonalizado',
+            index=models.Index(fields=['paciente', 'fecha_test'], name='resultado_paciente_fecha_idx'),
+        ),
+        migrations.RunPython(enlazar_respuestas, migrations.RunPython.noop),
+    ]
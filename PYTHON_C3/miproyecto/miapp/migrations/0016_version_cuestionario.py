@@ -0,0 +1,28 @@
+# Generated by Django 5.2.18 on 2026-10-18 09:07
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('miapp', '0015_respuestatest_resultado'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='VersionCuestionario',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('huella', models.CharField(max_length=64, unique=True)),
+                ('contenido', models.JSONField()),
+                ('creada_en', models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='resultadotestpersonalizado',
+            name='version_cuestionario',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.PROTECT, related_name='resultados', to='miapp.versioncuestionario'),
+        ),
+    ]
@@ -0,0 +1,30 @@
+# Generated by Django 5.2.18 on 2026-10-18 09:09
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('miapp', '0016_version_cuestionario'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ResumenResultados',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('periodo', models.CharField(choices=[('dia', 'Día'), ('semana', 'Semana')], max_length=10)),
+                ('inicio', models.DateField()),
+                ('total', models.IntegerField(default=0)),
+                ('suma_puntaje', models.BigIntegerField(default=0)),
+                ('histograma', models.JSONField(default=dict)),
+                ('por_banda', models.JSONField(default=dict)),
+                ('suma_secciones', models.JSONField(default=dict)),
+                ('actualizado_en', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('periodo', 'inicio'), name='resumen_periodo_inicio_unico')],
+            },
+        ),
+    ]
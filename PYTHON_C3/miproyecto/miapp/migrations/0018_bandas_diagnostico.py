@@ -0,0 +1,67 @@
+# Generated by Django 5.2.18 on 2026-10-18 09:11
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+# Umbrales que calcular_diagnostico tenía fijos en el código
+BANDAS_INICIALES = [
+    (20, 'adecuado', "Bienestar emocional adecuado. Continúa con tus estrategias de afrontamiento positivas."),
+    (40, 'leve', "Leve malestar emocional. Podrías beneficiarte de estrategias adicionales de manejo del estrés."),
+    (60, 'moderado', "Malestar emocional moderado. Recomendable buscar apoyo psicológico y practicar técnicas de relajación."),
+    (None, 'significativo', "Malestar emocional significativo. Es importante buscar ayuda profesional de psicología."),
+]
+
+
+def crear_bandas_iniciales(apps, schema_editor):
+    """Crea la versión 1 con las bandas originales y se la asigna a los resultados existentes"""
+    VersionBandas = apps.get_model('miapp', 'VersionBandas')
+    BandaDiagnostico = apps.get_model('miapp', 'BandaDiagnostico')
+    ResultadoTestPersonalizado = apps.get_model('miapp', 'ResultadoTestPersonalizado')
+    version = VersionBandas.objects.create(descripcion='Bandas originales')
+    BandaDiagnostico.objects.bulk_create([
+        BandaDiagnostico(version=version, puntaje_maximo=maximo, codigo=codigo, diagnostico=diagnostico)
+        for maximo, codigo, diagnostico in BANDAS_INICIALES
+    ])
+    ResultadoTestPersonalizado.objects.update(version_bandas=version)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('miapp', '0017_resumen_resultados'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='VersionBandas',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('descripcion', models.CharField(blank=True, max_length=200)),
+                ('creada_en', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'verbose_name': 'Versión de Bandas de Diagnóstico',
+                'verbose_name_plural': 'Versiones de Bandas de Diagnóstico',
+            },
+        ),
+        migrations.AddField(
+            model_name='resultadotestpersonalizado',
+            name='version_bandas',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.PROTECT, related_name='resultados', to='miapp.versionbandas'),
+        ),
+        migrations.CreateModel(
+            name='BandaDiagnostico',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('puntaje_maximo', models.IntegerField(blank=True, help_text='Puntaje máximo incluido; vacío en la última banda', null=True)),
+                ('codigo', models.CharField(max_length=30)),
+                ('diagnostico', models.TextField()),
+                ('version', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='bandas', to='miapp.versionbandas')),
+            ],
+            options={
+                'ordering': ['version', 'puntaje_maximo'],
+                'constraints': [models.UniqueConstraint(fields=('version', 'codigo'), name='banda_version_codigo_unico'), models.UniqueConstraint(fields=('version', 'puntaje_maximo'), name='banda_version_maximo_unico')],
+            },
+        ),
+        migrations.RunPython(crear_bandas_iniciales, migrations.RunPython.noop),
+    ]
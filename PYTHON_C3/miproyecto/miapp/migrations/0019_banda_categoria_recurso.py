@@ -0,0 +1,19 @@
+# Generated by Django 5.2.18 on 2026-10-18 09:17
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('miapp', '0018_bandas_diagnostico'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='bandadiagnostico',
+            name='categoria_recurso',
+            field=models.ForeignKey(blank=True, help_text='Categoría de los recursos recomendados para esta banda; vacía para los más recientes de todas', null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='bandas', to='miapp.categoriarecurso'),
+        ),
+    ]
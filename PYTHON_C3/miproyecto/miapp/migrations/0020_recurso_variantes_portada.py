@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-18 09:19
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('miapp', '0019_banda_categoria_recurso'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recurso',
+            name='variantes_portada',
+            field=models.JSONField(blank=True, default=dict, editable=False),
+        ),
+    ]
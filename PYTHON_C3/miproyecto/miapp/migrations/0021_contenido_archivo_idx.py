@@ -0,0 +1,19 @@
+# Generated by Django 5.2.18 on 2026-10-18 09:20
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('miapp', '0020_recurso_variantes_portada'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='contenidopersonalizado',
+            index=models.Index(fields=['archivo'], name='contenido_archivo_idx'),
+        ),
+    ]
@@ -0,0 +1,43 @@
+# Generated by Django 5.2.18 on 2026-10-18 09:25
+
+import miapp.almacenamiento
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('miapp', '0022_subida_parcial'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='contenidopersonalizado',
+            name='archivo',
+            field=models.FileField(blank=True, max_length=255, null=True, storage=miapp.almacenamiento.por_contenido, upload_to='contenido_personalizado/'),
+        ),
+        migrations.AlterField(
+            model_name='recurso',
+            name='archivo',
+            field=models.FileField(blank=True, max_length=255, null=True, storage=miapp.almacenamiento.por_contenido, upload_to='recursos/'),
+        ),
+        migrations.AlterField(
+            model_name='recurso',
+            name='imagen_portada',
+            field=models.ImageField(blank=True, max_length=255, null=True, storage=miapp.almacenamiento.por_contenido, upload_to='portadas/'),
+        ),
+        migrations.CreateModel(
+            name='ArchivoContenido',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('nombre', models.CharField(max_length=255, unique=True)),
+                ('sha256', models.CharField(max_length=64)),
+                ('tamano', models.BigIntegerField()),
+                ('referencias', models.IntegerField(default=0)),
+                ('actualizado_en', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['referencias', 'actualizado_en'], name='archivo_sin_uso_idx')],
+            },
+        ),
+    ]
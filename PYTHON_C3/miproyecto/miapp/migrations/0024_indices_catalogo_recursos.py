@@ -0,0 +1,35 @@
+# Generated by Django 5.2.18 on 2026-10-18 09:27
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('miapp', '0023_almacenamiento_por_contenido'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='recurso',
+            index=models.Index(fields=['es_publico', 'creado_en', 'id'], name='recurso_publico_creado_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='recurso',
+            index=models.Index(fields=['es_publico', 'titulo', 'id'], name='recurso_publico_titulo_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='recurso',
+            index=models.Index(fields=['categoria', 'es_publico', 'creado_en', 'id'], name='recurso_cat_creado_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='recurso',
+            index=models.Index(fields=['tipo_recurso', 'es_publico', 'creado_en', 'id'], name='recurso_tipo_creado_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='recurso',
+            index=models.Index(fields=['es_publico', 'categoria', 'tipo_recurso'], name='recurso_facetas_idx'),
+        ),
+    ]
@@ -1,12 +1,14 @@
+import uuid
+
 from django.contrib.auth.models import User
-from django.db import models
-from django.db.models.signals import post_save
-from django.dispatch import receiver
-from django.contrib.auth.models import User
-from django.db import models
-from django.db.models.signals import post_save
+from django.contrib.postgres.search import SearchVectorField
+from django.db import models, transaction
+from django.db.models.functions import Coalesce
+from django.db.models.signals import post_save, post_delete
 from django.dispatch import receiver
 
+from .almacenamiento import por_contenido
+
 class UserProfile(models.Model):
     TIPO_USUARIO_CHOICES = [
         ('admin', 'Administrador'),
@@ -69,16 +71,28 @@ class Recurso(models.Model):
 
 
     enlace = models.URLField(blank=True, null=True) 
-    imagen_portada = models.ImageField(upload_to='portadas/', blank=True, null=True)  # Imagen de portada
+    imagen_portada = models.ImageField(upload_to='portadas/', storage=por_contenido, max_length=255, blank=True, null=True)  # Imagen de portada
+    variantes_portada = models.JSONField(default=dict, blank=True, editable=False)  # Rutas de las versiones reducidas (imagenes.py)
 
 
     url = models.URLField(blank=True, null=True)
-    archivo = models.FileField(upload_to='recursos/', blank=True, null=True)
+    archivo = models.FileField(upload_to='recursos/', storage=por_contenido, max_length=255, blank=True, null=True)
     contenido = models.TextField(blank=True)
     es_publico = models.BooleanField(default=True)
     creado_por = models.ForeignKey(User, on_delete=models.CASCADE)
     creado_en = models.DateTimeField(auto_now_add=True)
     
+    class Meta:
+        indexes = [
+            # Catálogo (catalogo.py): un índice por filtro y orden, siempre sobre los públicos
+            models.Index(fields=['es_publico', 'creado_en', 'id'], name='recurso_publico_creado_idx'),
+            models.Index(fields=['es_publico', 'titulo', 'id'], name='recurso_publico_titulo_idx'),
+            models.Index(fields=['categoria', 'es_publico', 'creado_en', 'id'], name='recurso_cat_creado_idx'),
+            models.Index(fields=['tipo_recurso', 'es_publico', 'creado_en', 'id'], name='recurso_tipo_creado_idx'),
+            # Facetas: la consulta agrupada por (categoría, tipo) se resuelve solo con el índice
+            models.Index(fields=['es_publico', 'categoria', 'tipo_recurso'], name='recurso_facetas_idx'),
+        ]
+    
     def __str__(self):
         return self.titulo
 
@@ -190,20 +204,45 @@ class HiloForo(models.Model):
     visitas = models.IntegerField(default=0)
     creado_en = models.DateTimeField(auto_now_add=True)
     actualizado_en = models.DateTimeField(auto_now=True)
+
+    # Contadores desnormalizados, mantenidos por las señales de RespuestaForo
+    # (ver recalcular_contadores_foro para reconstruirlos desde cero)
+    num_respuestas = models.IntegerField(default=0)
+    ultima_respuesta_ref = models.ForeignKey(
+        'RespuestaForo', on_delete=models.SET_NULL, blank=True, null=True, related_name='+'
+    )
+    ultima_respuesta_por = models.ForeignKey(
+        User, on_delete=models.SET_NULL, blank=True, null=True, related_name='+'
+    )
+    ultima_respuesta_en = models.DateTimeField(blank=True, null=True)
+
+    # Vector de búsqueda (solo PostgreSQL; en SQLite se usa la tabla FTS5, ver busqueda.py)
+    busqueda = SearchVectorField(blank=True, null=True, editable=False)
+
+    # Puntuación "hot" precalculada para el orden populares (ver ranking.py)
+    puntuacion_hot = models.FloatField(default=0, editable=False)
     
     class Meta:
         ordering = ['-actualizado_en']
         verbose_name = 'Hilo del Foro'
         verbose_name_plural = 'Hilos del Foro'
+        # Un índice por modo de orden del foro (con y sin filtro de categoría)
+        # para que la paginación por cursor sea un recorrido de índice
+        indexes = [
+            models.Index(fields=['creado_en', 'id'], name='hilo_creado_idx'),
+            models.Index(fields=['categoria', 'creado_en', 'id'], name='hilo_cat_creado_idx'),
+            models.Index(fields=['-puntuacion_hot', '-id'], name='hilo_hot_idx'),
+            models.Index(fields=['categoria', '-puntuacion_hot', '-id'], name='hilo_cat_hot_idx'),
+        ]
     
     def __str__(self):
         return self.titulo
     
     def total_respuestas(self):
-        return self.respuestas.count()
+        return self.num_respuestas
     
     def ultima_respuesta(self):
-        return self.respuestas.order_by('-creado_en').first()
+        return self.ultima_respuesta_ref
 
 class RespuestaForo(models.Model):
     hilo = models.ForeignKey(HiloForo, on_delete=models.CASCADE, related_name='respuestas')
@@ -215,14 +254,88 @@ class RespuestaForo(models.Model):
     votos_negativos = models.IntegerField(default=0)
     creado_en = models.DateTimeField(auto_now_add=True)
     actualizado_en = models.DateTimeField(auto_now=True)
+    busqueda = SearchVectorField(blank=True, null=True, editable=False)
     
     class Meta:
         ordering = ['creado_en']
         verbose_name = 'Respuesta del Foro'
         verbose_name_plural = 'Respuestas del Foro'
+        indexes = [
+            # Páginas de respuestas de un hilo por cursor (creado_en, id)
+            models.Index(fields=['hilo', 'creado_en', 'id'], name='respuesta_hilo_creado_idx'),
+        ]
     
     def __str__(self):
         return f"Respuesta a: {self.hilo.titulo}"
+    
+    def save(self, *args, **kwargs):
+        # La respuesta y los contadores del hilo (señal post_save) se guardan juntos o no se guarda nada
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+
+# Señales para mantener los contadores desnormalizados de HiloForo
+def borrado_con_el_hilo(origin):
+    """True si el borrado empezó por el propio hilo (o un queryset de hilos): sus respuestas caen en cascada"""
+    if isinstance(origin, HiloForo):
+        return True
+    return isinstance(origin, models.QuerySet) and origin.model is HiloForo
+
+@receiver(post_save, sender=RespuestaForo)
+def registrar_respuesta_en_hilo(sender, instance, created, **kwargs):
+    if not created:
+        return
+    # update() con F() no pisa actualizado_en y es atómico frente a respuestas concurrentes
+    HiloForo.objects.filter(pk=instance.hilo_id).update(
+        num_respuestas=models.F('num_respuestas') + 1,
+        ultima_respuesta_ref=instance.pk,
+        ultima_respuesta_por=instance.creado_por_id,
+        ultima_respuesta_en=instance.creado_en,
+    )
+
+@receiver(post_delete, sender=RespuestaForo)
+def quitar_respuesta_de_hilo(sender, instance, origin=None, **kwargs):
+    if borrado_con_el_hilo(origin):
+        return  # El hilo desaparece en la misma transacción; no tiene sentido un UPDATE por respuesta
+    with transaction.atomic():
+        HiloForo.objects.filter(pk=instance.hilo_id, num_respuestas__gt=0).update(
+            num_respuestas=models.F('num_respuestas') - 1
+        )
+        # El puntero a la última respuesta se recalcula desde la tabla de respuestas
+        ultima = RespuestaForo.objects.filter(hilo_id=instance.hilo_id).order_by('-creado_en', '-id').first()
+        HiloForo.objects.filter(pk=instance.hilo_id).update(
+            ultima_respuesta_ref=ultima,
+            ultima_respuesta_por=ultima.creado_por_id if ultima else None,
+            ultima_respuesta_en=ultima.creado_en if ultima else None,
+        )
+
+def recalcular_contadores_hilos(hilos=None):
+    """Reconstruye num_respuestas y la última respuesta de los hilos con un solo UPDATE"""
+    if hilos is None:
+        hilos = HiloForo.objects.all()
+    respuestas = RespuestaForo.objects.filter(hilo=models.OuterRef('pk'))
+    ultimas = respuestas.order_by('-creado_en', '-id')
+    conteo = respuestas.order_by().values('hilo').annotate(total=models.Count('id')).values('total')
+    return hilos.update(
+        num_respuestas=Coalesce(models.Subquery(conteo), 0),
+        ultima_respuesta_ref=models.Subquery(ultimas.values('id')[:1]),
+        ultima_respuesta_por=models.Subquery(ultimas.values('creado_por')[:1]),
+        ultima_respuesta_en=models.Subquery(ultimas.values('creado_en')[:1]),
+    )
+
+class ParametrosHot(models.Model):
+    """Pesos y vida media de la puntuación hot; se usa la fila más reciente"""
+    peso_votos = models.FloatField(default=1.0)
+    peso_respuestas = models.FloatField(default=2.0)
+    peso_visitas = models.FloatField(default=0.05)
+    vida_media_horas = models.FloatField(default=48.0)
+    creado_en = models.DateTimeField(auto_now_add=True)
+    
+    class Meta:
+        verbose_name = 'Parámetros de Popularidad'
+        verbose_name_plural = 'Parámetros de Popularidad'
+    
+    def __str__(self):
+        return f"Vida media {self.vida_media_horas}h (votos {self.peso_votos}, respuestas {self.peso_respuestas}, visitas {self.peso_visitas})"
 
 class VotoHilo(models.Model):
     TIPO_VOTO_CHOICES = [
@@ -283,19 +396,104 @@ class OpcionRespuestaPersonalizado(models.Model):
 
 class RespuestaTestPersonalizado(models.Model):
     paciente = models.ForeignKey('auth.User', on_delete=models.CASCADE)
+    resultado = models.ForeignKey(
+        'ResultadoTestPersonalizado', on_delete=models.CASCADE, null=True, blank=True, related_name='respuestas'
+    )
     pregunta = models.ForeignKey(PreguntaTestPersonalizado, on_delete=models.CASCADE)
     opcion_elegida = models.ForeignKey(OpcionRespuestaPersonalizado, on_delete=models.CASCADE)
     fecha_respuesta = models.DateTimeField(auto_now_add=True)
 
+class VersionCuestionario(models.Model):
+    """Copia del cuestionario (preguntas, opciones y puntajes) con la que se puntuó un resultado"""
+    huella = models.CharField(max_length=64, unique=True)
+    contenido = models.JSONField()
+    creada_en = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"Cuestionario {self.huella[:12]} ({self.creada_en:%d/%m/%Y})"
+
+class VersionBandas(models.Model):
+    """Juego de bandas de diagnóstico; se usa la versión más reciente (ver bandas.py)"""
+    descripcion = models.CharField(max_length=200, blank=True)
+    creada_en = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        verbose_name = 'Versión de Bandas de Diagnóstico'
+        verbose_name_plural = 'Versiones de Bandas de Diagnóstico'
+
+    def __str__(self):
+        return f"Bandas v{self.id} - {self.descripcion}" if self.descripcion else f"Bandas v{self.id}"
+
+    def en_uso(self):
+        """Hay resultados clasificados con esta versión; sus bandas ya no se pueden cambiar"""
+        return self.pk is not None and self.resultados.exists()
+
+class BandaDiagnostico(models.Model):
+    version = models.ForeignKey(VersionBandas, on_delete=models.CASCADE, related_name='bandas')
+    puntaje_maximo = models.IntegerField(null=True, blank=True, help_text='Puntaje máximo incluido; vacío en la última banda')
+    codigo = models.CharField(max_length=30)
+    diagnostico = models.TextField()
+    categoria_recurso = models.ForeignKey(
+        CategoriaRecurso, on_delete=models.SET_NULL, null=True, blank=True, related_name='bandas',
+        help_text='Categoría de los recursos recomendados para esta banda; vacía para los más recientes de todas'
+    )
+
+    class Meta:
+        ordering = ['version', 'puntaje_maximo']
+        constraints = [
+            models.UniqueConstraint(fields=['version', 'codigo'], name='banda_version_codigo_unico'),
+            models.UniqueConstraint(fields=['version', 'puntaje_maximo'], name='banda_version_maximo_unico'),
+        ]
+
+    def __str__(self):
+        return f"{self.codigo} (≤ {self.puntaje_maximo})" if self.puntaje_maximo is not None else f"{self.codigo} (resto)"
+
 class ResultadoTestPersonalizado(models.Model):
     paciente = models.ForeignKey('auth.User', on_delete=models.CASCADE)
+    version_cuestionario = models.ForeignKey(
+        VersionCuestionario, on_delete=models.PROTECT, null=True, blank=True, related_name='resultados'
+    )
+    version_bandas = models.ForeignKey(
+        VersionBandas, on_delete=models.PROTECT, null=True, blank=True, related_name='resultados'
+    )
     fecha_test = models.DateTimeField(auto_now_add=True)
     puntaje_total = models.IntegerField()
     diagnostico = models.TextField()
 
+    class Meta:
+        indexes = [
+            # Listado de resultados para pasantes: más recientes primero, con o sin filtro por paciente
+            models.Index(fields=['fecha_test', 'id'], name='resultado_fecha_idx'),
+            models.Index(fields=['paciente', 'fecha_test'], name='resultado_paciente_fecha_idx'),
+        ]
+
     def __str__(self):
         return f"Test de {self.paciente.username} - {self.fecha_test}"
 
+class ResumenResultados(models.Model):
+    """Agregado diario o semanal de ResultadoTestPersonalizado, mantenido por tendencias.py"""
+    PERIODO_CHOICES = [
+        ('dia', 'Día'),
+        ('semana', 'Semana'),
+    ]
+
+    periodo = models.CharField(max_length=10, choices=PERIODO_CHOICES)
+    inicio = models.DateField()
+    total = models.IntegerField(default=0)
+    suma_puntaje = models.BigIntegerField(default=0)
+    histograma = models.JSONField(default=dict)  # {puntaje_total: resultados}, para medias y percentiles exactos
+    por_banda = models.JSONField(default=dict)  # {banda de diagnóstico: resultados}
+    suma_secciones = models.JSONField(default=dict)  # {sección: suma de puntajes}
+    actualizado_en = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['periodo', 'inicio'], name='resumen_periodo_inicio_unico'),
+        ]
+
+    def __str__(self):
+        return f"{self.get_periodo_display()} {self.inicio}: {self.total} resultados"
+
 class ContenidoPersonalizado(models.Model):
     TIPO_CONTENIDO = [
         ('video', 'Video'),
@@ -309,9 +507,68 @@ class ContenidoPersonalizado(models.Model):
     titulo = models.CharField(max_length=200)
     descripcion = models.TextField()
     tipo_contenido = models.CharField(max_length=20, choices=TIPO_CONTENIDO)
-    archivo = models.FileField(upload_to='contenido_personalizado/', blank=True, null=True)
+    archivo = models.FileField(upload_to='contenido_personalizado/', storage=por_contenido, max_length=255, blank=True, null=True)
     url = models.URLField(blank=True)
     fecha_creacion = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        indexes = [
+            # Permiso de descarga: de quién es un archivo (medios.py)
+            models.Index(fields=['archivo'], name='contenido_archivo_idx'),
+        ]
+
     def __str__(self):
         return f"{self.titulo} - Para {self.paciente.username}"
+
+class ArchivoContenido(models.Model):
+    """Archivo guardado por su hash (almacenamiento.py) y cuántos campos lo usan"""
+    nombre = models.CharField(max_length=255, unique=True)
+    sha256 = models.CharField(max_length=64)
+    tamano = models.BigIntegerField()
+    referencias = models.IntegerField(default=0)
+    actualizado_en = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [
+            # Purga de archivos subidos que ningún modelo llegó a usar
+            models.Index(fields=['referencias', 'actualizado_en'], name='archivo_sin_uso_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.nombre} ({self.referencias} usos)"
+
+class SubidaParcial(models.Model):
+    """Subida por fragmentos en curso (subidas.py); el archivo parcial vive en MEDIA_ROOT/subidas_parciales/"""
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    usuario = models.ForeignKey('auth.User', on_delete=models.CASCADE, related_name='subidas_parciales')
+    nombre_original = models.CharField(max_length=255)
+    tamano = models.BigIntegerField()
+    recibido = models.BigIntegerField(default=0)
+    sha256 = models.CharField(max_length=64, blank=True)  # Se rellena al finalizar
+    creada_en = models.DateTimeField(auto_now_add=True)
+    actualizada_en = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [
+            # Limpieza de subidas abandonadas
+            models.Index(fields=['actualizada_en'], name='subida_actualizada_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.nombre_original} ({self.recibido}/{self.tamano} bytes)"
+
+#====================================================================
+# ESTADÍSTICAS MATERIALIZADAS
+#====================================================================
+class Estadistica(models.Model):
+    """Contador materializado (una fila por métrica), mantenido por estadisticas.py"""
+    clave = models.CharField(max_length=100, primary_key=True)
+    valor = models.BigIntegerField(default=0)
+    actualizado_en = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        verbose_name = 'Estadística'
+        verbose_name_plural = 'Estadísticas'
+
+    def __str__(self):
+        return f"{self.clave} = {self.valor}"
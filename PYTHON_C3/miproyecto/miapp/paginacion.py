@@ -0,0 +1,77 @@
+"""
+Paginación por cursor (keyset) para listados ordenados.
+
+En lugar de OFFSET, cada página continúa a partir de los valores de orden
+de la última fila de la página anterior, así que la página N cuesta lo
+mismo que la página 1 y los registros nuevos no desplazan los resultados.
+"""
+import base64
+import json
+
+from django.core.exceptions import ValidationError
+from django.db.models import Q
+
+
+def _normalizar_orden(orden):
+    """Convierte ['-creado_en', 'id'] en [('creado_en', True), ('id', False)]"""
+    return [(campo.lstrip('-'), campo.startswith('-')) for campo in orden]
+
+
+def codificar_cursor(objeto, orden, modo=''):
+    """Genera un cursor opaco con los valores de orden de `objeto`"""
+    valores = []
+    for campo, _ in _normalizar_orden(orden):
+        valor = getattr(objeto, objeto._meta.get_field(campo).attname)
+        valores.append(valor.isoformat() if hasattr(valor, 'isoformat') else valor)
+    datos = json.dumps({'m': modo, 'v': valores}, separators=(',', ':'))
+    return base64.urlsafe_b64encode(datos.encode()).decode().rstrip('=')
+
+
+def decodificar_cursor(cursor, modelo, orden, modo=''):
+    """Devuelve los valores del cursor o None si es inválido o de otro modo de orden"""
+    if not cursor:
+        return None
+    try:
+        relleno = '=' * (-len(cursor) % 4)
+        datos = json.loads(base64.urlsafe_b64decode(cursor + relleno))
+        campos = _normalizar_orden(orden)
+        if datos.get('m') != modo or len(datos.get('v', [])) != len(campos):
+            return None
+        return [
+            modelo._meta.get_field(campo).to_python(valor)
+            for (campo, _), valor in zip(campos, datos['v'])
+        ]
+    except (ValueError, TypeError, ValidationError):
+        return None
+
+
+def filtro_despues_de(orden, valores):
+    """Construye el Q de "filas posteriores al cursor" para un orden con direcciones mixtas"""
+    filtro = Q()
+    iguales = {}
+    for (campo, descendente), valor in zip(_normalizar_orden(orden), valores):
+        operador = 'lt' if descendente else 'gt'
+        filtro |= Q(**iguales, **{f'{campo}__{operador}': valor})
+        iguales[campo] = valor
+    return filtro
+
+
+def paginar_keyset(queryset, orden, cursor=None, tamano=20, modo=''):
+    """
+    Devuelve (objetos, siguiente_cursor) de la página que sigue a `cursor`.
+
+    `orden` debe terminar en una columna única (normalmente 'id' o '-id')
+    para que el orden sea total y el cursor no salte ni repita filas.
+    """
+    queryset = queryset.order_by(*orden)
+    valores = decodificar_cursor(cursor, queryset.model, orden, modo)
+    if valores is not None:
+        queryset = queryset.filter(filtro_despues_de(orden, valores))
+
+    # Se pide una fila extra para saber si hay página siguiente sin hacer COUNT
+    objetos = list(queryset[:tamano + 1])
+    siguiente = None
+    if len(objetos) > tamano:
+        objetos = objetos[:tamano]
+        siguiente = codificar_cursor(objetos[-1], orden, modo)
+    return objetos, siguiente
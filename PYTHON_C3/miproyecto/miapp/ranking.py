@@ -0,0 +1,107 @@
+"""
+Puntuación "hot" de los hilos para el orden populares.
+
+    hot = ln(1 + max(actividad, 0)) + (creado_en - EPOCA) / tau
+    actividad = peso_votos * (positivos - negativos)
+              + peso_respuestas * respuestas + peso_visitas * visitas
+    tau = vida_media / ln 2
+
+Ordenar por `hot` equivale a ordenar por actividad * 2^(-edad / vida_media),
+pero la puntuación no depende de la hora actual: solo cambia cuando cambia
+la actividad del hilo o los ParametrosHot. Por eso basta con recalcularla
+de forma incremental (votos, respuestas, visitas) y en lote cuando se
+ajustan los parámetros (comando recalcular_hot).
+"""
+import math
+from datetime import datetime, timezone
+
+from django.db.models import F, FloatField, Func, Max, Min, Value
+from django.db.models.functions import Cast, Greatest, Ln
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from . import cache_referencia
+from .models import HiloForo, ParametrosHot, RespuestaForo, borrado_con_el_hilo
+
+# Origen del término temporal; mantiene las puntuaciones en un rango pequeño
+EPOCA = datetime(2025, 1, 1, tzinfo=timezone.utc)
+
+TAMANO_LOTE_HOT = 20000
+
+
+class SegundosDesdeEpoca(Func):
+    """Segundos Unix de un DateTimeField, en SQL de cada motor"""
+    output_field = FloatField()
+
+    def as_postgresql(self, compiler, connection, **extra_context):
+        return self.as_sql(compiler, connection, template='EXTRACT(EPOCH FROM %(expressions)s)', **extra_context)
+
+    def as_sqlite(self, compiler, connection, **extra_context):
+        return self.as_sql(compiler, connection, template='((julianday(%(expressions)s) - 2440587.5) * 86400.0)', **extra_context)
+
+    def as_mysql(self, compiler, connection, **extra_context):
+        return self.as_sql(compiler, connection, template='UNIX_TIMESTAMP(%(expressions)s)', **extra_context)
+
+
+def parametros():
+    """Parámetros vigentes (fila más reciente), memorizados en la caché de referencia"""
+    def cargar():
+        return ParametrosHot.objects.order_by('-id').first() or ParametrosHot()
+    return cache_referencia.obtener('parametros_hot', cargar)
+
+
+def expresion_hot(params=None):
+    """Expresión SQL de la puntuación hot para usar en UPDATE/annotate"""
+    params = params or parametros()
+    tau = params.vida_media_horas * 3600 / math.log(2)
+    actividad = (
+        (F('votos_positivos') - F('votos_negativos')) * Value(params.peso_votos)
+        + F('num_respuestas') * Value(params.peso_respuestas)
+        + F('visitas') * Value(params.peso_visitas)
+    )
+    return (
+        Ln(Value(1.0) + Greatest(Cast(actividad, FloatField()), Value(0.0)))
+        + (SegundosDesdeEpoca('creado_en') - Value(EPOCA.timestamp())) / Value(tau)
+    )
+
+
+def actualizar_hot(hilo_ids):
+    """Recalcula la puntuación de unos pocos hilos (tras un voto, respuesta o volcado de visitas)"""
+    hilo_ids = list(hilo_ids)
+    if hilo_ids:
+        HiloForo.objects.filter(pk__in=hilo_ids).update(puntuacion_hot=expresion_hot())
+
+
+def recalcular_todo(tamano_lote=TAMANO_LOTE_HOT):
+    """Recalcula todos los hilos en UPDATEs por rangos de id para no bloquear la tabla entera"""
+    params = parametros()
+    expresion = expresion_hot(params)
+    rango = HiloForo.objects.aggregate(minimo=Min('id'), maximo=Max('id'))
+    if rango['minimo'] is None:
+        return 0
+    total = 0
+    for inicio in range(rango['minimo'], rango['maximo'] + 1, tamano_lote):
+        total += HiloForo.objects.filter(pk__gte=inicio, pk__lt=inicio + tamano_lote).update(
+            puntuacion_hot=expresion
+        )
+    return total
+
+
+# ==================== SEÑALES ====================
+
+@receiver(post_save, sender=HiloForo)
+def puntuar_hilo_nuevo(sender, instance, created, **kwargs):
+    if created:
+        actualizar_hot([instance.pk])
+
+
+@receiver(post_save, sender=RespuestaForo)
+def puntuar_por_respuesta(sender, instance, created, **kwargs):
+    if created:
+        actualizar_hot([instance.hilo_id])
+
+
+@receiver(post_delete, sender=RespuestaForo)
+def puntuar_por_respuesta_borrada(sender, instance, origin=None, **kwargs):
+    if not borrado_con_el_hilo(origin):
+        actualizar_hot([instance.hilo_id])
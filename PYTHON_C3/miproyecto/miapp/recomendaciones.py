@@ -0,0 +1,86 @@
+"""
+Recursos recomendados a partir de los resultados de los tests.
+
+Se precalcula una lista de los N recursos públicos más recientes por cada
+CategoriaRecurso (una sola consulta con ROW_NUMBER() por categoría) y, a
+partir de ella, la lista de cada banda de diagnóstico según su
+categoria_recurso. Las listas de bandas se guardan por versión: un resultado
+recibe las de la versión con la que se clasificó, no las de la vigente.
+
+Todo se guarda en la caché de referencia, que se invalida al guardar o borrar
+recursos, categorías o bandas: las páginas que muestran recomendaciones solo
+buscan la lista ya ordenada, sin consultar los recursos.
+"""
+from collections import namedtuple
+from itertools import groupby
+from operator import attrgetter
+
+from django.db.models import F, Window
+from django.db.models.functions import RowNumber
+
+from . import cache_referencia
+from .bandas import BandasInvalidas, de_resultado as bandas_de_resultado
+from .models import BandaDiagnostico, Recurso, ResultadoTest, ResultadoTestPersonalizado
+
+RECURSOS_POR_LISTA = 6
+
+
+class Recomendaciones(namedtuple('Recomendaciones', 'por_categoria por_banda generales')):
+    """Tuplas de Recurso ya ordenadas: {categoria_id: ...}, {version_id: {codigo de banda: ...}} y la lista general"""
+
+    def de_categoria(self, categoria_id):
+        return self.por_categoria.get(categoria_id, ())
+
+    def de_banda(self, version_id, codigo):
+        return self.por_banda.get(version_id, {}).get(codigo, self.generales)
+
+    def de_puntaje(self, puntaje_total, version_bandas_id=None):
+        """Lista de la banda en la que cae `puntaje_total` con la versión de bandas del resultado (o la vigente)"""
+        try:
+            tabla = bandas_de_resultado(version_bandas_id)
+        except BandasInvalidas:
+            return self.generales
+        return self.de_banda(tabla.version_id, tabla.banda(puntaje_total))
+
+
+def _orden(recurso):
+    return recurso.creado_en, recurso.id
+
+
+def _compilar():
+    recursos = Recurso.objects.filter(es_publico=True).select_related('categoria').annotate(
+        puesto=Window(RowNumber(), partition_by=F('categoria'), order_by=(F('creado_en').desc(), F('id').desc()))
+    ).filter(puesto__lte=RECURSOS_POR_LISTA).order_by('categoria_id', 'puesto')
+    por_categoria = {
+        categoria_id: tuple(grupo) for categoria_id, grupo in groupby(recursos, key=attrgetter('categoria_id'))
+    }
+    # Los N más recientes de todos están necesariamente entre los N primeros de alguna categoría
+    generales = tuple(sorted(
+        (recurso for lista in por_categoria.values() for recurso in lista), key=_orden, reverse=True
+    )[:RECURSOS_POR_LISTA])
+
+    por_banda = {}
+    for version_id, codigo, categoria_id in BandaDiagnostico.objects.values_list(
+        'version_id', 'codigo', 'categoria_recurso_id'
+    ):
+        por_banda.setdefault(version_id, {})[codigo] = por_categoria.get(categoria_id, ()) if categoria_id else generales
+    return Recomendaciones(por_categoria, por_banda, generales)
+
+
+def actuales():
+    return cache_referencia.obtener('recomendaciones', _compilar)
+
+
+def para_usuario(usuario):
+    """Recomendaciones según el test más reciente del usuario (personalizado o genérico); vacío si no hizo ninguno"""
+    personalizado = ResultadoTestPersonalizado.objects.filter(paciente=usuario).order_by('-fecha_test').values_list(
+        'fecha_test', 'puntaje_total', 'version_bandas_id'
+    ).first()
+    generico = ResultadoTest.objects.filter(usuario=usuario).order_by('-completado_en').values_list(
+        'completado_en', 'categoria_recomendada_id'
+    ).first()
+    if personalizado and (not generico or personalizado[0] >= generico[0]):
+        return actuales().de_puntaje(personalizado[1], personalizado[2])
+    if generico:
+        return actuales().de_categoria(generico[1])
+    return ()
@@ -0,0 +1,287 @@
+"""
+Subidas por fragmentos reanudables (recursos y contenido personalizado).
+
+Protocolo (JSON, con la cabecera X-CSRFToken):
+
+1. POST subidas/ {"nombre", "tamano"} -> {"id", "recibido": 0, "fragmento"}
+2. PUT subidas/<id>/?offset=N con el fragmento como cuerpo crudo
+   -> {"recibido"}; si N no coincide con lo ya recibido responde 409 con el
+   offset correcto, y GET subidas/<id>/ lo devuelve para reanudar tras un corte.
+3. POST subidas/<id>/finalizar/ {"sha256"?} -> comprueba tamaño y hash.
+
+Cada fragmento se escribe al disco por bloques según llega, sin pasar por
+request.body, y el SHA-256 se va actualizando con esos mismos bloques (si otro
+proceso recibe el fragmento siguiente, rehace el hash leyendo el parcial). El
+memo de hashes de cada proceso olvida las subidas sin fragmentos recientes y
+tiene un tamaño máximo; lo olvidado se rehace igual, desde el disco.
+Después el formulario normal envía <campo>_subida=<id> en lugar del archivo
+y, una vez validado el resto del formulario, adjuntar() mueve el parcial a su
+carpeta definitiva con un rename, sin volver a copiarlo. Antes se comprueban
+todas las subidas del formulario (y con Pillow las de un ImageField, como haría
+forms.ImageField), para no adjuntar una y fallar en la siguiente. El comando
+limpiar_subidas borra las abandonadas.
+"""
+import fcntl
+import hashlib
+import os
+import threading
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.core.files import File
+from django.db import models
+from django.utils import timezone
+from PIL import Image
+
+from .models import SubidaParcial
+
+CARPETA_PARCIALES = 'subidas_parciales'
+TAMANO_FRAGMENTO = 4 * 1024 * 1024  # El que se sugiere al cliente
+TAMANO_MAXIMO_FRAGMENTO = 16 * 1024 * 1024
+TAMANO_MAXIMO_SUBIDA = 2 * 1024 * 1024 * 1024
+TAMANO_BLOQUE = 64 * 1024
+HORAS_ABANDONO = 24
+MEMO_HASHES_MAXIMO = 64
+MEMO_HASHES_SEGUNDOS = 15 * 60
+
+_lock = threading.Lock()
+_hashes = {}  # subida_id -> (bytes hasheados, objeto sha256, time.monotonic() del último fragmento)
+
+
+class SubidaInvalida(ValueError):
+    pass
+
+
+class OffsetIncorrecto(SubidaInvalida):
+    def __init__(self, recibido):
+        super().__init__(f'El fragmento debe empezar en el byte {recibido}')
+        self.recibido = recibido
+
+
+def ruta_parcial(subida_id):
+    return os.path.join(settings.MEDIA_ROOT, CARPETA_PARCIALES, f'{subida_id}.part')
+
+
+def iniciar(usuario, nombre, tamano):
+    try:
+        tamano = int(tamano)
+    except (TypeError, ValueError):
+        raise SubidaInvalida('Tamaño inválido')
+    nombre = os.path.basename(str(nombre or '')).strip()
+    if not nombre:
+        raise SubidaInvalida('Falta el nombre del archivo')
+    if not 0 < tamano <= TAMANO_MAXIMO_SUBIDA:
+        raise SubidaInvalida('El archivo está vacío o supera el tamaño máximo')
+    subida = SubidaParcial.objects.create(usuario=usuario, nombre_original=nombre[:255], tamano=tamano)
+    os.makedirs(os.path.dirname(ruta_parcial(subida.id)), exist_ok=True)
+    open(ruta_parcial(subida.id), 'xb').close()
+    return subida
+
+
+def _hash_hasta(subida_id, archivo, tamano):
+    """Hash de los primeros `tamano` bytes: el memorizado si está al día, si no se recalcula desde el disco"""
+    with _lock:
+        memo = _hashes.pop(subida_id, None)
+    if memo is not None and memo[0] == tamano:
+        return memo[1]
+    sha = hashlib.sha256()
+    archivo.seek(0)
+    for bloque in iter(lambda: archivo.read(TAMANO_BLOQUE), b''):
+        sha.update(bloque)
+    return sha
+
+
+def _recordar_hash(subida_id, recibido, sha):
+    """Memoriza el hash de una subida y olvida los de subidas paradas o, si hay demasiados, los más antiguos"""
+    ahora = time.monotonic()
+    with _lock:
+        _hashes.pop(subida_id, None)
+        _hashes[subida_id] = (recibido, sha, ahora)  # Al final: el dict queda ordenado del más antiguo al más reciente
+        for clave in [clave for clave, memo in _hashes.items() if ahora - memo[2] > MEMO_HASHES_SEGUNDOS]:
+            del _hashes[clave]
+        while len(_hashes) > MEMO_HASHES_MAXIMO:
+            del _hashes[next(iter(_hashes))]
+
+
+def agregar_fragmento(subida, offset, flujo, longitud):
+    """Añade `longitud` bytes leídos de `flujo` (el request) si `offset` es lo recibido hasta ahora"""
+    if longitud is None or longitud <= 0:
+        raise SubidaInvalida('Fragmento vacío o sin Content-Length')
+    if longitud > TAMANO_MAXIMO_FRAGMENTO:
+        raise SubidaInvalida('El fragmento supera el tamaño máximo')
+    if subida.sha256:
+        raise SubidaInvalida('La subida ya está finalizada')
+    try:
+        archivo = open(ruta_parcial(subida.id), 'r+b')
+    except FileNotFoundError:
+        raise SubidaInvalida('La subida ya no existe')
+    with archivo:
+        # El lock del archivo serializa dos fragmentos de la misma subida; el tamaño en disco es lo recibido
+        fcntl.flock(archivo, fcntl.LOCK_EX)
+        recibido = os.fstat(archivo.fileno()).st_size
+        if offset != recibido:
+            raise OffsetIncorrecto(recibido)
+        if recibido + longitud > subida.tamano:
+            raise SubidaInvalida('El fragmento sobrepasa el tamaño declarado')
+        sha = _hash_hasta(subida.id, archivo, recibido)
+        archivo.seek(recibido)
+        pendiente = longitud
+        try:
+            while pendiente:
+                bloque = flujo.read(min(TAMANO_BLOQUE, pendiente))
+                if not bloque:
+                    break
+                archivo.write(bloque)
+                sha.update(bloque)
+                recibido += len(bloque)
+                pendiente -= len(bloque)
+        finally:
+            # Aunque se corte la conexión, lo escrito cuenta: el cliente reanudará desde ahí
+            archivo.flush()
+            _recordar_hash(subida.id, recibido, sha)
+            SubidaParcial.objects.filter(pk=subida.pk).update(recibido=recibido, actualizada_en=timezone.now())
+    subida.recibido = recibido
+    if pendiente:
+        raise SubidaInvalida('El fragmento llegó incompleto')
+    return recibido
+
+
+def finalizar(subida, sha256_esperado=None):
+    if subida.sha256:
+        return subida
+    with open(ruta_parcial(subida.id), 'rb') as archivo:
+        recibido = os.fstat(archivo.fileno()).st_size
+        if recibido != subida.tamano:
+            raise SubidaInvalida(f'Faltan {subida.tamano - recibido} bytes por subir')
+        sha256 = _hash_hasta(subida.id, archivo, recibido).hexdigest()
+    if sha256_esperado and sha256_esperado.lower() != sha256:
+        raise SubidaInvalida('El hash del archivo no coincide; vuelve a subirlo')
+    subida.sha256 = sha256
+    subida.recibido = recibido
+    subida.save(update_fields=['sha256', 'recibido', 'actualizada_en'])
+    return subida
+
+
+def _finalizada(subida_id, usuario):
+    try:
+        subida = SubidaParcial.objects.get(pk=subida_id, usuario=usuario)
+    except (SubidaParcial.DoesNotExist, ValidationError):
+        raise SubidaInvalida('La subida no existe')
+    if not subida.sha256:
+        raise SubidaInvalida('La subida no está finalizada')
+    return subida
+
+
+def _comprobar_imagen(archivo):
+    """Como forms.ImageField: Pillow tiene que reconocer la imagen y verify() no encontrar datos corruptos"""
+    try:
+        with Image.open(archivo) as imagen:
+            imagen.verify()
+    except Exception:
+        raise SubidaInvalida('La imagen no es válida o está dañada')
+    finally:
+        archivo.seek(0)
+
+
+def comprobar(request, campo):
+    """Comprueba, sin adjuntarlo, el archivo del formulario para el FileField `campo`; SubidaInvalida si no sirve"""
+    es_imagen = isinstance(campo, models.ImageField)
+    subida_id = request.POST.get(f'{campo.name}_subida')
+    if subida_id:
+        ruta = ruta_parcial(_finalizada(subida_id, request.user).id)
+        if not os.path.exists(ruta):
+            raise SubidaInvalida('La subida ya se adjuntó')
+        if es_imagen:
+            with open(ruta, 'rb') as archivo:
+                _comprobar_imagen(archivo)
+    elif es_imagen and request.FILES.get(campo.name):
+        _comprobar_imagen(request.FILES[campo.name])
+
+
+def adjuntar(subida_id, usuario, campo):
+    """
+    Mueve una subida finalizada a la carpeta del FileField `campo` y devuelve el nombre que hay que asignarle.
+
+    Con almacenamiento en disco es un rename dentro de MEDIA_ROOT; con otros se copia una vez al almacenamiento.
+    """
+    subida = _finalizada(subida_id, usuario)
+    almacenamiento = campo.storage
+    nombre = almacenamiento.get_available_name(campo.generate_filename(None, subida.nombre_original))
+    if hasattr(almacenamiento, 'adoptar'):
+        # Almacenamiento por contenido: el hash ya está calculado, el parcial pasa a su nombre definitivo
+        try:
+            nombre = almacenamiento.adoptar(ruta_parcial(subida.id), nombre, subida.sha256)
+        except FileNotFoundError:
+            raise SubidaInvalida('La subida ya se adjuntó')
+        subida.delete()
+        return nombre
+    try:
+        destino = almacenamiento.path(nombre)
+    except NotImplementedError:
+        with open(ruta_parcial(subida.id), 'rb') as archivo:
+            nombre = almacenamiento.save(nombre, File(archivo))
+        os.remove(ruta_parcial(subida.id))
+    else:
+        os.makedirs(os.path.dirname(destino), exist_ok=True)
+        try:
+            os.replace(ruta_parcial(subida.id), destino)
+        except FileNotFoundError:
+            raise SubidaInvalida('La subida ya se adjuntó')
+    subida.delete()
+    return nombre
+
+
+def hay_archivo(request, nombre_campo):
+    """El formulario trae un archivo para `nombre_campo`, por fragmentos o en el multipart, sin adjuntarlo todavía"""
+    return bool(request.POST.get(f'{nombre_campo}_subida') or request.FILES.get(nombre_campo))
+
+
+def archivos_del_formulario(request, modelo, *nombres_campo):
+    """
+    Valores para los FileField `nombres_campo` de `modelo`, en el mismo orden: el nombre de la subida por
+    fragmentos indicada en <campo>_subida, ya movida a su sitio, o el archivo del multipart; None si no hay.
+
+    Adjuntar consume la subida, así que se llama cuando el resto del formulario ya es válido: si no,
+    el usuario tendría que volver a subir el archivo para corregir un campo. Se comprueban todos los
+    campos antes de adjuntar ninguno; si aun así un adjuntar simultáneo gana la carrera, lo ya adjuntado
+    queda sin usos y lo retira purgar_sin_referencias.
+    """
+    campos = [modelo._meta.get_field(nombre) for nombre in nombres_campo]
+    for campo in campos:
+        comprobar(request, campo)
+    valores = []
+    for campo in campos:
+        subida_id = request.POST.get(f'{campo.name}_subida')
+        valores.append(adjuntar(subida_id, request.user, campo) if subida_id else request.FILES.get(campo.name))
+    return valores
+
+
+def archivo_del_formulario(request, modelo, nombre_campo):
+    """archivos_del_formulario para un solo campo"""
+    return archivos_del_formulario(request, modelo, nombre_campo)[0]
+
+
+def limpiar(horas=HORAS_ABANDONO):
+    """Borra las subidas sin actividad en `horas` y los parciales huérfanos. Devuelve cuántas borró"""
+    limite = timezone.now() - timedelta(hours=horas)
+    abandonadas = list(SubidaParcial.objects.filter(actualizada_en__lt=limite).values_list('id', flat=True))
+    for subida_id in abandonadas:
+        with _lock:
+            _hashes.pop(subida_id, None)
+        try:
+            os.remove(ruta_parcial(subida_id))
+        except FileNotFoundError:
+            pass
+    SubidaParcial.objects.filter(id__in=abandonadas).delete()
+
+    carpeta = os.path.join(settings.MEDIA_ROOT, CARPETA_PARCIALES)
+    vigentes = {f'{subida_id}.part' for subida_id in SubidaParcial.objects.values_list('id', flat=True)}
+    huerfanos = 0
+    if os.path.isdir(carpeta):
+        for entrada in os.scandir(carpeta):
+            if entrada.name not in vigentes and entrada.stat().st_mtime < limite.timestamp():
+                os.remove(entrada.path)
+                huerfanos += 1
+    return len(abandonadas) + huerfanos
@@ -0,0 +1,11 @@
+from django import template
+
+from miapp import imagenes
+
+register = template.Library()
+
+
+@register.filter
+def srcset(recurso, formato='webp'):
+    """{{ recurso|srcset:'jpeg' }} -> 'url 320w, url 640w, ...' de las variantes de su portada"""
+    return imagenes.srcset(recurso.variantes_portada, formato)
@@ -0,0 +1,236 @@
+"""
+Agregados diarios y semanales de los resultados del test (tabla ResumenResultados).
+
+Cada fila guarda, para un día o una semana (lunes), el número de resultados,
+la suma de puntajes, el histograma de puntaje_total, el conteo por banda de
+diagnóstico y la suma de puntajes por sección. Con el histograma las medias y
+los percentiles son exactos y se pueden combinar varias filas, así que el
+panel de tendencias lee unas pocas filas en lugar de recorrer los resultados.
+
+Las señales suman (o restan) cada resultado tras el commit, cuando sus
+respuestas ya están guardadas; el comando reconstruir_tendencias rehace la
+tabla desde cero. La banda de cada resultado sale de su propia version_bandas,
+así que un resultado se resta de la misma banda en la que se sumó aunque
+después haya otra versión vigente.
+"""
+from bisect import bisect_left
+from datetime import timedelta
+from itertools import accumulate
+
+from django.db import IntegrityError, transaction
+from django.db.models import Sum
+from django.db.models.signals import post_delete, post_save, pre_delete
+from django.dispatch import receiver
+from django.utils import timezone
+
+from .bandas import de_resultado as bandas_de_resultado, vigente as bandas_vigentes
+from .models import RespuestaTestPersonalizado, ResultadoTestPersonalizado, ResumenResultados
+
+PERIODOS = ('dia', 'semana')
+PERCENTILES = (25, 50, 75, 90)
+
+
+def inicio_periodo(fecha, periodo):
+    """Primer día del periodo que contiene `fecha` (las semanas empiezan en lunes)"""
+    if periodo == 'semana':
+        return fecha - timedelta(days=fecha.weekday())
+    return fecha
+
+
+def secciones_de(resultado_ids):
+    """{resultado_id: {sección: suma}} con una consulta agrupada"""
+    sumas = {}
+    filas = RespuestaTestPersonalizado.objects.filter(resultado__in=resultado_ids).values(
+        'resultado_id', 'pregunta__seccion'
+    ).annotate(suma=Sum('opcion_elegida__puntaje')).order_by()
+    for fila in filas:
+        sumas.setdefault(fila['resultado_id'], {})[fila['pregunta__seccion']] = fila['suma']
+    return sumas
+
+
+def _sumar(resumen, puntaje, version_bandas_id, secciones, signo=1):
+    resumen.total += signo
+    resumen.suma_puntaje += signo * puntaje
+    banda = bandas_de_resultado(version_bandas_id).banda(puntaje)
+    for campo, clave, cantidad in (
+        [('histograma', str(puntaje), 1), ('por_banda', banda, 1)]
+        + [('suma_secciones', seccion, suma) for seccion, suma in secciones.items()]
+    ):
+        valores = getattr(resumen, campo)
+        valores[clave] = valores.get(clave, 0) + signo * cantidad
+        if not valores[clave]:
+            del valores[clave]
+
+
+def _fila_bloqueada(periodo, inicio):
+    fila = ResumenResultados.objects.select_for_update().filter(periodo=periodo, inicio=inicio).first()
+    if fila is not None:
+        return fila
+    try:
+        with transaction.atomic():
+            return ResumenResultados.objects.create(periodo=periodo, inicio=inicio)
+    except IntegrityError:
+        # Otro proceso creó la fila a la vez
+        return ResumenResultados.objects.select_for_update().get(periodo=periodo, inicio=inicio)
+
+
+def acumular(fecha_test, puntaje, version_bandas_id, secciones, signo=1):
+    """Suma (signo=1) o resta (signo=-1) un resultado en sus filas diaria y semanal"""
+    fecha = timezone.localdate(fecha_test)
+    with transaction.atomic():
+        for periodo in PERIODOS:
+            resumen = _fila_bloqueada(periodo, inicio_periodo(fecha, periodo))
+            _sumar(resumen, puntaje, version_bandas_id, secciones, signo)
+            resumen.save()
+
+
+def reconstruir(tamano_lote=2000):
+    """Rehace todos los agregados desde ResultadoTestPersonalizado. Devuelve el número de filas"""
+    filas = {}
+    resultados = ResultadoTestPersonalizado.objects.order_by('id').values_list(
+        'id', 'fecha_test', 'puntaje_total', 'version_bandas_id'
+    )
+    lote = []
+
+    def procesar(lote):
+        sumas = secciones_de([resultado_id for resultado_id, _, _, _ in lote])
+        for resultado_id, fecha_test, puntaje, version_bandas_id in lote:
+            fecha = timezone.localdate(fecha_test)
+            for periodo in PERIODOS:
+                inicio = inicio_periodo(fecha, periodo)
+                resumen = filas.get((periodo, inicio))
+                if resumen is None:
+                    resumen = filas[(periodo, inicio)] = ResumenResultados(periodo=periodo, inicio=inicio)
+                _sumar(resumen, puntaje, version_bandas_id, sumas.get(resultado_id, {}))
+
+    for fila in resultados.iterator(chunk_size=tamano_lote):
+        lote.append(fila)
+        if len(lote) >= tamano_lote:
+            procesar(lote)
+            lote = []
+    if lote:
+        procesar(lote)
+
+    with transaction.atomic():
+        ResumenResultados.objects.all().delete()
+        ResumenResultados.objects.bulk_create(filas.values(), batch_size=500)
+    return len(filas)
+
+
+# ==================== LECTURA ====================
+
+def _percentiles(histograma, total):
+    """Percentiles exactos (método inverted_cdf) a partir de un histograma {puntaje: cantidad}"""
+    if not total:
+        return {q: None for q in PERCENTILES}
+    puntajes = sorted(histograma, key=int)
+    acumulado = list(accumulate(histograma[puntaje] for puntaje in puntajes))
+    return {
+        q: int(puntajes[min(bisect_left(acumulado, total * q / 100), len(puntajes) - 1)])
+        for q in PERCENTILES
+    }
+
+
+def _conteo_bandas(por_banda):
+    """Bandas vigentes en su orden y después, por código, las de versiones anteriores que aún cuentan resultados"""
+    conteo = {codigo: por_banda.get(codigo, 0) for codigo in bandas_vigentes().codigos}
+    for codigo, cantidad in sorted(por_banda.items()):
+        if codigo not in conteo and cantidad:
+            conteo[codigo] = cantidad
+    return conteo
+
+
+def describir(inicio, total, suma_puntaje, histograma, por_banda, suma_secciones):
+    return {
+        'inicio': inicio,
+        'total': total,
+        'media': round(suma_puntaje / total, 2) if total else None,
+        'percentiles': _percentiles(histograma, total),
+        'bandas': _conteo_bandas(por_banda),
+        'secciones': {
+            seccion: round(suma / total, 2) if total else None
+            for seccion, suma in sorted(suma_secciones.items())
+        },
+    }
+
+
+def combinar(filas):
+    """Agrega varias filas (p. ej. todo el rango consultado) en un único resumen"""
+    total = suma_puntaje = 0
+    histograma, por_banda, suma_secciones = {}, {}, {}
+    for fila in filas:
+        total += fila.total
+        suma_puntaje += fila.suma_puntaje
+        for destino, origen in ((histograma, fila.histograma), (por_banda, fila.por_banda),
+                                (suma_secciones, fila.suma_secciones)):
+            for clave, valor in origen.items():
+                destino[clave] = destino.get(clave, 0) + valor
+    return describir(None, total, suma_puntaje, histograma, por_banda, suma_secciones)
+
+
+def resumen_entre(desde=None, hasta=None):
+    """Resumen conjunto de los días entre `desde` y `hasta` (incluidos; None deja el extremo abierto)"""
+    filas = ResumenResultados.objects.filter(periodo='dia')
+    if desde:
+        filas = filas.filter(inicio__gte=desde)
+    if hasta:
+        filas = filas.filter(inicio__lte=hasta)
+    return combinar(filas)
+
+
+def resumen_de(resultados):
+    """Resumen, como el de combinar(), de un queryset de resultados que ya viene acotado"""
+    filas = list(resultados.values_list('id', 'puntaje_total', 'version_bandas_id'))
+    sumas = secciones_de([resultado_id for resultado_id, _, _ in filas])
+    resumen = ResumenResultados()
+    for resultado_id, puntaje, version_bandas_id in filas:
+        _sumar(resumen, puntaje, version_bandas_id, sumas.get(resultado_id, {}))
+    return describir(
+        None, resumen.total, resumen.suma_puntaje, resumen.histograma, resumen.por_banda, resumen.suma_secciones
+    )
+
+
+def serie(periodo, desde, hasta):
+    """Filas del periodo entre dos fechas (incluidas) y su resumen conjunto"""
+    filas = list(ResumenResultados.objects.filter(
+        periodo=periodo, inicio__gte=inicio_periodo(desde, periodo), inicio__lte=hasta
+    ).order_by('inicio'))
+    return {
+        'periodo': periodo,
+        'filas': [
+            describir(f.inicio, f.total, f.suma_puntaje, f.histograma, f.por_banda, f.suma_secciones)
+            for f in filas
+        ],
+        'resumen': combinar(filas),
+    }
+
+
+# ==================== SEÑALES ====================
+
+@receiver(post_save, sender=ResultadoTestPersonalizado)
+def sumar_resultado(sender, instance, created, **kwargs):
+    if not created:
+        return
+
+    def sumar():
+        acumular(
+            instance.fecha_test, instance.puntaje_total, instance.version_bandas_id,
+            secciones_de([instance.pk]).get(instance.pk, {})
+        )
+    # Tras el commit: las respuestas del resultado se guardan después que él, en la misma transacción
+    transaction.on_commit(sumar)
+
+
+@receiver(pre_delete, sender=ResultadoTestPersonalizado)
+def recordar_secciones(sender, instance, **kwargs):
+    # Las respuestas se borran en cascada antes del post_delete
+    instance._secciones_previas = secciones_de([instance.pk]).get(instance.pk, {})
+
+
+@receiver(post_delete, sender=ResultadoTestPersonalizado)
+def restar_resultado(sender, instance, **kwargs):
+    secciones = getattr(instance, '_secciones_previas', {})
+    # version_bandas_id es la del resultado guardado: se resta de la banda en la que se sumó
+    transaction.on_commit(lambda: acumular(
+        instance.fecha_test, instance.puntaje_total, instance.version_bandas_id, secciones, signo=-1
+    ))
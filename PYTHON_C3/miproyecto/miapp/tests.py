@@ -1,3 +1,1843 @@
-from django.test import TestCase
+import csv
+import hashlib
+import io
+import json
+import os
+import shutil
+import tempfile
+import threading
+import time
+from datetime import timedelta
+from types import SimpleNamespace
+from unittest import addModuleCleanup, mock
 
-# Create your tests here.
+import numpy as np
+from asgiref.sync import sync_to_async
+from asgiref.testing import ApplicationCommunicator
+from django.conf import settings
+from django.contrib import admin
+from django.contrib.auth.models import User
+from django.contrib.messages import get_messages
+from django.contrib.messages.storage import default_storage
+from django.contrib.sessions.backends.signed_cookies import SessionStore
+from django.core.asgi import get_asgi_application
+from django.core.files.base import ContentFile
+from django.core.management import call_command
+from django.core.cache import caches
+from django.db import connection
+from django.db.models import QuerySet
+from django.test import RequestFactory, TestCase, TransactionTestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from PIL import Image
+
+from .models import (
+    ArchivoContenido, BandaDiagnostico, CategoriaForo, CategoriaRecurso, ContenidoPersonalizado, Estadistica,
+    FormularioContacto, HiloForo, OpcionRespuesta, OpcionRespuestaPersonalizado,
+    PreguntaTest, PreguntaTestPersonalizado, Recurso, RespuestaForo, RespuestaTestPersonalizado, ResultadoTest,
+    ResultadoTestPersonalizado, ResumenResultados, SubidaParcial, TestPsicologico, VersionBandas, VotoHilo
+)
+from . import (
+    almacenamiento, bandas, borradores, busqueda, cache_referencia, catalogo, estadisticas, exportacion, imagenes,
+    recomendaciones, subidas, tendencias, tests_genericos, tiempo_real, views, visitas, votos
+)
+from .admin import BandaDiagnosticoInline, VersionBandasAdmin
+from . import cuestionario as cuestionarios
+from .analitica import Cohorte
+from .evaluacion import EnvioInvalido, registrar_envio
+from .paginacion import codificar_cursor, decodificar_cursor, paginar_keyset
+from .views import calcular_resumen_por_seccion
+
+
+def setUpModule():
+    # Al acabar cada test se revierten (o se vacían) las versiones compartidas de la caché de
+    # referencia; con intervalo 0 cada lectura las vuelve a comprobar y ningún test ve el memo de otro
+    parche = mock.patch.object(cache_referencia, 'INTERVALO_VERSIONES', 0)
+    parche.start()
+    addModuleCleanup(parche.stop)
+
+
+class TransaccionalTestCase(TransactionTestCase):
+    """TransactionTestCase que además vacía la caché compartida: el flush no toca su tabla"""
+
+    def tearDown(self):
+        caches['referencia'].clear()
+        super().tearDown()
+
+
+def crear_usuario(username, tipo=None):
+    # Sin contraseña (no se calcula el hash); los tests entran con force_login
+    usuario = User.objects.create_user(username, f'{username}@ejemplo.com')
+    if tipo:
+        usuario.userprofile.tipo_usuario = tipo
+        usuario.userprofile.save()
+    return usuario
+
+
+def crear_hilo(usuario, categoria=None, **campos):
+    if categoria is None:
+        categoria = CategoriaForo.objects.create(nombre='General')
+    campos.setdefault('titulo', 'Un hilo')
+    campos.setdefault('contenido', 'Contenido del hilo')
+    return HiloForo.objects.create(categoria=categoria, creado_por=usuario, **campos)
+
+
+def crear_cuestionario(preguntas_por_seccion=2, puntajes=(0, 1, 2, 3)):
+    """Preguntas de las secciones A, B y C con una opción por puntaje"""
+    numero = 0
+    for seccion in 'ABC':
+        for _ in range(preguntas_por_seccion):
+            numero += 1
+            pregunta = PreguntaTestPersonalizado.objects.create(numero=numero, texto=f'Pregunta {numero}', seccion=seccion)
+            OpcionRespuestaPersonalizado.objects.bulk_create([
+                OpcionRespuestaPersonalizado(pregunta=pregunta, valor=str(puntaje), texto=f'Opción {puntaje}', puntaje=puntaje)
+                for puntaje in puntajes
+            ])
+
+
+def envio_con_puntajes(puntajes):
+    """POST de realizar_test que elige, pregunta a pregunta, la opción con cada puntaje de `puntajes`"""
+    cuestionario = cuestionarios.actual()
+    datos = {'version_cuestionario': cuestionario.huella}
+    for pregunta, puntaje in zip(cuestionario.preguntas, puntajes):
+        opcion = next(opcion for opcion in pregunta.opciones if opcion.puntaje == puntaje)
+        datos[f'pregunta_{pregunta.id}'] = str(opcion.id)
+    return datos
+
+
+def png(ancho, alto=100, color=(30, 120, 200)):
+    """Bytes de un PNG liso con EXIF (fabricante de la cámara)"""
+    exif = Image.Exif()
+    exif[0x010F] = 'Camara de prueba'  # Make
+    contenido = io.BytesIO()
+    Image.new('RGB', (ancho, alto), color).save(contenido, 'PNG', exif=exif)
+    return contenido.getvalue()
+
+
+# ==================== FORO ====================
+
+class ContadoresHiloTests(TestCase):
+
+    def setUp(self):
+        self.usuario = crear_usuario('ana')
+        self.hilo = crear_hilo(self.usuario)
+
+    def test_respuestas_actualizan_contador_y_ultima(self):
+        primera = RespuestaForo.objects.create(hilo=self.hilo, contenido='uno', creado_por=self.usuario)
+        segunda = RespuestaForo.objects.create(hilo=self.hilo, contenido='dos', creado_por=self.usuario)
+        self.hilo.refresh_from_db()
+        self.assertEqual(self.hilo.num_respuestas, 2)
+        self.assertEqual(self.hilo.ultima_respuesta_ref_id, segunda.id)
+
+        segunda.delete()
+        self.hilo.refresh_from_db()
+        self.assertEqual(self.hilo.num_respuestas, 1)
+        self.assertEqual(self.hilo.ultima_respuesta_ref_id, primera.id)
+
+    def test_fallo_del_contador_revierte_la_respuesta(self):
+        with mock.patch('miapp.models.HiloForo.objects.filter', side_effect=RuntimeError):
+            with self.assertRaises(RuntimeError):
+                RespuestaForo.objects.create(hilo=self.hilo, contenido='uno', creado_por=self.usuario)
+        self.assertFalse(RespuestaForo.objects.exists())
+
+    def test_borrar_hilo_no_actualiza_por_respuesta(self):
+        for numero in range(5):
+            RespuestaForo.objects.create(hilo=self.hilo, contenido=str(numero), creado_por=self.usuario)
+        with CaptureQueriesContext(connection) as consultas:
+            self.hilo.delete()
+        # Solo queda el SET NULL de ultima_respuesta_ref que hace el propio borrado en cascada, en una consulta
+        actualizaciones = [c['sql'] for c in consultas.captured_queries if c['sql'].startswith('UPDATE "miapp_hiloforo"')]
+        self.assertEqual(len(actualizaciones), 1)
+        self.assertNotIn('num_respuestas', actualizaciones[0])
+        self.assertFalse(RespuestaForo.objects.exists())
+
+
+class PaginacionKeysetTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.usuario = crear_usuario('ana')
+        cls.categoria = CategoriaForo.objects.create(nombre='General')
+        cls.hilos = [crear_hilo(cls.usuario, cls.categoria, titulo=f'Hilo {numero}') for numero in range(7)]
+        # Fechas repetidas para que el desempate por id sea lo que decide el orden
+        for numero, hilo in enumerate(cls.hilos):
+            HiloForo.objects.filter(pk=hilo.pk).update(creado_en=cls.hilos[numero // 3].creado_en)
+
+    def recorrer(self, orden, tamano):
+        vistos, cursor = [], None
+        while True:
+            pagina, cursor = paginar_keyset(HiloForo.objects.all(), orden, cursor, tamano=tamano, modo='x')
+            vistos += [hilo.id for hilo in pagina]
+            if cursor is None:
+                return vistos
+
+    def test_recorre_todo_sin_repetir_ni_saltar(self):
+        for orden in (['-creado_en', '-id'], ['creado_en', 'id']):
+            esperado = list(HiloForo.objects.order_by(*orden).values_list('id', flat=True))
+            for tamano in (1, 2, 3, 7, 10):
+                self.assertEqual(self.recorrer(orden, tamano), esperado)
+
+    def test_cursor_invalido_o_de_otro_modo_vuelve_al_principio(self):
+        orden = ['-creado_en', '-id']
+        cursor = codificar_cursor(self.hilos[0], orden, modo='recientes')
+        self.assertIsNotNone(decodificar_cursor(cursor, HiloForo, orden, modo='recientes'))
+        self.assertIsNone(decodificar_cursor(cursor, HiloForo, orden, modo='populares'))
+        self.assertIsNone(decodificar_cursor('no-es-un-cursor', HiloForo, orden))
+
+    def test_listado_del_foro_pagina_por_cursor(self):
+        self.client.force_login(self.usuario)
+        with mock.patch('miapp.views.HILOS_POR_PAGINA', 3):
+            respuesta = self.client.get(reverse('miapp:foro_comunitario'))
+            self.assertEqual(len(respuesta.context['hilos']), 3)
+            vistos = [hilo.id for hilo in respuesta.context['hilos']]
+            while respuesta.context['siguiente_cursor']:
+                respuesta = self.client.get(
+                    reverse('miapp:foro_comunitario'), {'cursor': respuesta.context['siguiente_cursor']}
+                )
+                vistos += [hilo.id for hilo in respuesta.context['hilos']]
+        self.assertEqual(sorted(vistos), sorted(hilo.id for hilo in self.hilos))
+        self.assertEqual(len(vistos), len(set(vistos)))
+
+
+
+class RespuestasHiloTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.usuario = crear_usuario('ana')
+        cls.hilo = crear_hilo(cls.usuario)
+        cls.respuestas = [
+            RespuestaForo.objects.create(hilo=cls.hilo, contenido=f'Respuesta {numero}', creado_por=cls.usuario)
+            for numero in range(5)
+        ]
+        # Misma fecha para todas: el id es lo que desempata
+        RespuestaForo.objects.filter(hilo=cls.hilo).update(creado_en=cls.respuestas[0].creado_en)
+
+    def setUp(self):
+        self.client.force_login(self.usuario)
+        self.enterContext(mock.patch('miapp.views.RESPUESTAS_POR_PAGINA', 2))
+
+    def ids_del_fragmento(self, html):
+        return [r.id for r in self.respuestas if f'id="respuesta-{r.id}"' in html]
+
+    def test_la_continuacion_por_cursor_recorre_todas_las_respuestas(self):
+        respuesta = self.client.get(reverse('miapp:detalle_hilo', args=[self.hilo.id]))
+        vistos = [r.id for r in respuesta.context['respuestas']]
+        cursor = respuesta.context['siguiente_cursor']
+        while cursor:
+            datos = self.client.get(reverse('miapp:respuestas_hilo', args=[self.hilo.id]), {'cursor': cursor}).json()
+            vistos += self.ids_del_fragmento(datos['html'])
+            cursor = datos['siguiente_cursor']
+        self.assertEqual(vistos, [r.id for r in self.respuestas])
+
+    def test_cursor_invalido_vuelve_a_la_primera_pagina(self):
+        datos = self.client.get(
+            reverse('miapp:respuestas_hilo', args=[self.hilo.id]), {'cursor': 'no-es-un-cursor'}
+        ).json()
+        self.assertEqual(self.ids_del_fragmento(datos['html']), [r.id for r in self.respuestas[:2]])
+        self.assertIsNotNone(datos['siguiente_cursor'])
+
+    def test_respuestas_nuevas_desde_un_id(self):
+        url = reverse('miapp:respuestas_nuevas', args=[self.hilo.id])
+        datos = self.client.get(url, {'desde': self.respuestas[2].id}).json()
+        self.assertEqual(self.ids_del_fragmento(datos['html']), [r.id for r in self.respuestas[3:]])
+        self.assertEqual(datos['ultimo_id'], self.respuestas[4].id)
+
+        datos = self.client.get(url, {'desde': self.respuestas[4].id}).json()
+        self.assertEqual(datos['html'].strip(), '')
+        self.assertEqual(datos['ultimo_id'], self.respuestas[4].id)
+        # Un `desde` no numérico se trata como 0 y devuelve la primera tanda
+        datos = self.client.get(url, {'desde': 'x'}).json()
+        self.assertEqual(self.ids_del_fragmento(datos['html']), [r.id for r in self.respuestas[:2]])
+
+    def test_publicar_respuesta_no_pagina_las_existentes(self):
+        with mock.patch('miapp.views.paginar_keyset') as paginar:
+            respuesta = self.client.post(
+                reverse('miapp:detalle_hilo', args=[self.hilo.id]), {'contenido_respuesta': 'Nueva'}
+            )
+        self.assertRedirects(respuesta, reverse('miapp:detalle_hilo', args=[self.hilo.id]), fetch_redirect_response=False)
+        paginar.assert_not_called()
+        self.assertTrue(RespuestaForo.objects.filter(contenido='Nueva').exists())
+
+class VisitasConcurrentesTests(TransaccionalTestCase):
+
+    def setUp(self):
+        visitas.volcar_visitas()
+        usuario = crear_usuario('ana')
+        categoria = CategoriaForo.objects.create(nombre='General')
+        self.hilos = [crear_hilo(usuario, categoria) for _ in range(4)]
+
+    def tearDown(self):
+        visitas.volcar_visitas()
+        super().tearDown()
+
+    def test_hilos_concurrentes_no_pierden_visitas(self):
+        hilos_trabajo, sesiones_por_hilo = 8, 150
+        errores = []
+
+        def visitar():
+            try:
+                for _ in range(sesiones_por_hilo):
+                    for hilo in self.hilos:
+                        visitas.registrar_visita(SimpleNamespace(session={}), hilo.id)
+            except Exception as error:
+                errores.append(error)
+
+        # Con un máximo tan bajo los propios hilos vuelcan a la base de datos mientras otros siguen sumando
+        with mock.patch.object(visitas, 'VISITAS_MAX_PENDIENTES', 2):
+            trabajadores = [threading.Thread(target=visitar) for _ in range(hilos_trabajo)]
+            for trabajador in trabajadores:
+                trabajador.start()
+            for trabajador in trabajadores:
+                trabajador.join()
+        visitas.volcar_visitas()
+
+        self.assertEqual(errores, [])
+        for hilo in self.hilos:
+            hilo.refresh_from_db()
+            self.assertEqual(hilo.visitas, hilos_trabajo * sesiones_por_hilo)
+
+    def test_una_visita_por_sesion(self):
+        request = SimpleNamespace(session={})
+        self.assertTrue(visitas.registrar_visita(request, self.hilos[0].id))
+        self.assertFalse(visitas.registrar_visita(request, self.hilos[0].id))
+        self.assertEqual(visitas.volcar_visitas(), 1)
+
+    def test_un_fallo_al_volcar_no_rompe_la_peticion(self):
+        hilo_id = self.hilos[0].id
+        with mock.patch.object(visitas, 'VISITAS_MAX_PENDIENTES', 1), \
+                mock.patch.object(visitas.HiloForo.objects, 'filter', side_effect=RuntimeError('sin base de datos')), \
+                self.assertLogs('miapp.visitas', 'ERROR'):
+            self.assertTrue(visitas.registrar_visita(SimpleNamespace(session={}), hilo_id))
+        self.assertEqual(visitas.visitas_pendientes(hilo_id), 1)
+        self.assertEqual(visitas.volcar_visitas(), 1)
+
+    def test_temporizador_vuelca_sin_nuevas_peticiones(self):
+        with mock.patch.object(visitas, 'VISITAS_INTERVALO_VOLCADO', 0.05):
+            visitas.registrar_visita(SimpleNamespace(session={}), self.hilos[0].id)
+            limite = time.monotonic() + 5
+            while visitas.visitas_pendientes(self.hilos[0].id) and time.monotonic() < limite:
+                time.sleep(0.02)
+        time.sleep(0.1)  # Deja terminar el UPDATE del temporizador
+        self.hilos[0].refresh_from_db()
+        self.assertEqual(self.hilos[0].visitas, 1)
+
+
+class VotosTests(TestCase):
+
+    def setUp(self):
+        self.autor = crear_usuario('ana')
+        self.hilo = crear_hilo(self.autor)
+        self.respuesta = RespuestaForo.objects.create(hilo=self.hilo, contenido='uno', creado_por=self.autor)
+        self.votantes = [crear_usuario(f'votante{numero}') for numero in range(3)]
+
+    def contadores(self, objeto):
+        objeto.refresh_from_db()
+        return objeto.votos_positivos, objeto.votos_negativos
+
+    def test_votar_cambiar_y_retirar(self):
+        primero, segundo, _ = self.votantes
+        votos.votar(primero, 'hilo', self.hilo.id, 'positivo')
+        resultado = votos.votar(segundo, 'hilo', self.hilo.id, 'positivo')
+        self.assertEqual((resultado['votos_positivos'], resultado['votos_negativos']), (2, 0))
+
+        resultado = votos.votar(primero, 'hilo', self.hilo.id, 'negativo')
+        self.assertEqual(resultado['mi_voto'], 'negativo')
+        self.assertEqual(self.contadores(self.hilo), (1, 1))
+
+        votos.votar(primero, 'hilo', self.hilo.id, None)
+        self.assertEqual(self.contadores(self.hilo), (1, 0))
+        self.assertEqual(VotoHilo.objects.filter(hilo=self.hilo).count(), 1)
+
+    def test_repetir_el_mismo_voto_no_suma(self):
+        for _ in range(3):
+            votos.votar(self.votantes[0], 'respuesta', self.respuesta.id, 'positivo')
+        self.assertEqual(self.contadores(self.respuesta), (1, 0))
+
+    def test_voto_invalido_no_cambia_nada(self):
+        with self.assertRaises(votos.VotoInvalido):
+            votos.votar(self.votantes[0], 'hilo', self.hilo.id, 'enorme')
+        with self.assertRaises(votos.VotoInvalido):
+            votos.votar(self.votantes[0], 'encuesta', self.hilo.id, 'positivo')
+        with self.assertRaises(HiloForo.DoesNotExist):
+            votos.votar(self.votantes[0], 'hilo', self.hilo.id + 100, 'positivo')
+        self.assertEqual(self.contadores(self.hilo), (0, 0))
+
+    def test_lote_es_atomico(self):
+        lote = [
+            {'tipo_objeto': 'hilo', 'id': self.hilo.id, 'voto': 'positivo'},
+            {'tipo_objeto': 'respuesta', 'id': self.respuesta.id, 'voto': 'raro'},
+        ]
+        with self.assertRaises(votos.VotoInvalido):
+            votos.votar_lote(self.votantes[0], lote)
+        self.assertEqual(self.contadores(self.hilo), (0, 0))
+        self.assertFalse(VotoHilo.objects.exists())
+
+    def test_lote_se_aplica_en_orden_de_filas_y_responde_en_el_pedido(self):
+        otro = crear_hilo(self.autor, self.hilo.categoria)
+        lote = [
+            {'tipo_objeto': 'respuesta', 'id': self.respuesta.id, 'voto': 'negativo'},
+            {'tipo_objeto': 'hilo', 'id': otro.id, 'voto': 'positivo'},
+            {'tipo_objeto': 'hilo', 'id': self.hilo.id, 'voto': 'positivo'},
+        ]
+        aplicados = []
+        votar = votos.votar
+
+        def registrar(usuario, tipo_objeto, objeto_id, tipo_voto):
+            aplicados.append((tipo_objeto, objeto_id))
+            return votar(usuario, tipo_objeto, objeto_id, tipo_voto)
+
+        with mock.patch.object(votos, 'votar', registrar):
+            resultados = votos.votar_lote(self.votantes[0], lote)
+        self.assertEqual(aplicados, [('hilo', self.hilo.id), ('hilo', otro.id), ('respuesta', self.respuesta.id)])
+        self.assertEqual([(r['tipo_objeto'], r['id']) for r in resultados],
+                         [(v['tipo_objeto'], v['id']) for v in lote])
+
+    def test_lote_demasiado_grande(self):
+        self.client.force_login(self.votantes[0])
+        lote = [{'tipo_objeto': 'hilo', 'id': self.hilo.id, 'voto': 'positivo'}] * (votos.MAX_VOTOS_POR_LOTE + 1)
+        respuesta = self.client.post(reverse('miapp:votar_lote'), {'votos': lote}, content_type='application/json')
+        self.assertEqual(respuesta.status_code, 400)
+        self.assertFalse(VotoHilo.objects.exists())
+
+    def test_reconciliar_corrige_contadores_desviados(self):
+        for votante, tipo in zip(self.votantes, ('positivo', 'positivo', 'negativo')):
+            votos.votar(votante, 'hilo', self.hilo.id, tipo)
+        HiloForo.objects.filter(pk=self.hilo.pk).update(votos_positivos=40, votos_negativos=-3)
+        votos.reconciliar_contadores()
+        self.assertEqual(self.contadores(self.hilo), (2, 1))
+
+
+
+class BusquedaForoTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.ana = crear_usuario('ana')
+        cls.luis = crear_usuario('luis')
+        cls.general = CategoriaForo.objects.create(nombre='General')
+        cls.dudas = CategoriaForo.objects.create(nombre='Dudas')
+
+    def ids(self, texto, **filtros):
+        return [hilo.id for hilo in busqueda.buscar_hilos(texto, **filtros)]
+
+    def test_titulo_pesa_mas_que_contenido_y_que_respuestas(self):
+        en_respuesta = crear_hilo(self.ana, self.general, titulo='Otro tema', contenido='Nada que ver')
+        RespuestaForo.objects.create(hilo=en_respuesta, contenido='Me pasa con la ansiedad', creado_por=self.luis)
+        en_contenido = crear_hilo(self.ana, self.general, titulo='Consulta', contenido='Hablemos de la ansiedad')
+        en_titulo = crear_hilo(self.ana, self.general, titulo='Ansiedad en exámenes', contenido='Consulta')
+        crear_hilo(self.ana, self.general, titulo='Sin relación', contenido='Tampoco')
+
+        self.assertEqual(self.ids('ansiedad'), [en_titulo.id, en_contenido.id, en_respuesta.id])
+        # Sin tildes ni mayúsculas también coincide; un texto vacío no devuelve nada
+        self.assertEqual(self.ids('EXAMENES'), [en_titulo.id])
+        self.assertEqual(self.ids('   '), [])
+
+    def test_filtros_por_categoria_estado_y_autor(self):
+        abierto = crear_hilo(self.ana, self.general, titulo='Estrés')
+        cerrado = crear_hilo(self.ana, self.dudas, titulo='Estrés', estado='cerrado')
+        de_luis = crear_hilo(self.luis, self.general, titulo='Estrés')
+        crear_hilo(self.luis, self.general, titulo='Estrés', es_anonimo=True)
+
+        self.assertEqual(self.ids('estrés', categoria_id=self.dudas.id), [cerrado.id])
+        self.assertEqual(self.ids('estrés', estado='abierto', autor='ana'), [abierto.id])
+        # Los hilos anónimos no aparecen al buscar por su autor
+        self.assertEqual(self.ids('estrés', autor='luis'), [de_luis.id])
+
+    def test_la_vista_pasa_el_autor_a_la_busqueda(self):
+        de_ana = crear_hilo(self.ana, self.general, titulo='Sueño')
+        crear_hilo(self.luis, self.general, titulo='Sueño')
+        self.client.force_login(self.ana)
+        respuesta = self.client.get(reverse('miapp:buscar_foro'), {'q': 'sueño', 'autor': 'ana'})
+        self.assertEqual([hilo.id for hilo in respuesta.context['pagina']], [de_ana.id])
+        self.assertEqual(respuesta.context['autor_actual'], 'ana')
+
+    def test_el_indice_sigue_a_altas_ediciones_y_bajas(self):
+        hilo = crear_hilo(self.ana, self.general, titulo='Insomnio')
+        respuesta = RespuestaForo.objects.create(hilo=hilo, contenido='Prueba la meditación', creado_por=self.luis)
+        self.assertEqual(self.ids('insomnio'), [hilo.id])
+        self.assertEqual(self.ids('meditación'), [hilo.id])
+
+        hilo.titulo = 'Descanso'
+        hilo.save()
+        respuesta.contenido = 'Prueba la respiración'
+        respuesta.save()
+        self.assertEqual(self.ids('insomnio'), [])
+        self.assertEqual(self.ids('meditación'), [])
+        self.assertEqual(self.ids('descanso'), [hilo.id])
+        self.assertEqual(self.ids('respiración'), [hilo.id])
+
+        respuesta.delete()
+        self.assertEqual(self.ids('respiración'), [])
+        hilo.delete()
+        self.assertEqual(self.ids('descanso'), [])
+        with connection.cursor() as cursor:
+            cursor.execute(f'SELECT COUNT(*) FROM {busqueda.TABLA_FTS}')
+            self.assertEqual(cursor.fetchone()[0], 0)
+
+    def test_reconstruir_indice_recupera_filas_perdidas(self):
+        hilo = crear_hilo(self.ana, self.general, titulo='Motivación')
+        RespuestaForo.objects.create(hilo=hilo, contenido='Gracias', creado_por=self.luis)
+        with connection.cursor() as cursor:
+            cursor.execute(f'DELETE FROM {busqueda.TABLA_FTS}')
+        self.assertEqual(self.ids('motivación'), [])
+        self.assertEqual(busqueda.reconstruir_indice(), (1, 1))
+        self.assertEqual(self.ids('motivación'), [hilo.id])
+        self.assertEqual(self.ids('gracias'), [hilo.id])
+
+
+# ==================== ESTADÍSTICAS ====================
+
+class EstadisticasTests(TestCase):
+
+    def setUp(self):
+        self.usuario = crear_usuario('ana')
+        self.categoria = CategoriaForo.objects.create(nombre='General')
+
+    def valor(self, clave):
+        return Estadistica.objects.get(clave=clave).valor
+
+    def test_una_metrica_nueva_se_crea_antes_de_contarla(self):
+        crear_hilo(self.usuario, self.categoria)
+        recalcular = estadisticas._recalcular
+
+        def contar_con_la_fila_creada(clave):
+            # Con la fila ya creada, un alta concurrente suma sobre ella en lugar de perderse
+            self.assertTrue(Estadistica.objects.filter(clave=clave).exists())
+            return recalcular(clave)
+
+        with mock.patch.object(estadisticas, '_recalcular', contar_con_la_fila_creada):
+            self.assertEqual(estadisticas.leer_globales('hilos'), {'hilos': 1})
+        crear_hilo(self.usuario, self.categoria)
+        self.assertEqual(estadisticas.leer_globales('hilos'), {'hilos': 2})
+        self.assertEqual(estadisticas.leer_de_usuario(self.usuario.id, 'hilos'), {'hilos': 2})
+
+    def test_cambios_de_estado_sin_releer_la_fila(self):
+        hilo = crear_hilo(self.usuario, self.categoria)
+        self.assertEqual(estadisticas.leer_globales('hilos_abiertos'), {'hilos_abiertos': 1})
+
+        hilo.estado = 'cerrado'
+        with CaptureQueriesContext(connection) as consultas:
+            hilo.save()
+        self.assertFalse([c for c in consultas.captured_queries if c['sql'].startswith('SELECT')])
+        self.assertEqual(self.valor('hilos_abiertos'), 0)
+
+        # Una instancia recién cargada también conoce su estado guardado
+        hilo = HiloForo.objects.get(pk=hilo.pk)
+        hilo.estado = 'abierto'
+        hilo.save()
+        hilo.save()
+        self.assertEqual(self.valor('hilos_abiertos'), 1)
+
+    def test_guardar_sin_el_campo_cargado_no_altera_el_contador(self):
+        hilo = crear_hilo(self.usuario, self.categoria)
+        estadisticas.leer_globales('hilos_abiertos')
+        parcial = HiloForo.objects.only('id', 'titulo').get(pk=hilo.pk)
+        parcial.titulo = 'Otro título'
+        parcial.save()
+        HiloForo.objects.filter(pk=hilo.pk).update(estado='cerrado')
+        hilo.titulo = 'Tercer título'
+        hilo.save(update_fields=['titulo'])
+        self.assertEqual(self.valor('hilos_abiertos'), 1)
+
+    def test_responder_una_consulta_mueve_los_contadores(self):
+        consulta = FormularioContacto.objects.create(
+            usuario=self.usuario, tipo_consulta='duda', asunto='Hola', mensaje='¿Qué tal?'
+        )
+        clave = estadisticas.clave_usuario(self.usuario.id, 'consultas_respondidas')
+        estadisticas.leer_globales('consultas_sin_responder')
+        estadisticas.leer([clave])
+
+        consulta.respondido = True
+        consulta.save()
+        self.assertEqual(self.valor('consultas_sin_responder'), 0)
+        self.assertEqual(self.valor(clave), 1)
+
+        consulta.delete()
+        self.assertEqual(self.valor(clave), 0)
+        self.assertEqual(estadisticas.recontar_todo(), len(estadisticas.METRICAS_GLOBALES) + 1)
+        self.assertEqual(self.valor(clave), 0)
+
+# ==================== CACHÉ DE REFERENCIA ====================
+
+class CacheReferenciaTests(TestCase):
+
+    def setUp(self):
+        self.cargas = []
+        # Este proceso empieza sin nada memorizado, como un worker recién arrancado
+        self.enterContext(mock.patch.dict(cache_referencia._memo, clear=True))
+        self.enterContext(mock.patch.dict(cache_referencia._versiones, clear=True))
+
+    def cargar(self):
+        self.cargas.append(1)
+        return len(self.cargas)
+
+    def test_lectura_en_caliente_sin_consultas(self):
+        with mock.patch.object(cache_referencia, 'INTERVALO_VERSIONES', 60):
+            self.assertEqual(cache_referencia.obtener('prueba', self.cargar), 1)
+            categorias = cache_referencia.categorias_foro()
+            with self.assertNumQueries(0):
+                self.assertEqual(cache_referencia.obtener('prueba', self.cargar), 1)
+                self.assertIs(cache_referencia.categorias_foro(), categorias)
+
+    def test_invalidacion_de_otro_worker_obliga_a_recargar(self):
+        self.assertEqual(cache_referencia.obtener('prueba', self.cargar), 1)
+        self.assertEqual(cache_referencia.obtener('prueba', self.cargar), 1)
+        # Otra conexión a la caché hace de otro proceso: solo comparten el almacenamiento
+        otro_worker = caches.create_connection('referencia')
+        with mock.patch.object(cache_referencia, 'INTERVALO_VERSIONES', 60):
+            cache_referencia._refrescar_versiones()
+            otro_worker.set(cache_referencia.PREFIJO_VERSION + 'prueba', 'version-de-otro', timeout=None)
+            # Dentro del intervalo este proceso aún no se ha enterado
+            self.assertEqual(cache_referencia.obtener('prueba', self.cargar), 1)
+        self.assertEqual(cache_referencia.obtener('prueba', self.cargar), 2)
+        self.assertEqual(cache_referencia.obtener('prueba', self.cargar), 2)
+
+    def test_la_invalidacion_propia_se_ve_al_instante(self):
+        with mock.patch.object(cache_referencia, 'INTERVALO_VERSIONES', 60):
+            self.assertEqual(cache_referencia.obtener('prueba', self.cargar), 1)
+            cache_referencia.invalidar('prueba')
+            self.assertEqual(cache_referencia.obtener('prueba', self.cargar), 2)
+
+    def test_guardar_una_categoria_invalida_tras_el_commit(self):
+        antes = [categoria.nombre for categoria in cache_referencia.categorias_foro()]
+        with self.captureOnCommitCallbacks(execute=True):
+            CategoriaForo.objects.create(nombre='Nueva', orden=99)
+        self.assertEqual([categoria.nombre for categoria in cache_referencia.categorias_foro()], antes + ['Nueva'])
+
+
+# ==================== TIEMPO REAL ====================
+
+class EventosTiempoRealTests(TransaccionalTestCase):
+
+    def scope_sse(self, ruta, cookie):
+        return {
+            'type': 'http', 'asgi': {'version': '3.0'}, 'http_version': '1.1',
+            'method': 'GET', 'scheme': 'http', 'path': ruta, 'raw_path': ruta.encode(),
+            'query_string': b'', 'root_path': '',
+            'headers': [(b'host', b'testserver'), (b'cookie', f'{settings.SESSION_COOKIE_NAME}={cookie}'.encode())],
+            'client': ('127.0.0.1', 50000), 'server': ('testserver', 80),
+        }
+
+    async def test_flujo_asgi_recibe_la_respuesta_publicada(self):
+        usuario = await sync_to_async(crear_usuario)('ana')
+        hilo = await sync_to_async(crear_hilo)(usuario)
+        await self.async_client.aforce_login(usuario)
+        cookie = self.async_client.cookies[settings.SESSION_COOKIE_NAME].value
+
+        ruta = reverse('miapp:eventos_hilo', args=[hilo.id])
+        comunicador = ApplicationCommunicator(get_asgi_application(), self.scope_sse(ruta, cookie))
+        await comunicador.send_input({'type': 'http.request', 'body': b''})
+        inicio = await comunicador.receive_output(timeout=5)
+        self.assertEqual(inicio['status'], 200)
+        self.assertIn((b'Content-Type', b'text/event-stream'), inicio['headers'])
+        # El primer fragmento se envía ya suscrito al canal del hilo
+        primero = await comunicador.receive_output(timeout=5)
+        self.assertEqual(primero['body'], b'retry: 5000\n\n')
+        self.assertEqual(tiempo_real.difusor.conexiones, 1)
+
+        respuesta = await sync_to_async(RespuestaForo.objects.create)(
+            hilo=hilo, contenido='Hola', creado_por=usuario
+        )
+        fragmento = await comunicador.receive_output(timeout=5)
+        self.assertEqual(
+            fragmento['body'].decode(),
+            tiempo_real.formatear_evento({'tipo': 'respuesta', 'id': respuesta.id, 'hilo_id': hilo.id}),
+        )
+
+        await comunicador.send_input({'type': 'http.disconnect'})
+        await comunicador.wait(timeout=5)
+        self.assertEqual(tiempo_real.difusor.conexiones, 0)
+
+    def test_wsgi_responde_204_para_volver_al_sondeo(self):
+        usuario = crear_usuario('ana')
+        hilo = crear_hilo(usuario)
+        self.client.force_login(usuario)
+        self.assertEqual(self.client.get(reverse('miapp:eventos_foro')).status_code, 204)
+        self.assertEqual(self.client.get(reverse('miapp:eventos_hilo', args=[hilo.id])).status_code, 204)
+        self.assertEqual(self.client.get(reverse('miapp:eventos_hilo', args=[hilo.id + 100])).status_code, 404)
+
+
+# ==================== TEST PERSONALIZADO ====================
+
+class CuestionarioInstantaneaTests(TestCase):
+
+    def setUp(self):
+        crear_cuestionario()
+        self.paciente = crear_usuario('paciente')
+        self.enterContext(mock.patch.dict(cache_referencia._memo, clear=True))
+        self.enterContext(mock.patch.dict(cache_referencia._versiones, clear=True))
+        self.enterContext(mock.patch.object(cache_referencia, 'INTERVALO_VERSIONES', 60))
+
+    def peticion_get(self):
+        """GET de realizar_test con usuario, sesión y mensajes que no tocan la base de datos"""
+        peticion = RequestFactory().get(reverse('miapp:realizar_test'))
+        peticion.user = User.objects.select_related('userprofile').get(pk=self.paciente.pk)
+        peticion.session = SessionStore()
+        peticion._messages = default_storage(peticion)
+        return peticion
+
+    def test_get_del_test_sin_consultas_con_la_cache_caliente(self):
+        cuestionario = cuestionarios.actual()
+        peticion = self.peticion_get()
+        with self.assertNumQueries(0):
+            self.assertIs(cuestionarios.actual(), cuestionario)
+            respuesta = views.realizar_test(peticion)
+        self.assertEqual(respuesta.status_code, 200)
+        self.assertContains(respuesta, f'name="pregunta_{cuestionario.preguntas[-1].id}"')
+
+    def test_cambiar_una_opcion_recompila_la_instantanea(self):
+        antes = cuestionarios.actual()
+        with self.captureOnCommitCallbacks(execute=True):
+            opcion = OpcionRespuestaPersonalizado.objects.first()
+            opcion.puntaje = 9
+            opcion.save()
+        despues = cuestionarios.actual()
+        self.assertNotEqual(despues.huella, antes.huella)
+        self.assertEqual(despues.opciones[opcion.id].puntaje, 9)
+
+
+class EnvioTestTests(TestCase):
+
+    def setUp(self):
+        crear_cuestionario()
+        self.paciente = crear_usuario('paciente')
+        self.cuestionario = cuestionarios.actual()
+
+    def assertSinEscrituras(self):
+        self.assertFalse(ResultadoTestPersonalizado.objects.exists())
+        self.assertFalse(RespuestaTestPersonalizado.objects.exists())
+
+    def test_envio_completo_se_puntua_y_guarda_junto(self):
+        resultado = registrar_envio(self.paciente, envio_con_puntajes([3, 2, 1, 0, 3, 3]))
+        self.assertEqual(resultado.puntaje_total, 12)
+        self.assertEqual(resultado.respuestas.count(), 6)
+        self.assertIsNotNone(resultado.version_cuestionario_id)
+        self.assertIsNotNone(resultado.version_bandas_id)
+
+    def test_envio_incompleto(self):
+        datos = envio_con_puntajes([1] * 6)
+        datos.pop(f'pregunta_{self.cuestionario.preguntas[0].id}')
+        with self.assertRaisesMessage(EnvioInvalido, '1 pregunta(s) sin responder'):
+            registrar_envio(self.paciente, datos)
+        self.assertSinEscrituras()
+
+    def test_opcion_de_otra_pregunta(self):
+        datos = envio_con_puntajes([1] * 6)
+        primera, segunda = self.cuestionario.preguntas[:2]
+        datos[f'pregunta_{primera.id}'] = str(segunda.opciones[0].id)
+        with self.assertRaises(EnvioInvalido):
+            registrar_envio(self.paciente, datos)
+        self.assertSinEscrituras()
+
+    def test_pregunta_ajena_y_formato_invalido(self):
+        datos = envio_con_puntajes([1] * 6)
+        with self.assertRaises(EnvioInvalido):
+            registrar_envio(self.paciente, {**datos, 'pregunta_999999': datos[f'pregunta_{self.cuestionario.preguntas[0].id}']})
+        with self.assertRaises(EnvioInvalido):
+            registrar_envio(self.paciente, {**datos, f'pregunta_{self.cuestionario.preguntas[0].id}': 'x'})
+        self.assertSinEscrituras()
+
+    def test_cuestionario_cambiado_mientras_se_respondia(self):
+        datos = envio_con_puntajes([1] * 6)
+        with self.captureOnCommitCallbacks(execute=True):
+            PreguntaTestPersonalizado.objects.filter(numero=1).update(texto='Otra')
+            PreguntaTestPersonalizado.objects.get(numero=1).save()
+        with self.assertRaisesMessage(EnvioInvalido, 'se actualizó'):
+            registrar_envio(self.paciente, datos)
+        self.assertSinEscrituras()
+
+    def test_vista_redirige_al_resultado_o_de_vuelta_al_test(self):
+        self.client.force_login(self.paciente)
+        respuesta = self.client.post(reverse('miapp:realizar_test'), {'pregunta_1': '1'})
+        self.assertRedirects(respuesta, reverse('miapp:realizar_test'), fetch_redirect_response=False)
+        self.assertSinEscrituras()
+
+        respuesta = self.client.post(reverse('miapp:realizar_test'), envio_con_puntajes([0] * 6))
+        resultado = ResultadoTestPersonalizado.objects.get()
+        self.assertRedirects(respuesta, reverse('miapp:resultado_test', args=[resultado.id]), fetch_redirect_response=False)
+
+    def test_envio_parcial_desde_la_vista_se_rechaza_con_aviso(self):
+        # Antes las preguntas sin responder contaban como 0; ahora el envío vuelve al formulario
+        self.client.force_login(self.paciente)
+        datos = envio_con_puntajes([3] * 6)
+        for pregunta in self.cuestionario.preguntas[:2]:
+            datos.pop(f'pregunta_{pregunta.id}')
+        respuesta = self.client.post(reverse('miapp:realizar_test'), datos, follow=True)
+        self.assertRedirects(respuesta, reverse('miapp:realizar_test'))
+        self.assertContains(respuesta, 'Quedan 2 pregunta(s) sin responder.')
+        self.assertSinEscrituras()
+
+
+
+class BorradoresTests(TestCase):
+
+    def setUp(self):
+        crear_cuestionario()
+        self.cuestionario = cuestionarios.actual()
+        self.client.force_login(crear_usuario('paciente'))
+
+    def autoguardar(self, respuestas, version=None, **extra):
+        datos = {'version': version or self.cuestionario.huella, 'respuestas': respuestas, **extra}
+        return self.client.post(reverse('miapp:autoguardar_test'), datos, content_type='application/json')
+
+    def elegidas(self, puntajes):
+        """{pregunta_id: opcion_id} con la opción de cada puntaje, pregunta a pregunta"""
+        return {
+            str(pregunta.id): next(o.id for o in pregunta.opciones if o.puntaje == puntaje)
+            for pregunta, puntaje in zip(self.cuestionario.preguntas, puntajes)
+        }
+
+    def borrador_de_la_pagina(self):
+        return self.client.get(reverse('miapp:realizar_test')).context['borrador']
+
+    def test_el_borrador_se_guarda_por_cambios_y_se_recupera(self):
+        primeras = self.elegidas([3, 2, 1])
+        self.assertEqual(self.autoguardar(primeras).json(), {'guardadas': 3, 'total': 6})
+        primera = next(iter(primeras))
+        # null borra la respuesta; las demás se conservan entre envíos
+        self.assertEqual(self.autoguardar({primera: None}).json()['guardadas'], 2)
+        self.assertEqual(self.borrador_de_la_pagina(), {k: v for k, v in primeras.items() if k != primera})
+
+    def test_finalizar_corrige_el_borrador_y_lo_descarta(self):
+        self.autoguardar(self.elegidas([3, 2, 1]))
+        respuesta = self.autoguardar(self.elegidas([3, 2, 1, 0, 0, 1]), finalizar=True)
+        resultado = ResultadoTestPersonalizado.objects.get()
+        self.assertEqual(respuesta.json(), {'redirect': reverse('miapp:resultado_test', args=[resultado.id])})
+        self.assertEqual(resultado.puntaje_total, 7)
+        self.assertNotIn(borradores.CLAVE_SESION, self.client.session)
+
+    def test_finalizar_incompleto_conserva_el_borrador(self):
+        respuesta = self.autoguardar(self.elegidas([3, 2]), finalizar=True)
+        self.assertEqual(respuesta.status_code, 400)
+        self.assertIn('sin responder', respuesta.json()['error'])
+        self.assertEqual(len(self.borrador_de_la_pagina()), 2)
+        self.assertFalse(ResultadoTestPersonalizado.objects.exists())
+
+    def test_el_envio_normal_del_formulario_descarta_el_borrador(self):
+        self.autoguardar(self.elegidas([1]))
+        self.client.post(reverse('miapp:realizar_test'), envio_con_puntajes([1] * 6))
+        self.assertTrue(ResultadoTestPersonalizado.objects.exists())
+        self.assertNotIn(borradores.CLAVE_SESION, self.client.session)
+        self.assertEqual(self.borrador_de_la_pagina(), {})
+
+    def test_un_borrador_de_otra_version_del_test_se_rechaza(self):
+        self.autoguardar(self.elegidas([1, 1]))
+        respuesta = self.autoguardar(self.elegidas([2]), version='otra-huella')
+        self.assertEqual(respuesta.status_code, 400)
+        self.assertNotIn(borradores.CLAVE_SESION, self.client.session)
+
+        # Un borrador guardado con una huella que ya no es la vigente no se ofrece al volver a la página
+        self.autoguardar(self.elegidas([1, 1]))
+        sesion = self.client.session
+        sesion[borradores.CLAVE_SESION]['version'] = 'huella-anterior'
+        sesion.save()
+        self.assertEqual(self.borrador_de_la_pagina(), {})
+
+    def test_cambios_invalidos(self):
+        primera, segunda = self.cuestionario.preguntas[:2]
+        casos = (
+            {str(primera.id): segunda.opciones[0].id},
+            {str(primera.id): 'x'},
+            {'pregunta': primera.opciones[0].id},
+        )
+        for cambios in casos:
+            with self.subTest(cambios=cambios):
+                self.assertEqual(self.autoguardar(cambios).status_code, 400)
+        respuesta = self.client.post(reverse('miapp:autoguardar_test'), 'no es json', content_type='application/json')
+        self.assertEqual(respuesta.status_code, 400)
+        self.assertEqual(self.client.get(reverse('miapp:autoguardar_test')).status_code, 405)
+        self.assertNotIn(borradores.CLAVE_SESION, self.client.session)
+
+class ResultadosPasanteTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.pasante = crear_usuario('pasante', tipo='pasante')
+        for username in ('ana', 'anabel', 'bruno'):
+            paciente = crear_usuario(username)
+            for puntaje in (5, 30):
+                ResultadoTestPersonalizado.objects.create(paciente=paciente, puntaje_total=puntaje, diagnostico='-')
+
+    def pacientes_listados(self, filtro):
+        """(usuarios listados, SQL de las consultas sobre los resultados)"""
+        self.client.force_login(self.pasante)
+        with CaptureQueriesContext(connection) as consultas:
+            respuesta = self.client.get(reverse('miapp:ver_resultados_pasante'), {'paciente': filtro})
+        listado = [c['sql'] for c in consultas.captured_queries if 'FROM "miapp_resultadotestpersonalizado"' in c['sql']]
+        return sorted({resultado.paciente.username for resultado in respuesta.context['pagina']}), listado
+
+    def test_nombre_exacto_filtra_un_paciente_por_id(self):
+        pacientes, listado = self.pacientes_listados('ana')
+        self.assertEqual(pacientes, ['ana'])
+        self.assertTrue(listado)
+        for sql in listado:
+            self.assertIn('"paciente_id" IN', sql)
+            self.assertNotIn('LIKE', sql)
+
+    def test_prefijo_filtra_los_que_empiezan_asi(self):
+        self.assertEqual(self.pacientes_listados('an')[0], ['ana', 'anabel'])
+        self.assertEqual(self.pacientes_listados('nadie')[0], [])
+
+
+class CohorteTests(TestCase):
+
+    def test_totales_iguales_a_calcular_resumen_por_seccion(self):
+        rng = np.random.default_rng(0)
+        resultado_ids = rng.integers(1, 200, size=3000)
+        secciones = rng.choice(['A', 'B', 'C'], size=3000)
+        puntajes = rng.integers(0, 4, size=3000)
+        por_resultado = {}
+        for resultado_id, seccion, puntaje in zip(resultado_ids.tolist(), secciones.tolist(), puntajes.tolist()):
+            por_resultado.setdefault(resultado_id, []).append(SimpleNamespace(
+                pregunta=SimpleNamespace(seccion=seccion),
+                opcion_elegida=SimpleNamespace(puntaje=puntaje),
+            ))
+
+        cohorte = Cohorte(resultado_ids, secciones, puntajes)
+        self.assertEqual(len(cohorte), len(por_resultado))
+        for resultado_id, respuestas in por_resultado.items():
+            self.assertEqual(cohorte.resumen(resultado_id), calcular_resumen_por_seccion(respuestas))
+
+    def test_secciones_sin_respuestas_salen_a_cero(self):
+        cohorte = Cohorte([1, 1, 2], ['A', 'A', 'A'], [2, 1, 3])
+        self.assertEqual(cohorte.secciones.tolist(), ['A', 'B', 'C'])
+        self.assertEqual(cohorte.resumen(1), {'A': 3, 'B': 0, 'C': 0})
+        self.assertEqual(cohorte.resumen(99), calcular_resumen_por_seccion([]))
+        self.assertEqual(set(cohorte.percentiles()), {'A', 'B', 'C', 'total'})
+        self.assertEqual(cohorte.distribucion([2]).tolist(), [[0, 2], [2, 0], [2, 0]])
+
+    def test_cohorte_vacia(self):
+        cohorte = Cohorte.desde_resultados([])
+        self.assertEqual(len(cohorte), 0)
+        self.assertEqual(cohorte.percentiles(), {})
+        self.assertEqual(cohorte.resumen(1), {'A': 0, 'B': 0, 'C': 0})
+
+    def test_carga_por_lotes_igual_que_de_una_vez(self):
+        crear_cuestionario()
+        for numero, puntajes in enumerate(([3, 2, 1, 0, 0, 0], [0, 0, 0, 0, 3, 3], [1] * 6)):
+            registrar_envio(crear_usuario(f'paciente{numero}'), envio_con_puntajes(puntajes))
+        resultados = ResultadoTestPersonalizado.objects.values('id')
+
+        completa = Cohorte.desde_resultados(resultados)
+        with mock.patch('django.db.models.QuerySet.count', return_value=4):
+            # El COUNT se queda corto (llegaron respuestas después): los arrays crecen
+            por_lotes = Cohorte.desde_resultados(resultados, tamano_lote=4)
+        self.assertEqual(por_lotes.resultados.tolist(), completa.resultados.tolist())
+        self.assertEqual(por_lotes.totales.tolist(), completa.totales.tolist())
+        self.assertEqual(completa.total.tolist(), [6, 6, 6])
+
+    def test_vista_de_resultados_resume_la_cohorte_sin_releer_respuestas(self):
+        crear_cuestionario()
+        pasante = crear_usuario('pasante', tipo='pasante')
+        # Ejecutar los on_commit memoriza la VersionCuestionario, que se revierte al acabar el test
+        self.enterContext(mock.patch.dict(cuestionarios._versiones))
+        with self.captureOnCommitCallbacks(execute=True):
+            for username, puntajes in (('ana', [3, 2, 1, 0, 0, 0]), ('bruno', [0, 0, 0, 0, 3, 2])):
+                registrar_envio(crear_usuario(username), envio_con_puntajes(puntajes))
+        self.client.force_login(pasante)
+
+        # Sin paciente las cifras salen de los agregados diarios; las respuestas solo se leen en el prefetch
+        with CaptureQueriesContext(connection) as consultas:
+            respuesta = self.client.get(reverse('miapp:ver_resultados_pasante'))
+        lecturas = [c for c in consultas.captured_queries if 'FROM "miapp_respuestatestpersonalizado"' in c['sql']]
+        self.assertEqual(len(lecturas), 1)
+        self.assertEqual(
+            {r.paciente.username: r.resumen_secciones for r in respuesta.context['pagina']},
+            {'ana': {'A': 5, 'B': 1, 'C': 0}, 'bruno': {'A': 0, 'B': 0, 'C': 5}},
+        )
+        cohorte = respuesta.context['cohorte']
+        self.assertEqual(cohorte['total'], 2)
+        self.assertEqual(cohorte['percentiles'], {25: 5, 50: 5, 75: 6, 90: 6})
+        self.assertEqual(cohorte['secciones'], {'A': 2.5, 'B': 0.5, 'C': 2.5})
+        self.assertContains(respuesta, 'Media sección C: 2.5')
+
+        # Con paciente se resumen solo sus resultados, hasta el tope
+        respuesta = self.client.get(reverse('miapp:ver_resultados_pasante'), {'paciente': 'ana'})
+        cohorte = respuesta.context['cohorte']
+        self.assertEqual((cohorte['total'], cohorte['percentiles'][50]), (1, 6))
+        self.assertEqual(cohorte['secciones'], {'A': 5.0, 'B': 1.0})
+        self.assertFalse(respuesta.context['cohorte_acotada'])
+        with mock.patch('miapp.views.MAX_COHORTE_PACIENTE', 1):
+            respuesta = self.client.get(reverse('miapp:ver_resultados_pasante'), {'paciente': 'a'})
+        self.assertEqual(respuesta.context['cohorte']['total'], 1)
+        self.assertTrue(respuesta.context['cohorte_acotada'])
+
+
+class TendenciasTests(TestCase):
+
+    def setUp(self):
+        crear_cuestionario()
+        self.enterContext(mock.patch.dict(cuestionarios._versiones))
+
+    def registrar(self, username, puntajes, fecha):
+        with mock.patch('django.utils.timezone.now', return_value=fecha):
+            with self.captureOnCommitCallbacks(execute=True):
+                return registrar_envio(crear_usuario(username), envio_con_puntajes(puntajes))
+
+    def agregados(self):
+        filas = ResumenResultados.objects.order_by('periodo', 'inicio')
+        # Un periodo que se queda sin resultados conserva su fila vacía; reconstruir no la crea
+        for fila in filas.filter(total=0):
+            self.assertEqual((fila.suma_puntaje, fila.histograma, fila.por_banda, fila.suma_secciones), (0, {}, {}, {}))
+        return list(filas.exclude(total=0).values_list(
+            'periodo', 'inicio', 'total', 'suma_puntaje', 'histograma', 'por_banda', 'suma_secciones'
+        ))
+
+    def test_altas_y_bajas_incrementales_igual_que_reconstruir(self):
+        ahora = timezone.now()
+        resultados = [
+            self.registrar('ana', [3, 2, 1, 0, 0, 0], ahora),
+            self.registrar('bruno', [0, 0, 0, 0, 3, 2], ahora),
+            self.registrar('carla', [3, 3, 3, 3, 3, 3], ahora - timedelta(days=1)),
+            self.registrar('dario', [1, 1, 1, 1, 1, 1], ahora - timedelta(days=9)),
+            self.registrar('elena', [2, 2, 2, 2, 2, 2], ahora - timedelta(days=9)),
+        ]
+        for resultado in (resultados[1], resultados[3]):
+            with self.captureOnCommitCallbacks(execute=True):
+                resultado.delete()
+        incrementales = self.agregados()
+        self.assertEqual(sum(total for periodo, _, total, *_ in incrementales if periodo == 'dia'), 3)
+
+        tendencias.reconstruir(tamano_lote=2)
+        self.assertEqual(self.agregados(), incrementales)
+
+        # Borrar el único resultado de un día deja su fila vacía, que reconstruir elimina
+        with self.captureOnCommitCallbacks(execute=True):
+            resultados[2].delete()
+        incrementales = self.agregados()
+        tendencias.reconstruir()
+        self.assertEqual(self.agregados(), incrementales)
+        self.assertFalse(ResumenResultados.objects.filter(total=0).exists())
+
+
+
+class ExportacionTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        crear_cuestionario()
+        cls.pasante = crear_usuario('pasante', tipo='pasante')
+        cls.ana = registrar_envio(crear_usuario('ana'), envio_con_puntajes([3, 2, 1, 0, 0, 0]))
+        cls.bruno = registrar_envio(crear_usuario('bruno'), envio_con_puntajes([1] * 6))
+        cls.sin_respuestas = ResultadoTestPersonalizado.objects.create(
+            paciente=crear_usuario('carla'), puntaje_total=0, diagnostico='-'
+        )
+
+    def resultados(self):
+        return ResultadoTestPersonalizado.objects.all()
+
+    def test_csv_empieza_por_la_cabecera_sin_consultar(self):
+        generador = exportacion.generar_csv(self.resultados())
+        with self.assertNumQueries(0):
+            cabecera = next(generador)
+        self.assertEqual(cabecera, '\ufeff' + ','.join(exportacion.CABECERA_CSV) + '\r\n')
+        filas = list(csv.reader(io.StringIO(''.join(generador))))
+        # Una fila por respuesta y una más para el resultado sin respuestas
+        self.assertEqual(len(filas), 6 + 6 + 1)
+        self.assertTrue(all(len(fila) == len(exportacion.CABECERA_CSV) for fila in filas))
+
+    def test_varios_lotes_dan_lo_mismo_que_uno(self):
+        completo = ''.join(exportacion.generar_csv(self.resultados()))
+        with mock.patch.object(exportacion, 'TAMANO_LOTE_EXPORTACION', 4):
+            with mock.patch('django.db.models.QuerySet.iterator', autospec=True,
+                            side_effect=QuerySet.iterator) as iterador:
+                por_lotes = ''.join(exportacion.generar_csv(self.resultados()))
+        self.assertEqual(iterador.call_args.kwargs, {'chunk_size': 4})
+        self.assertEqual(por_lotes, completo)
+
+    def test_jsonl_agrupa_las_respuestas_de_cada_resultado(self):
+        with mock.patch.object(exportacion, 'TAMANO_LOTE_EXPORTACION', 4):
+            lineas = [json.loads(linea) for linea in exportacion.generar_jsonl(self.resultados())]
+        por_id = {linea['id']: linea for linea in lineas}
+        self.assertEqual(len(lineas), 3)
+        self.assertEqual(set(por_id), {self.ana.id, self.bruno.id, self.sin_respuestas.id})
+        self.assertEqual([r['numero'] for r in por_id[self.ana.id]['respuestas']], [1, 2, 3, 4, 5, 6])
+        self.assertEqual([r['puntaje'] for r in por_id[self.ana.id]['respuestas']], [3, 2, 1, 0, 0, 0])
+        self.assertEqual(por_id[self.ana.id]['paciente'], 'ana')
+        self.assertEqual(por_id[self.sin_respuestas.id]['respuestas'], [])
+
+    def test_vista_descarga_en_streaming(self):
+        self.client.force_login(self.pasante)
+        respuesta = self.client.get(reverse('miapp:exportar_resultados', args=['jsonl']), {'paciente': 'ana'})
+        self.assertTrue(respuesta.streaming)
+        self.assertEqual(respuesta['Content-Type'], 'application/x-ndjson; charset=utf-8')
+        self.assertIn('attachment;', respuesta['Content-Disposition'])
+        lineas = b''.join(respuesta.streaming_content).decode().splitlines()
+        self.assertEqual([json.loads(linea)['id'] for linea in lineas], [self.ana.id])
+        self.assertEqual(
+            self.client.get(reverse('miapp:exportar_resultados', args=['xml'])).status_code, 404
+        )
+
+class BandasTests(TestCase):
+
+    def setUp(self):
+        self.paciente = crear_usuario('paciente')
+        self.original = bandas.vigente().version_id
+
+    def nueva_version(self):
+        # Una a una (no bulk_create) para que las señales invaliden la caché de referencia
+        with self.captureOnCommitCallbacks(execute=True):
+            version = VersionBandas.objects.create(descripcion='Dos bandas')
+            BandaDiagnostico.objects.create(version=version, puntaje_maximo=30, codigo='bajo', diagnostico='Bajo')
+            BandaDiagnostico.objects.create(version=version, puntaje_maximo=None, codigo='alto', diagnostico='Alto')
+        return version
+
+    def crear_resultado(self, puntaje):
+        with self.captureOnCommitCallbacks(execute=True):
+            return ResultadoTestPersonalizado.objects.create(
+                paciente=self.paciente, puntaje_total=puntaje, version_bandas_id=self.original,
+                diagnostico=bandas.tabla(self.original).diagnostico(puntaje),
+            )
+
+    def test_el_maximo_de_cada_banda_esta_incluido(self):
+        tabla = bandas.vigente()
+        self.assertEqual([tabla.banda(p) for p in (0, 20, 21, 40, 60, 61, 80)],
+                         ['adecuado', 'adecuado', 'leve', 'leve', 'moderado', 'significativo', 'significativo'])
+
+    def test_reclasificar_aplica_la_version_y_se_puede_relanzar(self):
+        resultados = [self.crear_resultado(puntaje) for puntaje in (10, 30, 70)]
+        version = self.nueva_version()
+        self.assertEqual(bandas.vigente().version_id, version.id)
+
+        self.assertEqual(bandas.reclasificar(tamano_lote=1), 3)
+        for resultado in resultados:
+            resultado.refresh_from_db()
+            self.assertEqual(resultado.version_bandas_id, version.id)
+        self.assertEqual([r.diagnostico for r in resultados], ['Bajo', 'Bajo', 'Alto'])
+        self.assertEqual(bandas.reclasificar(), 0)
+
+    def test_tendencias_restan_de_la_banda_en_la_que_se_sumaron(self):
+        resultado = self.crear_resultado(10)
+        self.nueva_version()
+        fila = ResumenResultados.objects.get(periodo='dia')
+        # Los códigos de la versión anterior se siguen mostrando mientras cuenten resultados
+        self.assertEqual(tendencias.combinar([fila])['bandas'], {'bajo': 0, 'alto': 0, 'adecuado': 1})
+
+        with self.captureOnCommitCallbacks(execute=True):
+            resultado.delete()
+        fila.refresh_from_db()
+        self.assertEqual(fila.por_banda, {})
+        self.assertEqual(tendencias.combinar([fila])['bandas'], {'bajo': 0, 'alto': 0})
+
+    def test_reconstruir_usa_la_version_de_cada_resultado(self):
+        self.crear_resultado(10)
+        self.nueva_version()
+        tendencias.reconstruir()
+        self.assertEqual(ResumenResultados.objects.get(periodo='dia').por_banda, {'adecuado': 1})
+
+    def test_admin_bloquea_las_bandas_de_una_version_con_resultados(self):
+        peticion = RequestFactory().get('/')
+        peticion.user = User.objects.create_superuser('admin', 'admin@ejemplo.com')
+        inline = BandaDiagnosticoInline(VersionBandas, admin.site)
+        modelo_admin = VersionBandasAdmin(VersionBandas, admin.site)
+        original = VersionBandas.objects.get(pk=self.original)
+        nueva = self.nueva_version()
+
+        self.crear_resultado(10)
+        for permiso in (inline.has_add_permission, inline.has_change_permission, inline.has_delete_permission):
+            self.assertFalse(permiso(peticion, original))
+            self.assertTrue(permiso(peticion, nueva))
+        self.assertTrue(inline.has_view_permission(peticion, original))
+        self.assertFalse(modelo_admin.has_delete_permission(peticion, original))
+        self.assertTrue(modelo_admin.has_delete_permission(peticion, nueva))
+
+
+# ==================== TESTS GENÉRICOS ====================
+
+class TestsGenericosTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.usuario = crear_usuario('usuario')
+        cls.a = CategoriaRecurso.objects.create(nombre='A')
+        cls.b = CategoriaRecurso.objects.create(nombre='B')
+        cls.test = TestPsicologico.objects.create(nombre='Estrés', descripcion='-', instrucciones='-')
+        # {orden: [(valor, categoría)]}; se crean desordenadas para comprobar el orden por 'orden'
+        opciones = {3: [(2, cls.a), (0, cls.b)], 1: [(0, cls.a), (3, cls.b)],
+                    4: [(0, cls.a), (0, cls.b)], 2: [(1, cls.a), (2, cls.b)]}
+        cls.opciones = {}
+        for orden, valores in opciones.items():
+            pregunta = PreguntaTest.objects.create(test=cls.test, texto_pregunta=f'Pregunta {orden}', orden=orden)
+            cls.opciones[orden] = {
+                (valor, categoria.nombre): OpcionRespuesta.objects.create(
+                    pregunta=pregunta, texto_opcion=str(valor), valor=valor, categoria_recomendacion=categoria
+                )
+                for valor, categoria in valores
+            }
+
+    def envio(self, *elegidas):
+        """POST con la opción (valor, categoría) elegida en cada pregunta, por orden"""
+        return {
+            f'pregunta_{self.opciones[orden][eleccion].pregunta_id}': str(self.opciones[orden][eleccion].id)
+            for orden, eleccion in enumerate(elegidas, start=1)
+        }
+
+    def calificar(self, *elegidas):
+        definicion = tests_genericos.definicion(self.test.id)
+        total, categoria_id = tests_genericos.calificar(definicion, tests_genericos.leer_envio(self.envio(*elegidas)))
+        return total, CategoriaRecurso.objects.get(pk=categoria_id).nombre
+
+    def test_definicion_ordenada_por_orden(self):
+        definicion = tests_genericos.definicion(self.test.id)
+        self.assertEqual([p.orden for p in definicion.preguntas], [1, 2, 3, 4])
+        self.assertEqual([p.posicion for p in definicion.preguntas], [1, 2, 3, 4])
+        self.assertEqual(definicion.total, 4)
+        self.assertEqual(len(definicion.opciones), 8)
+
+    def test_gana_la_categoria_con_mas_puntuacion(self):
+        self.assertEqual(self.calificar((3, 'B'), (2, 'B'), (2, 'A'), (0, 'A')), (7, 'B'))
+
+    def test_a_igual_puntuacion_gana_la_mas_elegida(self):
+        self.assertEqual(self.calificar((3, 'B'), (1, 'A'), (2, 'A'), (0, 'A')), (6, 'A'))
+
+    def test_a_igualdad_total_gana_la_que_aparece_antes(self):
+        self.assertEqual(self.calificar((3, 'B'), (1, 'A'), (2, 'A'), (0, 'B')), (6, 'B'))
+
+    def test_envios_invalidos(self):
+        definicion = tests_genericos.definicion(self.test.id)
+        completo = tests_genericos.leer_envio(self.envio((0, 'A'), (1, 'A'), (2, 'A'), (0, 'A')))
+        primera, segunda = definicion.preguntas[0].id, definicion.preguntas[1].id
+        casos = {
+            'sin responder': {k: v for k, v in completo.items() if k != primera},
+            'no pertenecen al test': {**completo, 999999: completo[primera]},
+            'no corresponde a su pregunta': {**completo, primera: completo[segunda]},
+        }
+        for mensaje, elegidas in casos.items():
+            with self.subTest(mensaje), self.assertRaisesMessage(EnvioInvalido, mensaje):
+                tests_genericos.calificar(definicion, elegidas)
+        with self.assertRaises(EnvioInvalido):
+            tests_genericos.leer_envio({f'pregunta_{primera}': 'x'})
+
+    def test_vista_guarda_el_resultado_y_solo_su_usuario_lo_ve(self):
+        self.client.force_login(self.usuario)
+        url = reverse('miapp:realizar_test_generico', args=[self.test.id])
+        respuesta = self.client.post(url, self.envio((3, 'B'), (2, 'B'), (2, 'A'), (0, 'A')))
+        resultado = ResultadoTest.objects.get()
+        self.assertRedirects(respuesta, reverse('miapp:resultado_test_generico', args=[resultado.id]))
+        self.assertEqual((resultado.puntuacion_total, resultado.categoria_recomendada_id), (7, self.b.id))
+
+        self.client.force_login(crear_usuario('otro'))
+        self.assertEqual(self.client.get(reverse('miapp:resultado_test_generico', args=[resultado.id])).status_code, 404)
+
+    def test_vista_no_guarda_un_envio_incompleto(self):
+        self.client.force_login(self.usuario)
+        url = reverse('miapp:realizar_test_generico', args=[self.test.id])
+        datos = self.envio((3, 'B'), (2, 'B'), (2, 'A'))
+        self.assertRedirects(self.client.post(url, datos), url)
+        self.assertFalse(ResultadoTest.objects.exists())
+
+    def test_test_inactivo_o_sin_preguntas_no_existe(self):
+        vacio = TestPsicologico.objects.create(nombre='Vacío', descripcion='-', instrucciones='-')
+        tests_genericos.definicion(self.test.id)
+        self.test.es_activo = False
+        with self.captureOnCommitCallbacks(execute=True):
+            self.test.save()
+        self.client.force_login(self.usuario)
+        for test in (self.test, vacio):
+            url = reverse('miapp:realizar_test_generico', args=[test.id])
+            self.assertEqual(self.client.get(url).status_code, 404)
+
+
+
+class DefinicionDesfasadaTests(TransaccionalTestCase):
+    """Otro worker aún tiene en caché la definición de antes de borrar una categoría"""
+
+    def test_categoria_borrada_tras_cachear_la_definicion(self):
+        usuario = crear_usuario('usuario')
+        categoria = CategoriaRecurso.objects.create(nombre='A')
+        test = TestPsicologico.objects.create(nombre='Estrés', descripcion='-', instrucciones='-')
+        pregunta = PreguntaTest.objects.create(test=test, texto_pregunta='Pregunta', orden=1)
+        opcion = OpcionRespuesta.objects.create(
+            pregunta=pregunta, texto_opcion='Sí', valor=1, categoria_recomendacion=categoria
+        )
+        desfasada = tests_genericos.definicion(test.id)
+        categoria.delete()
+
+        with mock.patch.object(tests_genericos, 'definicion', return_value=desfasada), \
+                mock.patch.object(cache_referencia, 'invalidar') as invalidar:
+            with self.assertRaisesMessage(EnvioInvalido, 'se actualizó'):
+                tests_genericos.registrar_resultado(usuario, test.id, {f'pregunta_{pregunta.id}': str(opcion.id)})
+        invalidar.assert_called_once_with('tests_psicologicos')
+        self.assertFalse(ResultadoTest.objects.exists())
+
+# ==================== RECOMENDACIONES ====================
+
+class RecomendacionesTests(TestCase):
+
+    def setUp(self):
+        self.paciente = crear_usuario('paciente')
+        self.original = VersionBandas.objects.get(pk=bandas.vigente().version_id)
+        self.recursos = {}
+        for nombre in ('relajacion', 'apoyo'):
+            categoria = CategoriaRecurso.objects.create(nombre=nombre)
+            self.recursos[nombre] = (Recurso.objects.create(
+                titulo=nombre, descripcion='-', tipo_recurso='articulo', categoria=categoria, creado_por=self.paciente
+            ),)
+        with self.captureOnCommitCallbacks(execute=True):
+            adecuado = self.original.bandas.get(codigo='adecuado')
+            adecuado.categoria_recurso = self.recursos['relajacion'][0].categoria
+            adecuado.save()
+            # La versión nueva manda los puntajes bajos a otra categoría
+            nueva = VersionBandas.objects.create(descripcion='Nueva')
+            BandaDiagnostico.objects.create(
+                version=nueva, puntaje_maximo=30, codigo='bajo', diagnostico='Bajo',
+                categoria_recurso=self.recursos['apoyo'][0].categoria
+            )
+            BandaDiagnostico.objects.create(version=nueva, puntaje_maximo=None, codigo='alto', diagnostico='Alto')
+        self.resultado = ResultadoTestPersonalizado.objects.create(
+            paciente=self.paciente, puntaje_total=10, version_bandas=self.original, diagnostico='-'
+        )
+
+    def test_de_puntaje_usa_la_version_del_resultado(self):
+        actuales = recomendaciones.actuales()
+        self.assertEqual(actuales.de_puntaje(10, self.original.id), self.recursos['relajacion'])
+        self.assertEqual(actuales.de_puntaje(10), self.recursos['apoyo'])
+        # Banda sin categoría: los más recientes de todas
+        self.assertEqual(actuales.de_puntaje(50, self.original.id), actuales.generales)
+
+    def test_paginas_del_resultado_recomiendan_su_banda(self):
+        self.assertEqual(recomendaciones.para_usuario(self.paciente), self.recursos['relajacion'])
+        self.client.force_login(self.paciente)
+        respuesta = self.client.get(reverse('miapp:resultado_test', args=[self.resultado.id]))
+        self.assertEqual(respuesta.context['recursos_recomendados'], self.recursos['relajacion'])
+
+
+# ==================== ARCHIVOS SUBIDOS ====================
+
+class MediosTests(TestCase):
+
+    CONTENIDO = b'0123456789abcdef'
+
+    def setUp(self):
+        media = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media)
+        self.enterContext(self.settings(MEDIA_ROOT=media))
+        for ruta in ('recursos/guia.txt', 'contenido_personalizado/plan.txt', 'subidas_parciales/a/datos'):
+            os.makedirs(os.path.join(media, os.path.dirname(ruta)), exist_ok=True)
+            with open(os.path.join(media, ruta), 'wb') as archivo:
+                archivo.write(self.CONTENIDO)
+        self.paciente = crear_usuario('paciente')
+        ContenidoPersonalizado.objects.create(
+            pasante=crear_usuario('pasante', tipo='pasante'), paciente=self.paciente, titulo='Plan',
+            descripcion='-', tipo_contenido='articulo', archivo='contenido_personalizado/plan.txt'
+        )
+
+    def get(self, ruta, **cabeceras):
+        return self.client.get(settings.MEDIA_URL + ruta, headers=cabeceras)
+
+    def test_archivo_completo_con_validadores(self):
+        respuesta = self.get('recursos/guia.txt')
+        self.assertEqual(respuesta.status_code, 200)
+        self.assertEqual(b''.join(respuesta.streaming_content), self.CONTENIDO)
+        self.assertEqual(respuesta['Accept-Ranges'], 'bytes')
+        self.assertEqual(respuesta['Cache-Control'], 'public, max-age=3600')
+        self.assertIn('ETag', respuesta)
+        self.assertIn('Last-Modified', respuesta)
+
+    def test_rangos(self):
+        casos = {
+            'bytes=2-5': (206, b'2345', 'bytes 2-5/16'),
+            'bytes=-3': (206, b'def', 'bytes 13-15/16'),
+            'bytes=14-100': (206, b'ef', 'bytes 14-15/16'),
+            'bytes=0-1,4-5': (200, self.CONTENIDO, None),
+        }
+        for rango, (estado, cuerpo, content_range) in casos.items():
+            with self.subTest(rango):
+                respuesta = self.get('recursos/guia.txt', Range=rango)
+                self.assertEqual(respuesta.status_code, estado)
+                self.assertEqual(b''.join(respuesta.streaming_content), cuerpo)
+                self.assertEqual(respuesta.get('Content-Range'), content_range)
+
+        respuesta = self.get('recursos/guia.txt', Range='bytes=16-')
+        self.assertEqual((respuesta.status_code, respuesta['Content-Range']), (416, 'bytes */16'))
+
+    def test_if_range_de_otra_version_da_el_archivo_completo(self):
+        etag = self.get('recursos/guia.txt')['ETag']
+        self.assertEqual(self.get('recursos/guia.txt', Range='bytes=0-1', If_Range=etag).status_code, 206)
+        self.assertEqual(self.get('recursos/guia.txt', Range='bytes=0-1', If_Range='"otro"').status_code, 200)
+
+    def test_304_con_etag_y_last_modified(self):
+        completa = self.get('recursos/guia.txt')
+        for cabeceras in ({'If-None-Match': completa['ETag']}, {'If-Modified-Since': completa['Last-Modified']}):
+            with self.subTest(cabeceras):
+                respuesta = self.get('recursos/guia.txt', **cabeceras)
+                self.assertEqual(respuesta.status_code, 304)
+                self.assertEqual(respuesta['ETag'], completa['ETag'])
+                self.assertEqual(respuesta['Last-Modified'], completa['Last-Modified'])
+                self.assertEqual(respuesta['Cache-Control'], completa['Cache-Control'])
+
+    def test_contenido_personalizado_solo_para_su_paciente_y_pasantes(self):
+        ruta = 'contenido_personalizado/plan.txt'
+        self.assertEqual(self.get(ruta).status_code, 404)
+        for usuario, estado in ((crear_usuario('otro'), 404), (self.paciente, 200),
+                                (crear_usuario('otro_pasante', tipo='pasante'), 200)):
+            with self.subTest(usuario.username):
+                self.client.force_login(usuario)
+                respuesta = self.get(ruta)
+                self.assertEqual(respuesta.status_code, estado)
+        self.assertEqual(respuesta['Cache-Control'], 'private, no-cache')
+
+    def test_rutas_no_canonicas_no_saltan_los_permisos(self):
+        self.client.force_login(crear_usuario('otro'))
+        for ruta in (
+            'recursos/../contenido_personalizado/plan.txt',
+            'recursos/%2e%2e/contenido_personalizado/plan.txt',
+            './contenido_personalizado/plan.txt',
+            'recursos//../contenido_personalizado/plan.txt',
+            'recursos/..%5ccontenido_personalizado/plan.txt',
+            'recursos/../subidas_parciales/a/datos',
+            'subidas_parciales/a/datos',
+            './recursos/guia.txt',
+            '../media/recursos/guia.txt',
+        ):
+            with self.subTest(ruta):
+                self.assertEqual(self.get(ruta).status_code, 404)
+
+
+class SubidasTests(TestCase):
+
+    def setUp(self):
+        media = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media)
+        self.enterContext(self.settings(MEDIA_ROOT=media))
+        self.addCleanup(subidas._hashes.clear)
+        self.pasante = crear_usuario('pasante', tipo='pasante')
+
+    def agregar(self, subida, offset, datos, longitud=None):
+        return subidas.agregar_fragmento(subida, offset, io.BytesIO(datos), len(datos) if longitud is None else longitud)
+
+    def test_offsets_y_hash_final(self):
+        subida = subidas.iniciar(self.pasante, 'datos.bin', 10)
+        self.assertEqual(self.agregar(subida, 0, b'01234'), 5)
+        with self.assertRaises(subidas.OffsetIncorrecto) as error:
+            self.agregar(subida, 3, b'34567')
+        self.assertEqual(error.exception.recibido, 5)
+        with self.assertRaisesMessage(subidas.SubidaInvalida, 'sobrepasa el tamaño declarado'):
+            self.agregar(subida, 5, b'567890')
+        with self.assertRaisesMessage(subidas.SubidaInvalida, 'Faltan 5 bytes'):
+            subidas.finalizar(subida)
+
+        self.assertEqual(self.agregar(subida, 5, b'56789'), 10)
+        with self.assertRaisesMessage(subidas.SubidaInvalida, 'no coincide'):
+            subidas.finalizar(subida, '0' * 64)
+        subidas.finalizar(subida, hashlib.sha256(b'0123456789').hexdigest().upper())
+        self.assertEqual(SubidaParcial.objects.get().sha256, hashlib.sha256(b'0123456789').hexdigest())
+        with self.assertRaisesMessage(subidas.SubidaInvalida, 'ya está finalizada'):
+            self.agregar(subida, 10, b'x')
+
+    def test_el_hash_se_rehace_desde_el_disco(self):
+        # Como si el siguiente fragmento lo recibiera otro proceso, sin el hash en memoria
+        subida = subidas.iniciar(self.pasante, 'datos.bin', 6)
+        self.agregar(subida, 0, b'abc')
+        subidas._hashes.clear()
+        self.agregar(subida, 3, b'def')
+        subidas._hashes.clear()
+        self.assertEqual(subidas.finalizar(subida).sha256, hashlib.sha256(b'abcdef').hexdigest())
+
+    def test_fragmento_cortado_conserva_lo_escrito(self):
+        subida = subidas.iniciar(self.pasante, 'datos.bin', 6)
+        with self.assertRaisesMessage(subidas.SubidaInvalida, 'incompleto'):
+            self.agregar(subida, 0, b'abc', longitud=5)
+        self.assertEqual(SubidaParcial.objects.get().recibido, 3)
+        self.agregar(subida, 3, b'def')
+        self.assertEqual(subidas.finalizar(subida).sha256, hashlib.sha256(b'abcdef').hexdigest())
+
+    def test_el_memo_de_hashes_no_crece_sin_limite(self):
+        lista = [subidas.iniciar(self.pasante, f'{i}.bin', 4) for i in range(3)]
+        with mock.patch.object(subidas, 'MEMO_HASHES_MAXIMO', 2):
+            for subida in lista:
+                self.agregar(subida, 0, b'ab')
+        self.assertEqual(list(subidas._hashes), [lista[1].id, lista[2].id])
+
+        # Un fragmento mucho después olvida las subidas que no han recibido nada desde entonces
+        despues = time.monotonic() + subidas.MEMO_HASHES_SEGUNDOS + 1
+        with mock.patch.object(subidas.time, 'monotonic', return_value=despues):
+            self.agregar(lista[2], 2, b'cd')
+        self.assertEqual(list(subidas._hashes), [lista[2].id])
+        # Una subida olvidada sigue: su hash se rehace desde el parcial
+        self.agregar(lista[0], 2, b'cd')
+        self.assertEqual(subidas.finalizar(lista[0]).sha256, hashlib.sha256(b'abcd').hexdigest())
+
+    def subir_por_http(self, datos):
+        respuesta = self.client.post(
+            reverse('miapp:iniciar_subida'), {'nombre': 'plan.pdf', 'tamano': len(datos)}, content_type='application/json'
+        )
+        subida_id = respuesta.json()['id']
+        url = reverse('miapp:subida_fragmentada', args=[subida_id])
+        mitad = len(datos) // 2
+        self.assertEqual(self.client.put(f'{url}?offset=0', datos[:mitad], content_type='application/octet-stream').json(),
+                         {'recibido': mitad})
+        repetido = self.client.put(f'{url}?offset=0', datos[mitad:], content_type='application/octet-stream')
+        self.assertEqual((repetido.status_code, repetido.json()['recibido']), (409, mitad))
+        self.client.put(f'{url}?offset={mitad}', datos[mitad:], content_type='application/octet-stream')
+        self.assertEqual(self.client.get(url).json(), {'recibido': len(datos), 'tamano': len(datos), 'finalizada': False})
+        finalizada = self.client.post(
+            reverse('miapp:finalizar_subida', args=[subida_id]),
+            {'sha256': hashlib.sha256(datos).hexdigest()}, content_type='application/json'
+        )
+        self.assertEqual(finalizada.status_code, 200)
+        return subida_id
+
+    def test_un_formulario_invalido_no_consume_la_subida(self):
+        self.client.force_login(self.pasante)
+        paciente = crear_usuario('paciente')
+        subida_id = self.subir_por_http(b'contenido del plan')
+        url = reverse('miapp:subir_contenido_personalizado', args=[paciente.id])
+        formulario = {'descripcion': '-', 'tipo_contenido': 'articulo', 'archivo_subida': subida_id}
+
+        self.assertRedirects(self.client.post(url, formulario), url)
+        self.assertTrue(SubidaParcial.objects.filter(pk=subida_id).exists())
+        self.assertTrue(os.path.exists(subidas.ruta_parcial(subida_id)))
+
+        self.client.post(url, {**formulario, 'titulo': 'Plan'})
+        contenido = ContenidoPersonalizado.objects.get()
+        nombre = contenido.archivo.name
+        self.assertTrue(nombre.startswith('contenido_personalizado/'))
+        self.assertTrue(nombre.endswith(hashlib.sha256(b'contenido del plan').hexdigest() + '.pdf'))
+        with contenido.archivo.open('rb') as archivo:
+            self.assertEqual(archivo.read(), b'contenido del plan')
+        self.assertFalse(SubidaParcial.objects.exists())
+        self.assertEqual(ArchivoContenido.objects.get(nombre=nombre).referencias, 1)
+
+    def mensajes(self, respuesta):
+        return [str(mensaje) for mensaje in get_messages(respuesta.wsgi_request)]
+
+    def subida_finalizada(self, usuario, nombre, datos):
+        subida = subidas.iniciar(usuario, nombre, len(datos))
+        self.agregar(subida, 0, datos)
+        return str(subidas.finalizar(subida).id)
+
+    def test_una_portada_invalida_no_adjunta_el_archivo(self):
+        admin = crear_usuario('admin', tipo='admin')
+        self.client.force_login(admin)
+        formulario = {
+            'crear_recurso': '1', 'titulo': 'Guía', 'descripcion': '-', 'tipo_recurso': 'articulo',
+            'categoria': CategoriaRecurso.objects.create(nombre='Sueño').id,
+            'archivo_subida': self.subida_finalizada(admin, 'guia.pdf', b'%PDF guia'),
+            'imagen_portada_subida': self.subida_finalizada(admin, 'portada.png', b'no es una imagen'),
+        }
+        respuesta = self.client.post(reverse('miapp:admin_gestion_recursos'), formulario)
+        self.assertIn('La imagen no es válida o está dañada', self.mensajes(respuesta))
+        self.assertFalse(Recurso.objects.exists())
+        self.assertFalse(ArchivoContenido.objects.exists())
+        self.assertEqual(SubidaParcial.objects.count(), 2)
+        self.assertTrue(os.path.exists(subidas.ruta_parcial(formulario['archivo_subida'])))
+
+        # Con una portada válida se reutiliza la subida del archivo que no se llegó a adjuntar
+        formulario['imagen_portada_subida'] = self.subida_finalizada(admin, 'portada.png', png(40))
+        self.client.post(reverse('miapp:admin_gestion_recursos'), formulario)
+        recurso = Recurso.objects.get()
+        self.assertTrue(recurso.archivo.name.startswith('recursos/'))
+        self.assertTrue(recurso.imagen_portada.name.startswith('portadas/'))
+        self.assertEqual(SubidaParcial.objects.filter(nombre_original='portada.png').count(), 1)
+
+    def test_las_portadas_del_pasante_se_verifican_con_pillow(self):
+        self.client.force_login(self.pasante)
+        formulario = {
+            'crear_recurso': '1', 'titulo': 'Guía', 'descripcion': '-', 'tipo_recurso': 'articulo',
+            'categoria': CategoriaRecurso.objects.create(nombre='Sueño').id, 'enlace': 'https://ejemplo.com/guia',
+        }
+        url = reverse('miapp:pasante_gestion_recursos')
+        # Cabecera PNG correcta pero datos cortados
+        cortada = self.subida_finalizada(self.pasante, 'portada.png', png(40)[:60])
+        respuesta = self.client.post(url, {**formulario, 'imagen_portada_subida': cortada})
+        self.assertIn('La imagen no es válida o está dañada', self.mensajes(respuesta))
+        respuesta = self.client.post(url, {**formulario, 'imagen_portada': ContentFile(b'texto', name='portada.png')})
+        self.assertIn('La imagen no es válida o está dañada', self.mensajes(respuesta))
+        self.assertFalse(Recurso.objects.exists())
+        self.assertTrue(SubidaParcial.objects.filter(pk=cortada).exists())
+
+        valida = self.subida_finalizada(self.pasante, 'portada.png', png(40))
+        self.client.post(url, {**formulario, 'imagen_portada_subida': valida})
+        self.assertTrue(Recurso.objects.get().imagen_portada.name.startswith('portadas/'))
+
+
+class ReferenciasArchivosTests(TestCase):
+
+    CONTENIDO = b'%PDF guia de respiracion'
+
+    def setUp(self):
+        media = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media)
+        self.enterContext(self.settings(MEDIA_ROOT=media))
+        self.usuario = crear_usuario('admin', tipo='admin')
+        self.categoria = CategoriaRecurso.objects.create(nombre='Respiración')
+
+    def crear_recurso(self, contenido=CONTENIDO):
+        with self.captureOnCommitCallbacks(execute=True):
+            return Recurso.objects.create(
+                titulo='Guía', descripcion='-', tipo_recurso='articulo', categoria=self.categoria,
+                creado_por=self.usuario, archivo=ContentFile(contenido, name='guia.pdf')
+            )
+
+    def borrar(self, recurso):
+        with self.captureOnCommitCallbacks(execute=True):
+            recurso.delete()
+
+    def referencias(self, nombre):
+        return ArchivoContenido.objects.filter(nombre=nombre).values_list('referencias', flat=True).first()
+
+    def existe(self, nombre):
+        return almacenamiento.por_contenido().exists(nombre)
+
+    def test_el_mismo_contenido_se_comparte_y_se_borra_con_el_ultimo_uso(self):
+        primero, segundo = self.crear_recurso(), self.crear_recurso()
+        nombre = primero.archivo.name
+        self.assertEqual(segundo.archivo.name, nombre)
+        self.assertEqual(self.referencias(nombre), 2)
+
+        self.borrar(primero)
+        self.assertEqual(self.referencias(nombre), 1)
+        self.assertTrue(self.existe(nombre))
+        self.borrar(segundo)
+        self.assertIsNone(self.referencias(nombre))
+        self.assertFalse(self.existe(nombre))
+
+    def test_cambiar_el_archivo_libera_el_anterior(self):
+        recurso = self.crear_recurso()
+        anterior = recurso.archivo.name
+        recurso.archivo = ContentFile(b'otra version', name='guia.pdf')
+        with self.captureOnCommitCallbacks(execute=True):
+            recurso.save()
+        self.assertFalse(self.existe(anterior))
+        self.assertEqual(self.referencias(recurso.archivo.name), 1)
+
+    def test_una_subida_que_reutiliza_el_archivo_impide_su_borrado_pendiente(self):
+        recurso = self.crear_recurso()
+        nombre = recurso.archivo.name
+        with self.captureOnCommitCallbacks() as pendientes:
+            recurso.delete()
+        self.assertEqual(self.referencias(nombre), 0)
+
+        # La misma subida llega antes de que se ejecute el borrado de tras el commit
+        self.assertEqual(almacenamiento.por_contenido().save('recursos/otra.pdf', ContentFile(self.CONTENIDO)), nombre)
+        for callback in pendientes:
+            callback()
+        self.assertTrue(self.existe(nombre))
+        self.assertEqual(self.referencias(nombre), 0)
+        self.assertEqual(self.crear_recurso().archivo.name, nombre)
+        self.assertEqual(self.referencias(nombre), 1)
+
+    def test_un_archivo_borrado_se_vuelve_a_colocar_al_subirlo(self):
+        recurso = self.crear_recurso()
+        nombre = recurso.archivo.name
+        self.borrar(recurso)
+        self.assertEqual(self.crear_recurso().archivo.name, nombre)
+        self.assertTrue(self.existe(nombre))
+        self.assertEqual(self.referencias(nombre), 1)
+
+    def test_purga_de_subidas_que_nadie_llego_a_usar(self):
+        nombre = almacenamiento.por_contenido().save('recursos/suelto.pdf', ContentFile(b'sin formulario'))
+        self.assertEqual(almacenamiento.purgar_sin_referencias(), 0)
+        ArchivoContenido.objects.filter(nombre=nombre).update(actualizado_en=timezone.now() - timedelta(days=2))
+        self.assertEqual(almacenamiento.purgar_sin_referencias(), 1)
+        self.assertFalse(self.existe(nombre))
+        self.assertFalse(ArchivoContenido.objects.exists())
+
+    def test_recontar_corrige_las_cuentas_desde_los_modelos(self):
+        usado = self.crear_recurso().archivo.name
+        self.crear_recurso()
+        suelto = almacenamiento.por_contenido().save('recursos/suelto.pdf', ContentFile(b'sin formulario'))
+        ArchivoContenido.objects.update(referencias=5)
+
+        salida = io.StringIO()
+        call_command('recontar_archivos', stdout=salida)
+        self.assertIn('2 archivos', salida.getvalue())
+        self.assertEqual((self.referencias(usado), self.referencias(suelto)), (2, 0))
+        self.assertEqual(almacenamiento.recontar_referencias(), 0)
+
+
+class VariantesPortadaTests(TestCase):
+
+    def setUp(self):
+        media = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media)
+        self.enterContext(self.settings(MEDIA_ROOT=media))
+        # El pool de hilos no ve la transacción del test: se procesa a mano con procesar_recurso
+        self.encolar = self.enterContext(mock.patch.object(imagenes, 'encolar'))
+        self.usuario = crear_usuario('admin', tipo='admin')
+        self.categoria = CategoriaRecurso.objects.create(nombre='Relajación')
+
+    def png(self, ancho, color=(30, 120, 200)):
+        return ContentFile(png(ancho, color=color), name='portada.png')
+
+    def crear_recurso(self, portada):
+        with self.captureOnCommitCallbacks(execute=True):
+            recurso = Recurso.objects.create(
+                titulo='Guía', descripcion='-', tipo_recurso='articulo', categoria=self.categoria,
+                creado_por=self.usuario, imagen_portada=portada
+            )
+        self.assertTrue(imagenes.procesar_recurso(recurso.pk))
+        recurso.refresh_from_db()
+        return recurso
+
+    def abrir(self, ruta):
+        with imagenes.almacenamiento_portadas().open(ruta, 'rb') as archivo:
+            imagen = Image.open(io.BytesIO(archivo.read()))
+            imagen.load()
+            return imagen
+
+    def anchos(self, recurso, formato='webp'):
+        return [ancho for ancho, _ in recurso.variantes_portada[formato]]
+
+    def test_anchos_de_las_variantes(self):
+        recurso = self.crear_recurso(self.png(800))
+        self.encolar.assert_called_once_with(recurso.pk)
+        self.assertEqual(recurso.variantes_portada['origen'], recurso.imagen_portada.name)
+        for formato in imagenes.FORMATOS:
+            self.assertEqual(self.anchos(recurso, formato), [320, 640, 800])
+            for ancho, ruta in recurso.variantes_portada[formato]:
+                self.assertEqual(self.abrir(ruta).width, ancho)
+
+    def test_una_portada_pequena_no_se_amplia(self):
+        recurso = self.crear_recurso(self.png(200))
+        self.assertEqual(self.anchos(recurso), [200])
+        self.assertEqual(self.abrir(recurso.variantes_portada['jpeg'][0][1]).size, (200, 100))
+
+    def test_las_variantes_no_llevan_exif(self):
+        portada = self.png(800)
+        recurso = self.crear_recurso(portada)
+        self.assertIn(0x010F, self.abrir(recurso.imagen_portada.name).getexif())
+        for ruta in imagenes.rutas(recurso.variantes_portada):
+            imagen = self.abrir(ruta)
+            self.assertFalse(imagen.getexif())
+            self.assertNotIn('icc_profile', imagen.info)
+
+    def test_origen_indica_si_las_variantes_estan_al_dia(self):
+        recurso = self.crear_recurso(self.png(800))
+        self.assertFalse(imagenes.procesar_recurso(recurso.pk))
+
+        recurso.imagen_portada = self.png(500, color=(200, 30, 30))
+        with self.captureOnCommitCallbacks(execute=True):
+            recurso.save()
+        self.assertEqual(self.encolar.call_count, 2)
+        previas = imagenes.rutas(recurso.variantes_portada)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertTrue(imagenes.procesar_recurso(recurso.pk))
+        recurso.refresh_from_db()
+        self.assertEqual(recurso.variantes_portada['origen'], recurso.imagen_portada.name)
+        self.assertEqual(self.anchos(recurso), [320, 500])
+        self.assertFalse(any(imagenes.almacenamiento_portadas().exists(ruta) for ruta in previas))
+
+    def test_las_variantes_viven_en_el_almacenamiento_de_la_portada(self):
+        recurso = self.crear_recurso(self.png(800))
+        almacenamiento_portada = Recurso._meta.get_field('imagen_portada').storage
+        for ruta in imagenes.rutas(recurso.variantes_portada):
+            self.assertTrue(ruta.startswith(imagenes.CARPETA_VARIANTES + '/'))
+            self.assertTrue(almacenamiento_portada.exists(ruta))
+            self.assertEqual(ArchivoContenido.objects.get(nombre=ruta).referencias, 1)
+        self.assertIn(almacenamiento_portada.url(recurso.variantes_portada['webp'][0][1]),
+                      imagenes.srcset(recurso.variantes_portada, 'webp'))
+
+    def test_borrar_el_recurso_borra_las_variantes(self):
+        recurso = self.crear_recurso(self.png(800))
+        rutas = imagenes.rutas(recurso.variantes_portada)
+        with self.captureOnCommitCallbacks(execute=True):
+            recurso.delete()
+        self.assertFalse(any(imagenes.almacenamiento_portadas().exists(ruta) for ruta in rutas))
+        self.assertFalse(ArchivoContenido.objects.exists())
+
+    def test_portadas_iguales_comparten_variantes_hasta_el_ultimo_uso(self):
+        primero, segundo = self.crear_recurso(self.png(800)), self.crear_recurso(self.png(800))
+        rutas = imagenes.rutas(primero.variantes_portada)
+        self.assertEqual(imagenes.rutas(segundo.variantes_portada), rutas)
+        self.assertEqual(almacenamiento.recontar_referencias(), 0)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            primero.delete()
+        self.assertTrue(all(imagenes.almacenamiento_portadas().exists(ruta) for ruta in rutas))
+        with self.captureOnCommitCallbacks(execute=True):
+            segundo.delete()
+        self.assertFalse(any(imagenes.almacenamiento_portadas().exists(ruta) for ruta in rutas))
+
+
+# ==================== CATÁLOGO ====================
+
+class CatalogoTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.usuario = crear_usuario('ana')
+        cls.ansiedad = CategoriaRecurso.objects.create(nombre='Ansiedad')
+        cls.sueno = CategoriaRecurso.objects.create(nombre='Sueño')
+        cls.recursos = []
+        for numero in range(9):
+            cls.recursos.append(Recurso.objects.create(
+                # Títulos y fechas repetidos: el desempate por id decide el orden
+                titulo=f'Recurso {numero // 2}', descripcion='-', creado_por=cls.usuario,
+                tipo_recurso='video' if numero % 3 == 0 else 'articulo',
+                categoria=cls.ansiedad if numero % 2 else cls.sueno,
+            ))
+        for numero, recurso in enumerate(cls.recursos):
+            Recurso.objects.filter(pk=recurso.pk).update(creado_en=cls.recursos[numero // 3].creado_en)
+        Recurso.objects.create(
+            titulo='Oculto', descripcion='-', creado_por=cls.usuario, tipo_recurso='video',
+            categoria=cls.sueno, es_publico=False
+        )
+
+    def recorrer(self, parametros, tamano):
+        vistos, cursor = [], None
+        while True:
+            pagina = catalogo.pagina({**parametros, **({'cursor': cursor} if cursor else {})}, tamano=tamano)
+            vistos += [recurso.id for recurso in pagina.recursos]
+            cursor = pagina.siguiente_cursor
+            if cursor is None:
+                return vistos, pagina
+
+    def test_recorre_cada_orden_y_filtro_sin_repetir_ni_saltar(self):
+        for orden, campos in catalogo.ORDENES.items():
+            for filtros in ({}, {'tipo': 'video'}, {'categoria': str(self.ansiedad.id)},
+                            {'tipo': 'articulo', 'categoria': str(self.sueno.id)}):
+                esperado = list(catalogo.recursos_publicos(catalogo.leer_filtros(filtros)).order_by(*campos)
+                                .values_list('id', flat=True))
+                for tamano in (1, 2, 4, 20):
+                    with self.subTest(orden=orden, filtros=filtros, tamano=tamano):
+                        vistos, pagina = self.recorrer({**filtros, 'orden': orden}, tamano)
+                        self.assertEqual(vistos, esperado)
+                        self.assertEqual(pagina.total, len(esperado))
+
+    def test_facetas_cuentan_con_el_filtro_de_la_otra_dimension(self):
+        pagina = catalogo.pagina({'tipo': 'video'})
+        self.assertEqual({f.nombre: f.total for f in pagina.categorias}, {'Ansiedad': 1, 'Sueño': 2})
+        self.assertEqual({f.valor: f.total for f in pagina.tipos},
+                         {'video': 3, 'articulo': 6, 'texto_imagen': 0, 'ejercicio': 0})
+        self.assertEqual(pagina.total, 3)
+
+        pagina = catalogo.pagina({'categoria': str(self.ansiedad.id)})
+        self.assertEqual({f.valor: f.total for f in pagina.tipos}['video'], 1)
+        self.assertEqual({f.nombre: f.total for f in pagina.categorias}, {'Ansiedad': 4, 'Sueño': 5})
+
+    def test_parametros_invalidos_se_ignoran(self):
+        filtros = catalogo.leer_filtros({'tipo': 'podcast', 'categoria': 'x', 'orden': 'azar', 'cursor': ''})
+        self.assertEqual(filtros, catalogo.Filtros('', None, catalogo.ORDEN_POR_DEFECTO, None))
+        # Un cursor de otro orden vuelve a la primera página
+        cursor = catalogo.pagina({'orden': 'titulo'}, tamano=2).siguiente_cursor
+        pagina = catalogo.pagina({'orden': 'antiguos', 'cursor': cursor}, tamano=2)
+        self.assertEqual([r.id for r in pagina.recursos], [r.id for r in catalogo.pagina({'orden': 'antiguos'}, tamano=2).recursos])
+
+    def test_las_facetas_se_invalidan_al_crear_un_recurso(self):
+        self.assertEqual(catalogo.pagina({}).total, 9)
+        with self.captureOnCommitCallbacks(execute=True):
+            Recurso.objects.create(
+                titulo='Nuevo', descripcion='-', creado_por=self.usuario, tipo_recurso='ejercicio', categoria=self.sueno
+            )
+        pagina = catalogo.pagina({})
+        self.assertEqual(pagina.total, 10)
+        self.assertEqual({f.valor: f.total for f in pagina.tipos}['ejercicio'], 1)
+
+    def test_json_del_catalogo_pagina_por_cursor(self):
+        self.client.force_login(self.usuario)
+        vistos, parametros = [], {'orden': 'titulo'}
+        with mock.patch.object(catalogo, 'RECURSOS_POR_PAGINA', 4):
+            while True:
+                datos = self.client.get(reverse('miapp:catalogo_recursos'), parametros).json()
+                self.assertLessEqual(len(datos['recursos']), 4)
+                vistos += [recurso['id'] for recurso in datos['recursos']]
+                self.assertEqual(datos['total'], 9)
+                if not datos['siguiente_cursor']:
+                    break
+                parametros['cursor'] = datos['siguiente_cursor']
+        self.assertEqual(vistos, list(Recurso.objects.filter(es_publico=True).order_by('titulo', 'id')
+                                      .values_list('id', flat=True)))
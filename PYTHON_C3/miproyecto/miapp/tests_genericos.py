@@ -0,0 +1,126 @@
+"""
+Ejecución de los tests genéricos (TestPsicologico / PreguntaTest / OpcionRespuesta).
+
+Las definiciones de todos los tests activos se compilan en tuplas inmutables
+con tres consultas (tests, preguntas, opciones) y se guardan en la caché de
+referencia, que se invalida al cambiar cualquiera de esos modelos. Mostrar
+un test y corregir un envío se hace sobre esa definición: la única escritura
+es el INSERT del ResultadoTest.
+"""
+from collections import namedtuple
+
+from django.db import IntegrityError, transaction
+from django.db.models import Prefetch
+
+from . import cache_referencia
+from .evaluacion import EnvioInvalido, leer_envio
+from .models import OpcionRespuesta, PreguntaTest, ResultadoTest, TestPsicologico
+
+Opcion = namedtuple('Opcion', 'id texto valor categoria_id pregunta_id')
+Pregunta = namedtuple('Pregunta', 'id texto orden posicion opciones')
+
+
+class DefinicionTest(namedtuple('DefinicionTest', 'id nombre descripcion instrucciones preguntas opciones')):
+    """preguntas: tupla ordenada de Pregunta; opciones: {opcion_id: Opcion}"""
+
+    @property
+    def total(self):
+        return len(self.preguntas)
+
+
+def _compilar():
+    tests = TestPsicologico.objects.filter(es_activo=True).order_by('nombre', 'id').prefetch_related(
+        Prefetch('preguntas', queryset=PreguntaTest.objects.order_by('orden', 'id').prefetch_related(
+            Prefetch('opciones', queryset=OpcionRespuesta.objects.order_by('id'))
+        ))
+    )
+    definiciones = {}
+    for test in tests:
+        preguntas = tuple(
+            Pregunta(
+                id=pregunta.id,
+                texto=pregunta.texto_pregunta,
+                orden=pregunta.orden,
+                posicion=posicion,
+                opciones=tuple(
+                    Opcion(o.id, o.texto_opcion, o.valor, o.categoria_recomendacion_id, pregunta.id)
+                    for o in pregunta.opciones.all()
+                ),
+            )
+            for posicion, pregunta in enumerate(test.preguntas.all(), start=1)
+        )
+        definiciones[test.id] = DefinicionTest(
+            id=test.id,
+            nombre=test.nombre,
+            descripcion=test.descripcion,
+            instrucciones=test.instrucciones,
+            preguntas=preguntas,
+            opciones={opcion.id: opcion for pregunta in preguntas for opcion in pregunta.opciones},
+        )
+    return definiciones
+
+
+def definiciones():
+    """{test_id: DefinicionTest} de los tests activos"""
+    return cache_referencia.obtener('tests_psicologicos', _compilar)
+
+
+def tests_activos():
+    """Tests activos que tienen preguntas, en orden alfabético"""
+    return [definicion for definicion in definiciones().values() if definicion.preguntas]
+
+
+def definicion(test_id):
+    try:
+        return definiciones()[test_id]
+    except KeyError:
+        raise TestPsicologico.DoesNotExist
+
+
+def calificar(definicion_test, elegidas):
+    """
+    Valida {pregunta_id: opcion_id} y devuelve (puntuacion_total, categoria_id recomendada).
+
+    La categoría recomendada es la que más puntuación acumula entre las
+    opciones elegidas; a igualdad, la elegida más veces y después la que
+    aparece antes en el test.
+    """
+    if not definicion_test.preguntas:
+        raise EnvioInvalido('Este test todavía no tiene preguntas.')
+    preguntas = {pregunta.id for pregunta in definicion_test.preguntas}
+    faltantes = preguntas - elegidas.keys()
+    if faltantes:
+        raise EnvioInvalido(f'Quedan {len(faltantes)} pregunta(s) sin responder.')
+    if elegidas.keys() - preguntas:
+        raise EnvioInvalido('El envío incluye preguntas que no pertenecen al test.')
+
+    total = 0
+    por_categoria = {}  # categoria_id -> [puntuación, veces, -posición de la primera aparición]
+    for pregunta in definicion_test.preguntas:
+        opcion = definicion_test.opciones.get(elegidas[pregunta.id])
+        if opcion is None or opcion.pregunta_id != pregunta.id:
+            raise EnvioInvalido('Alguna de las opciones elegidas no corresponde a su pregunta.')
+        total += opcion.valor
+        acumulado = por_categoria.setdefault(opcion.categoria_id, [0, 0, -pregunta.posicion])
+        acumulado[0] += opcion.valor
+        acumulado[1] += 1
+    categoria_id = max(por_categoria, key=lambda categoria: por_categoria[categoria])
+    return total, categoria_id
+
+
+def registrar_resultado(usuario, test_id, datos):
+    """Corrige el envío de `datos` (POST) y guarda el ResultadoTest con un único INSERT"""
+    definicion_test = definicion(test_id)
+    total, categoria_id = calificar(definicion_test, leer_envio(datos))
+    try:
+        with transaction.atomic():
+            return ResultadoTest.objects.create(
+                usuario=usuario,
+                test_id=definicion_test.id,
+                puntuacion_total=total,
+                categoria_recomendada_id=categoria_id,
+            )
+    except IntegrityError:
+        # La definición en caché es anterior al borrado del test o de la categoría recomendada
+        cache_referencia.invalidar('tests_psicologicos')
+        raise EnvioInvalido('El test se actualizó mientras respondías. Revisa tus respuestas y envíalo de nuevo.')
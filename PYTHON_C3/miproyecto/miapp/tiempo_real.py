@@ -0,0 +1,144 @@
+"""
+Eventos en tiempo real del foro mediante Server-Sent Events (SSE).
+
+Las señales de HiloForo y RespuestaForo publican, tras el commit, un evento
+en un difusor local (en memoria, por proceso). Cada conexión SSE abierta es
+una cola asyncio suscrita a un canal ('foro' o 'hilo:<id>'), así que un solo
+productor despierta a todas las conexiones en espera sin sondear la base de
+datos y sin un broker externo.
+
+Límites:
+- Solo funciona sirviendo la aplicación por ASGI (miproyecto/asgi.py con
+  uvicorn o daphne). Por WSGI las vistas responden 204 y la plantilla vuelve
+  al sondeo periódico.
+- Cada worker acepta como máximo SSE_MAX_CONEXIONES conexiones simultáneas
+  (por defecto 500); las demás reciben 503 con Retry-After.
+- Los eventos solo llegan a las conexiones del mismo proceso que hizo la
+  escritura; con varios workers los clientes de otros procesos recuperan
+  lo perdido al reconectar (cada conexión dura SSE_DURACION_MAXIMA segundos).
+"""
+import asyncio
+import json
+import threading
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models.signals import post_save
+from django.dispatch import receiver
+
+from .models import HiloForo, RespuestaForo
+
+SSE_MAX_CONEXIONES = getattr(settings, 'SSE_MAX_CONEXIONES', 500)
+SSE_DURACION_MAXIMA = getattr(settings, 'SSE_DURACION_MAXIMA', 300)
+SSE_INTERVALO_LATIDO = 15
+
+# Eventos que puede acumular una conexión lenta antes de descartar los más nuevos
+TAMANO_COLA_CONEXION = 100
+
+
+class ConexionesAgotadas(Exception):
+    pass
+
+
+class Difusor:
+    """Pub/sub en memoria: un publicador, muchas colas asyncio suscritas por canal"""
+
+    def __init__(self, max_conexiones):
+        self.max_conexiones = max_conexiones
+        self._lock = threading.Lock()
+        self._suscriptores = {}
+        self._total = 0
+
+    @property
+    def conexiones(self):
+        return self._total
+
+    def suscribir(self, canal):
+        """Crea la cola de una conexión en el bucle de eventos actual"""
+        cola = asyncio.Queue(maxsize=TAMANO_COLA_CONEXION)
+        bucle = asyncio.get_running_loop()
+        with self._lock:
+            if self._total >= self.max_conexiones:
+                raise ConexionesAgotadas
+            self._suscriptores.setdefault(canal, set()).add((bucle, cola))
+            self._total += 1
+        return bucle, cola
+
+    def cancelar(self, canal, suscripcion):
+        with self._lock:
+            suscriptores = self._suscriptores.get(canal, set())
+            if suscripcion in suscriptores:
+                suscriptores.discard(suscripcion)
+                self._total -= 1
+            if not suscriptores:
+                self._suscriptores.pop(canal, None)
+
+    def publicar(self, canal, evento):
+        """Entrega `evento` a todas las conexiones del canal; se puede llamar desde cualquier hilo"""
+        with self._lock:
+            suscriptores = list(self._suscriptores.get(canal, ()))
+        for bucle, cola in suscriptores:
+            try:
+                bucle.call_soon_threadsafe(_encolar, cola, evento)
+            except RuntimeError:
+                # El bucle de esa conexión ya se cerró; su finally la dará de baja
+                pass
+
+
+def _encolar(cola, evento):
+    try:
+        cola.put_nowait(evento)
+    except asyncio.QueueFull:
+        pass
+
+
+difusor = Difusor(SSE_MAX_CONEXIONES)
+
+
+def formatear_evento(evento):
+    return f"event: {evento['tipo']}\ndata: {json.dumps(evento)}\n\n"
+
+
+async def flujo_eventos(canal):
+    """Iterador asíncrono del cuerpo SSE: eventos del canal más latidos para mantener viva la conexión"""
+    try:
+        suscripcion = difusor.suscribir(canal)
+    except ConexionesAgotadas:
+        yield 'retry: 30000\n\n'
+        return
+    _, cola = suscripcion
+    bucle = asyncio.get_running_loop()
+    fin = bucle.time() + SSE_DURACION_MAXIMA
+    try:
+        yield 'retry: 5000\n\n'
+        while bucle.time() < fin:
+            try:
+                evento = await asyncio.wait_for(cola.get(), timeout=SSE_INTERVALO_LATIDO)
+            except asyncio.TimeoutError:
+                yield ': latido\n\n'
+                continue
+            yield formatear_evento(evento)
+    finally:
+        difusor.cancelar(canal, suscripcion)
+
+
+# ==================== PRODUCTORES ====================
+
+@receiver(post_save, sender=HiloForo)
+def publicar_hilo(sender, instance, created, **kwargs):
+    if not created:
+        return
+    evento = {'tipo': 'hilo', 'id': instance.pk, 'categoria_id': instance.categoria_id}
+    transaction.on_commit(lambda: difusor.publicar('foro', evento))
+
+
+@receiver(post_save, sender=RespuestaForo)
+def publicar_respuesta(sender, instance, created, **kwargs):
+    if not created:
+        return
+    evento = {'tipo': 'respuesta', 'id': instance.pk, 'hilo_id': instance.hilo_id}
+
+    def publicar():
+        difusor.publicar(f'hilo:{instance.hilo_id}', evento)
+        difusor.publicar('foro', evento)
+    transaction.on_commit(publicar)
@@ -15,7 +15,10 @@ urlpatterns = [
     path('datos-curiosos/', views.datos_curiosos, name='datos_curiosos'),
     path('recursos/', views.recursos, name='recursos'),
     path('recursos-multimedia/', views.recursos_multimedia, name='recursos_multimedia'),
+    path('recursos-multimedia/catalogo/', views.catalogo_recursos, name='catalogo_recursos'),
     path('tests/', views.tests_psicologicos, name='tests'),
+    path('tests/<int:test_id>/', views.realizar_test_generico, name='realizar_test_generico'),
+    path('tests/resultado/<int:resultado_id>/', views.resultado_test_generico, name='resultado_test_generico'),
     path('contacto/', views.formulario_contacto, name='formulario_contacto'),
     
     # ==================== PERFIL DE USUARIO ====================
@@ -28,9 +31,17 @@ urlpatterns = [
    # URLs DEL FORO COMUNITARIO ACTUALIZADAS
     path('foro/', views.foro_comunitario, name='foro_comunitario'),
     path('foro/crear/', views.crear_hilo, name='crear_hilo'),
+    path('foro/buscar/', views.buscar_foro, name='buscar_foro'),
+    path('foro/eventos/', views.eventos_foro, name='eventos_foro'),
     path('foro/hilo/<int:hilo_id>/', views.detalle_hilo, name='detalle_hilo'),
     path('foro/hilo/<int:hilo_id>/editar/', views.editar_hilo, name='editar_hilo'),
     path('foro/hilo/<int:hilo_id>/eliminar/', views.eliminar_hilo, name='eliminar_hilo'),
+    path('foro/hilo/<int:hilo_id>/respuestas/', views.respuestas_hilo, name='respuestas_hilo'),
+    path('foro/hilo/<int:hilo_id>/respuestas/nuevas/', views.respuestas_nuevas, name='respuestas_nuevas'),
+    path('foro/hilo/<int:hilo_id>/eventos/', views.eventos_hilo, name='eventos_hilo'),
+    path('foro/hilo/<int:hilo_id>/votar/', views.votar_hilo, name='votar_hilo'),
+    path('foro/respuesta/<int:respuesta_id>/votar/', views.votar_respuesta, name='votar_respuesta'),
+    path('foro/votos/', views.votar_lote_view, name='votar_lote'),
     
     # ==================== ADMINISTRACIÓN (SOLO ADMIN) ====================
     path('admin/usuarios/', views.admin_gestion_usuarios, name='admin_gestion_usuarios'),
@@ -50,11 +61,20 @@ urlpatterns = [
     
     # ==================== URLs para el Test Personalizado ===========
     path('realizar-test/', views.realizar_test, name='realizar_test'),
+    path('realizar-test/borrador/', views.autoguardar_test, name='autoguardar_test'),
     path('resultado-test/<int:resultado_id>/', views.resultado_test, name='resultado_test'),
     path('ver-resultados/', views.ver_resultados_pasante, name='ver_resultados_pasante'),
+    path('ver-resultados/tendencias/', views.tendencias_resultados, name='tendencias_resultados'),
+    path('ver-resultados/tendencias.json', views.tendencias_resultados_json, name='tendencias_resultados_json'),
+    path('ver-resultados/exportar.<str:formato>', views.exportar_resultados, name='exportar_resultados'),
     path('subir-contenido/<int:paciente_id>/', views.subir_contenido_personalizado, name='subir_contenido_personalizado'),
     path('mi-contenido/', views.ver_contenido_personalizado, name='ver_contenido_personalizado'),
 
+    # Subidas por fragmentos reanudables (archivos grandes de recursos y contenido personalizado)
+    path('subidas/', views.iniciar_subida, name='iniciar_subida'),
+    path('subidas/<uuid:subida_id>/', views.subida_fragmentada, name='subida_fragmentada'),
+    path('subidas/<uuid:subida_id>/finalizar/', views.finalizar_subida, name='finalizar_subida'),
+
     # ===================== VER COMO USUARIO =====================
     path('ver-como-usuario/', views.ver_como_usuario, name='ver_como_usuario'),
     path('volver-a-pasante/', views.volver_a_pasante, name='volver_a_pasante'), 
@@ -1,14 +1,38 @@
+import json
+import logging
+from datetime import datetime, time, timedelta
+
 from django.shortcuts import render, redirect, get_object_or_404
+from django.urls import reverse
+from django.template.loader import render_to_string
 from django.contrib.auth import authenticate, login, logout
 from django.contrib.auth.decorators import login_required
 from django.contrib import messages
 from django.contrib.auth.models import User
-from django.http import JsonResponse
+from django.core.paginator import Paginator
+from django.core.handlers.asgi import ASGIRequest
+from django.db.models import Prefetch
+from django.http import Http404, HttpResponse, JsonResponse, StreamingHttpResponse
+from django.utils import timezone
+from django.utils.dateparse import parse_date
+from django.views.decorators.http import require_http_methods, require_POST, require_safe
 from .models import (
     UserProfile, Recurso, CategoriaRecurso, FormularioContacto, RespuestaConsulta,
-    CategoriaForo, HiloForo, RespuestaForo
+    CategoriaForo, HiloForo, RespuestaForo, ResultadoTest, SubidaParcial, TestPsicologico
+)
+from . import (
+    borradores, cache_referencia, catalogo, estadisticas, exportacion, imagenes, medios, recomendaciones, subidas,
+    tendencias, tests_genericos, tiempo_real
 )
+from . import cuestionario as cuestionarios
+from .busqueda import buscar_hilos
+from .evaluacion import EnvioInvalido, registrar_envio
 from .forms import RecursoForm, UserForm, UserProfileForm
+from .paginacion import paginar_keyset
+from .visitas import registrar_visita, visitas_pendientes
+from .votos import VotoInvalido, anotar_mi_voto, votar, votar_lote, voto_de_usuario
+
+logger = logging.getLogger(__name__)
 
 
 def custom_login(request):
@@ -53,11 +77,14 @@ def mi_perfil(request):
     nombre_completo = obtener_nombre_completo(request.user)
     
     # Estadísticas del usuario
+    contadores = estadisticas.leer_de_usuario(
+        request.user.id, 'consultas', 'consultas_respondidas', 'hilos', 'respuestas'
+    )
     stats = {
-        'total_consultas': FormularioContacto.objects.filter(usuario=request.user).count(),
-        'consultas_respondidas': FormularioContacto.objects.filter(usuario=request.user, respondido=True).count(),
-        'hilos_creados': HiloForo.objects.filter(creado_por=request.user).count(),
-        'respuestas_creadas': RespuestaForo.objects.filter(creado_por=request.user).count(),
+        'total_consultas': contadores['consultas'],
+        'consultas_respondidas': contadores['consultas_respondidas'],
+        'hilos_creados': contadores['hilos'],
+        'respuestas_creadas': contadores['respuestas'],
     }
     
     # Consultas recientes del usuario
@@ -104,7 +131,8 @@ def obtener_nombre_completo(user):
         return user.username
 
 def index(request):
-    return render(request, 'miapp/index.html')
+    recursos_recomendados = recomendaciones.para_usuario(request.user) if request.user.is_authenticated else ()
+    return render(request, 'miapp/index.html', {'recursos_recomendados': recursos_recomendados})
 
 @login_required
 def datos_curiosos(request):
@@ -112,17 +140,99 @@ def datos_curiosos(request):
 
 @login_required
 def recursos(request):
-    recursos_list = Recurso.objects.filter(es_publico=True)
-    return render(request, 'miapp/recursos.html', {'recursos': recursos_list})
+    categorias, tipos, total = catalogo.facetas(catalogo.leer_filtros({}))
+    return render(request, 'miapp/recursos.html', {
+        'categorias': categorias,
+        'tipos': tipos,
+        'total_recursos': total,
+    })
 
 @login_required
 def recursos_multimedia(request):
-    recursos_list = Recurso.objects.filter(es_publico=True)
-    return render(request, 'miapp/recursos_multimedia.html', {'recursos': recursos_list})
+    pagina = catalogo.pagina(request.GET)
+    return render(request, 'miapp/recursos_multimedia.html', {
+        'recursos': pagina.recursos,
+        'categorias': pagina.categorias,
+        'tipos': pagina.tipos,
+        'total_recursos': pagina.total,
+        'filtros': pagina.filtros,
+        'siguiente_cursor': pagina.siguiente_cursor,
+        'es_primera_pagina': pagina.es_primera,
+    })
+
+def _recurso_catalogo(recurso):
+    return {
+        'id': recurso.id,
+        'titulo': recurso.titulo,
+        'descripcion': recurso.descripcion,
+        'tipo': recurso.tipo_recurso,
+        'tipo_nombre': recurso.get_tipo_recurso_display(),
+        'categoria': {
+            'id': recurso.categoria_id,
+            'nombre': recurso.categoria.nombre,
+            'color': recurso.categoria.color,
+        },
+        'enlace': recurso.enlace or '',
+        'portada': recurso.imagen_portada.url if recurso.imagen_portada else '',
+        'portada_srcset': {
+            formato: imagenes.srcset(recurso.variantes_portada, formato) for formato in imagenes.FORMATOS
+        },
+        'creado_en': recurso.creado_en.isoformat(),
+    }
+
+@login_required
+@require_safe
+def catalogo_recursos(request):
+    """Página del catálogo en JSON (mismos parámetros que recursos_multimedia) con las facetas"""
+    pagina = catalogo.pagina(request.GET)
+    return JsonResponse({
+        'recursos': [_recurso_catalogo(recurso) for recurso in pagina.recursos],
+        'siguiente_cursor': pagina.siguiente_cursor,
+        'total': pagina.total,
+        'facetas': {
+            'categorias': [faceta._asdict() for faceta in pagina.categorias],
+            'tipos': [faceta._asdict() for faceta in pagina.tipos],
+        },
+    })
 
 @login_required
 def tests_psicologicos(request):
-    return render(request, 'miapp/tests.html')
+    return render(request, 'miapp/tests.html', {'tests_activos': tests_genericos.tests_activos()})
+
+@login_required
+def realizar_test_generico(request, test_id):
+    """Muestra y corrige cualquier TestPsicologico activo a partir de su definición en caché"""
+    try:
+        definicion = tests_genericos.definicion(test_id)
+    except TestPsicologico.DoesNotExist:
+        raise Http404
+    if not definicion.preguntas:
+        raise Http404
+    
+    if request.method == 'POST':
+        try:
+            resultado = tests_genericos.registrar_resultado(request.user, test_id, request.POST)
+        except EnvioInvalido as error:
+            messages.error(request, str(error))
+            return redirect('miapp:realizar_test_generico', test_id=test_id)
+        return redirect('miapp:resultado_test_generico', resultado_id=resultado.id)
+    
+    return render(request, 'miapp/realizar_test_generico.html', {
+        'test': definicion,
+        'seccion_actual': 'test'
+    })
+
+@login_required
+def resultado_test_generico(request, resultado_id):
+    resultado = get_object_or_404(
+        ResultadoTest.objects.select_related('test', 'categoria_recomendada'),
+        id=resultado_id, usuario=request.user
+    )
+    return render(request, 'miapp/resultado_test_generico.html', {
+        'resultado': resultado,
+        'recursos_recomendados': recomendaciones.actuales().de_categoria(resultado.categoria_recomendada_id),
+        'seccion_actual': 'test'
+    })
 
 @login_required
 def formulario_contacto(request):
@@ -162,13 +272,14 @@ def admin_dashboard(request):
         messages.error(request, 'No tienes permisos para acceder al dashboard de administrador')
         return redirect('miapp:index')
     
+    contadores = estadisticas.leer_globales('usuarios', 'recursos', 'consultas', 'consultas_sin_responder')
     context = {
         'user': request.user,
         'stats': {
-            'total_usuarios': User.objects.count(),
-            'total_recursos': Recurso.objects.count(),
-            'total_consultas': FormularioContacto.objects.count(),
-            'consultas_sin_responder': FormularioContacto.objects.filter(respondido=False).count(),
+            'total_usuarios': contadores['usuarios'],
+            'total_recursos': contadores['recursos'],
+            'total_consultas': contadores['consultas'],
+            'consultas_sin_responder': contadores['consultas_sin_responder'],
         }
     }
     return render(request, 'miapp/admin/dashboard.html', context)
@@ -179,12 +290,13 @@ def pasante_dashboard(request):
         messages.error(request, 'No tienes permisos para acceder al dashboard de pasante')
         return redirect('miapp:index')
     
+    contadores = estadisticas.leer_globales('recursos', 'consultas', 'consultas_sin_responder')
     context = {
         'user': request.user,
         'stats': {
-            'total_recursos': Recurso.objects.count(),
-            'total_consultas': FormularioContacto.objects.count(),
-            'consultas_sin_responder': FormularioContacto.objects.filter(respondido=False).count(),
+            'total_recursos': contadores['recursos'],
+            'total_consultas': contadores['consultas'],
+            'consultas_sin_responder': contadores['consultas_sin_responder'],
         }
     }
     return render(request, 'miapp/pasante/dashboard.html', context)
@@ -200,8 +312,6 @@ def admin_gestion_usuarios(request):
     usuarios = User.objects.all().select_related('userprofile')
 
     if request.method == 'POST':
-        print("POST DATA:", request.POST)
-
         # ===========================
         # CREAR USUARIO
         # ===========================
@@ -297,7 +407,7 @@ def admin_gestion_usuarios(request):
 def admin_gestion_recursos(request):
     """
     Gestión de recursos para ADMIN:
-    - Soporta campos: titulo, descripcion, tipo_recurso, categoria, url, archivo, portada, contenido, es_publico
+    - Soporta campos: titulo, descripcion, tipo_recurso, categoria, url, archivo, imagen_portada, contenido, es_publico
     - Validación: debe existir url o archivo al crear
     """
     if not hasattr(request.user, 'userprofile') or not request.user.userprofile.es_admin():
@@ -305,7 +415,7 @@ def admin_gestion_recursos(request):
         return redirect('miapp:index')
     
     recursos_list = Recurso.objects.all().select_related('categoria', 'creado_por')
-    categorias = CategoriaRecurso.objects.all()
+    categorias = cache_referencia.categorias_recurso()
     
     if request.method == 'POST':
         # Crear recurso
@@ -317,8 +427,6 @@ def admin_gestion_recursos(request):
             contenido = request.POST.get('contenido', '').strip()
             es_publico = request.POST.get('es_publico') == 'on'
             url = request.POST.get('url', '').strip()
-            archivo = request.FILES.get('archivo')
-            portada = request.FILES.get('portada')
             
             # Validaciones básicas
             if not titulo or not descripcion or not categoria_id:
@@ -326,10 +434,17 @@ def admin_gestion_recursos(request):
                 return redirect('miapp:admin_gestion_recursos')
             
             # Requerir al menos url o archivo
-            if not url and not archivo:
+            if not url and not subidas.hay_archivo(request, 'archivo'):
                 messages.error(request, 'Debes proporcionar un ENLACE (URL) o subir un ARCHIVO.')
                 return redirect('miapp:admin_gestion_recursos')
             
+            # Las subidas por fragmentos se adjuntan solo con el formulario ya válido
+            try:
+                archivo, portada = subidas.archivos_del_formulario(request, Recurso, 'archivo', 'imagen_portada')
+            except subidas.SubidaInvalida as e:
+                messages.error(request, str(e))
+                return redirect('miapp:admin_gestion_recursos')
+            
             try:
                 recurso = Recurso.objects.create(
                     titulo=titulo,
@@ -340,7 +455,7 @@ def admin_gestion_recursos(request):
                     es_publico=es_publico,
                     url=url if url else None,
                     archivo=archivo if archivo else None,
-                    portada=portada if portada else None,
+                    imagen_portada=portada if portada else None,
                     creado_por=request.user
                 )
                 messages.success(request, f'Recurso "{titulo}" creado exitosamente')
@@ -361,8 +476,6 @@ def admin_gestion_recursos(request):
             contenido = request.POST.get('contenido', '').strip()
             es_publico = request.POST.get('es_publico') == 'on'
             url = request.POST.get('url', '').strip()
-            archivo = request.FILES.get('archivo')
-            portada = request.FILES.get('portada')
             
             # Validaciones básicas
             if not titulo or not descripcion or not categoria_id:
@@ -370,10 +483,17 @@ def admin_gestion_recursos(request):
                 return redirect('miapp:admin_gestion_recursos')
             
             # Si no existe url ni archivo nuevo ni archivo previo -> rechazar
-            if not url and not archivo and not recurso.archivo:
+            if not url and not subidas.hay_archivo(request, 'archivo') and not recurso.archivo:
                 messages.error(request, 'El recurso debe tener un ENLACE (URL) o un ARCHIVO. Si quieres eliminar el archivo existente primero sube otro o añade una URL.')
                 return redirect('miapp:admin_gestion_recursos')
             
+            # Las subidas por fragmentos se adjuntan solo con el formulario ya válido
+            try:
+                archivo, portada = subidas.archivos_del_formulario(request, Recurso, 'archivo', 'imagen_portada')
+            except subidas.SubidaInvalida as e:
+                messages.error(request, str(e))
+                return redirect('miapp:admin_gestion_recursos')
+            
             try:
                 recurso.titulo = titulo
                 recurso.descripcion = descripcion
@@ -388,7 +508,7 @@ def admin_gestion_recursos(request):
                     recurso.archivo = archivo
                 # Reemplazar portada si se sube una nueva
                 if portada:
-                    recurso.portada = portada
+                    recurso.imagen_portada = portada
                 
                 recurso.save()
                 messages.success(request, f'Recurso "{titulo}" actualizado')
@@ -453,7 +573,7 @@ def pasante_gestion_recursos(request):
         return redirect('miapp:index')
     
     recursos_list = Recurso.objects.all().select_related('categoria', 'creado_por')
-    categorias = CategoriaRecurso.objects.all()
+    categorias = cache_referencia.categorias_recurso()
     
     if request.method == 'POST':
 
@@ -472,9 +592,6 @@ def pasante_gestion_recursos(request):
             # COINCIDE CON TU HTML
             url = request.POST.get('enlace', '').strip()
 
-            # COINCIDE CON TU HTML
-            portada = request.FILES.get('imagen_portada')
-
             # Validaciones básicas
             if not titulo or not descripcion or not categoria_id:
                 messages.error(request, 'Por favor completa todos los campos obligatorios (Título, Descripción, Categoría).')
@@ -483,6 +600,13 @@ def pasante_gestion_recursos(request):
             if not url:
                 messages.error(request, 'Debes proporcionar un ENLACE (URL).')
                 return redirect('miapp:pasante_gestion_recursos')
+
+            # COINCIDE CON TU HTML; la subida se adjunta solo con el formulario ya válido
+            try:
+                portada = subidas.archivo_del_formulario(request, Recurso, 'imagen_portada')
+            except subidas.SubidaInvalida as e:
+                messages.error(request, str(e))
+                return redirect('miapp:pasante_gestion_recursos')
             
             try:
                 Recurso.objects.create(
@@ -493,7 +617,7 @@ def pasante_gestion_recursos(request):
                     contenido=contenido,
                     es_publico=es_publico,
                     url=url if url else None,
-                    portada=portada if portada else None,
+                    imagen_portada=portada if portada else None,
                     creado_por=request.user
                 )
                 messages.success(request, f'Recurso "{titulo}" creado exitosamente')
@@ -521,9 +645,6 @@ def pasante_gestion_recursos(request):
             # HTML usa "enlace", no "url"
             url = request.POST.get('enlace', '').strip()
 
-            # HTML usa "imagen_portada", no "portada"
-            nueva_portada = request.FILES.get('imagen_portada')
-
             if not titulo or not descripcion or not categoria_id:
                 messages.error(request, 'Por favor completa todos los campos obligatorios (Título, Descripción, Categoría).')
                 return redirect('miapp:pasante_gestion_recursos')
@@ -531,6 +652,13 @@ def pasante_gestion_recursos(request):
             if not url and not recurso.url:
                 messages.error(request, 'El recurso debe tener un ENLACE (URL).')
                 return redirect('miapp:pasante_gestion_recursos')
+
+            # HTML usa "imagen_portada", no "portada"; se adjunta solo con el formulario ya válido
+            try:
+                nueva_portada = subidas.archivo_del_formulario(request, Recurso, 'imagen_portada')
+            except subidas.SubidaInvalida as e:
+                messages.error(request, str(e))
+                return redirect('miapp:pasante_gestion_recursos')
             
             try:
                 recurso.titulo = titulo
@@ -543,7 +671,7 @@ def pasante_gestion_recursos(request):
 
                 # Reemplazar portada si se sube una nueva
                 if nueva_portada:
-                    recurso.portada = nueva_portada
+                    recurso.imagen_portada = nueva_portada
                 
                 recurso.save()
                 messages.success(request, f'Recurso "{titulo}" actualizado correctamente')
@@ -604,45 +732,49 @@ def pasante_consultas(request):
 
 # ==================== VISTAS FORO COMUNITARIO ====================
 
+HILOS_POR_PAGINA = 20
+RESULTADOS_BUSQUEDA_POR_PAGINA = 20
+RESPUESTAS_POR_PAGINA = 20
+ORDEN_RESPUESTAS = ['creado_en', 'id']
+
+# Orden de cada modo del listado; el 'id' final desempata para que el cursor sea estable.
+# Cada uno tiene su índice compuesto en HiloForo.Meta.indexes
+ORDENES_FORO = {
+    'recientes': ['-creado_en', '-id'],
+    'antiguos': ['creado_en', 'id'],
+    'populares': ['-puntuacion_hot', '-id'],
+}
+
 @login_required
 def foro_comunitario(request):
     """Vista principal del foro comunitario"""
-    if not CategoriaForo.objects.exists():
-        categorias_default = [
-            {'nombre': 'Experiencias Personales', 'color': '#6C63FF', 'orden': 1},
-            {'nombre': 'Consejos y Estrategias', 'color': '#4CAF50', 'orden': 2},
-            {'nombre': 'Apoyo Emocional', 'color': '#FF6B6B', 'orden': 3},
-            {'nombre': 'Preguntas y Dudas', 'color': '#FFA726', 'orden': 4},
-        ]
-        for cat_data in categorias_default:
-            CategoriaForo.objects.create(
-                nombre=cat_data['nombre'],
-                color=cat_data['color'],
-                orden=cat_data['orden']
-            )
-    
-    categorias = CategoriaForo.objects.filter(es_activa=True).order_by('orden')
+    categorias = cache_referencia.categorias_foro()
     
     categoria_id = request.GET.get('categoria', '')
     orden = request.GET.get('orden', 'recientes')
     
-    hilos = HiloForo.objects.select_related('categoria', 'creado_por', 'creado_por__userprofile')
+    hilos = HiloForo.objects.select_related(
+        'categoria', 'creado_por', 'creado_por__userprofile',
+        'ultima_respuesta_ref', 'ultima_respuesta_por'
+    )
     
     if 'aplicar_filtros' in request.GET:
         if categoria_id and categoria_id != 'todas':
             hilos = hilos.filter(categoria_id=categoria_id)
     
-    if orden == 'populares':
-        hilos = hilos.order_by('-votos_positivos', '-visitas', '-actualizado_en')
-    elif orden == 'antiguos':
-        hilos = hilos.order_by('creado_en')
-    else:
-        hilos = hilos.order_by('-creado_en')
+    if orden not in ORDENES_FORO:
+        orden = 'recientes'
     
+    hilos, siguiente_cursor = paginar_keyset(
+        hilos, ORDENES_FORO[orden], request.GET.get('cursor'),
+        tamano=HILOS_POR_PAGINA, modo=orden
+    )
+    
+    contadores = estadisticas.leer_globales('hilos', 'respuestas', 'hilos_abiertos')
     stats = {
-        'total_hilos': HiloForo.objects.count(),
-        'total_respuestas': RespuestaForo.objects.count(),
-        'hilos_abiertos': HiloForo.objects.filter(estado='abierto').count(),
+        'total_hilos': contadores['hilos'],
+        'total_respuestas': contadores['respuestas'],
+        'hilos_abiertos': contadores['hilos_abiertos'],
     }
     
     context = {
@@ -651,14 +783,45 @@ def foro_comunitario(request):
         'categoria_actual': categoria_id,
         'orden_actual': orden,
         'stats': stats,
+        'siguiente_cursor': siguiente_cursor,
+        'es_primera_pagina': not request.GET.get('cursor'),
     }
     
     return render(request, 'miapp/foro_comunitario.html', context)
 
+@login_required
+def buscar_foro(request):
+    """Vista de búsqueda de texto completo en hilos y respuestas del foro"""
+    texto = request.GET.get('q', '').strip()
+    categoria_id = request.GET.get('categoria', '')
+    estado = request.GET.get('estado', '')
+    autor = request.GET.get('autor', '').strip()
+    if categoria_id == 'todas' or not categoria_id.isdigit():
+        categoria_id = ''
+    if estado not in dict(HiloForo.ESTADO_CHOICES):
+        estado = ''
+    
+    hilos = buscar_hilos(texto, categoria_id=categoria_id, estado=estado, autor=autor).select_related(
+        'categoria', 'creado_por'
+    )
+    pagina = Paginator(hilos, RESULTADOS_BUSQUEDA_POR_PAGINA).get_page(request.GET.get('page'))
+    
+    context = {
+        'texto': texto,
+        'pagina': pagina,
+        'categorias': cache_referencia.categorias_foro(),
+        'categoria_actual': categoria_id,
+        'estado_actual': estado,
+        'autor_actual': autor,
+        'estados': HiloForo.ESTADO_CHOICES,
+    }
+    
+    return render(request, 'miapp/buscar_foro.html', context)
+
 @login_required
 def crear_hilo(request):
     """Vista para crear un nuevo hilo"""
-    categorias = CategoriaForo.objects.filter(es_activa=True).order_by('orden')
+    categorias = cache_referencia.categorias_foro()
     
     if request.method == 'POST':
         titulo = request.POST.get('titulo')
@@ -694,7 +857,7 @@ def editar_hilo(request, hilo_id):
         messages.error(request, 'No tienes permisos para editar este hilo.')
         return redirect('miapp:detalle_hilo', hilo_id=hilo_id)
     
-    categorias = CategoriaForo.objects.filter(es_activa=True).order_by('orden')
+    categorias = cache_referencia.categorias_foro()
     
     if request.method == 'POST':
         titulo = request.POST.get('titulo')
@@ -729,10 +892,10 @@ def detalle_hilo(request, hilo_id):
         id=hilo_id
     )
     
-    hilo.visitas += 1
-    hilo.save()
-    
-    respuestas = hilo.respuestas.select_related('creado_por', 'creado_por__userprofile').order_by('creado_en')
+    if request.method == 'GET':
+        registrar_visita(request, hilo.id)
+    # Las visitas se escriben en diferido; se muestran sumando las pendientes de este proceso
+    hilo.visitas += visitas_pendientes(hilo.id)
     
     if request.method == 'POST':
         contenido = request.POST.get('contenido_respuesta')
@@ -748,13 +911,132 @@ def detalle_hilo(request, hilo_id):
             messages.success(request, 'Tu respuesta ha sido publicada exitosamente.')
             return redirect('miapp:detalle_hilo', hilo_id=hilo.id)
     
+    # Solo se renderiza la primera página; el resto se pide por cursor desde la plantilla
+    respuestas, siguiente_cursor = paginar_keyset(
+        _respuestas_de_hilo(hilo.id, request.user), ORDEN_RESPUESTAS, tamano=RESPUESTAS_POR_PAGINA
+    )
+    
     context = {
         'hilo': hilo,
         'respuestas': respuestas,
+        'mi_voto_hilo': voto_de_usuario(hilo, request.user),
+        'siguiente_cursor': siguiente_cursor,
     }
     
     return render(request, 'miapp/detalle_hilo.html', context)
 
+def _respuestas_de_hilo(hilo_id, usuario):
+    return anotar_mi_voto(
+        RespuestaForo.objects.filter(hilo_id=hilo_id).select_related('creado_por', 'creado_por__userprofile'),
+        usuario
+    )
+
+def _fragmento_respuestas(request, respuestas):
+    return render_to_string('miapp/_respuestas_foro.html', {'respuestas': respuestas}, request=request)
+
+@login_required
+def respuestas_hilo(request, hilo_id):
+    """Devuelve en JSON el fragmento HTML de la siguiente página de respuestas de un hilo"""
+    get_object_or_404(HiloForo.objects.only('id'), id=hilo_id)
+    respuestas, siguiente_cursor = paginar_keyset(
+        _respuestas_de_hilo(hilo_id, request.user), ORDEN_RESPUESTAS,
+        request.GET.get('cursor'), tamano=RESPUESTAS_POR_PAGINA
+    )
+    return JsonResponse({
+        'html': _fragmento_respuestas(request, respuestas),
+        'siguiente_cursor': siguiente_cursor,
+    })
+
+@login_required
+def respuestas_nuevas(request, hilo_id):
+    """Devuelve en JSON las respuestas publicadas después de la respuesta `desde`"""
+    get_object_or_404(HiloForo.objects.only('id'), id=hilo_id)
+    try:
+        desde = int(request.GET.get('desde', 0))
+    except ValueError:
+        desde = 0
+    # Los ids crecen con cada respuesta, así que la clave primaria basta como cursor
+    respuestas = list(
+        _respuestas_de_hilo(hilo_id, request.user).filter(id__gt=desde).order_by('id')[:RESPUESTAS_POR_PAGINA]
+    )
+    return JsonResponse({
+        'html': _fragmento_respuestas(request, respuestas),
+        'ultimo_id': respuestas[-1].id if respuestas else desde,
+    })
+
+def _respuesta_voto(request, resultado, hilo_id):
+    """JSON para peticiones AJAX; redirección al hilo para formularios normales"""
+    if request.headers.get('x-requested-with') == 'XMLHttpRequest' or 'application/json' in request.headers.get('accept', ''):
+        return JsonResponse(resultado)
+    return redirect('miapp:detalle_hilo', hilo_id=hilo_id)
+
+def _respuesta_sse(request, canal):
+    """Respuesta text/event-stream para `canal`; por WSGI no se puede mantener abierta y se devuelve 204"""
+    if not isinstance(request, ASGIRequest):
+        return HttpResponse(status=204)
+    if tiempo_real.difusor.conexiones >= tiempo_real.SSE_MAX_CONEXIONES:
+        respuesta = HttpResponse('Demasiadas conexiones en tiempo real', status=503)
+        respuesta['Retry-After'] = '30'
+        return respuesta
+    respuesta = StreamingHttpResponse(tiempo_real.flujo_eventos(canal), content_type='text/event-stream')
+    respuesta['Cache-Control'] = 'no-cache'
+    respuesta['X-Accel-Buffering'] = 'no'
+    return respuesta
+
+@login_required
+async def eventos_foro(request):
+    """Flujo SSE de hilos y respuestas nuevas para el índice del foro"""
+    return _respuesta_sse(request, 'foro')
+
+@login_required
+async def eventos_hilo(request, hilo_id):
+    """Flujo SSE de respuestas nuevas de un hilo"""
+    if not await HiloForo.objects.filter(id=hilo_id).aexists():
+        raise Http404
+    return _respuesta_sse(request, f'hilo:{hilo_id}')
+
+@login_required
+@require_POST
+def votar_hilo(request, hilo_id):
+    """Vista para votar (o retirar el voto de) un hilo"""
+    try:
+        resultado = votar(request.user, 'hilo', hilo_id, request.POST.get('voto'))
+    except HiloForo.DoesNotExist:
+        raise Http404
+    except VotoInvalido as e:
+        return JsonResponse({'error': str(e)}, status=400)
+    return _respuesta_voto(request, resultado, hilo_id)
+
+@login_required
+@require_POST
+def votar_respuesta(request, respuesta_id):
+    """Vista para votar (o retirar el voto de) una respuesta del foro"""
+    respuesta = get_object_or_404(RespuestaForo.objects.only('id', 'hilo_id'), id=respuesta_id)
+    try:
+        resultado = votar(request.user, 'respuesta', respuesta.id, request.POST.get('voto'))
+    except RespuestaForo.DoesNotExist:
+        raise Http404
+    except VotoInvalido as e:
+        return JsonResponse({'error': str(e)}, status=400)
+    return _respuesta_voto(request, resultado, respuesta.hilo_id)
+
+@login_required
+@require_POST
+def votar_lote_view(request):
+    """Endpoint JSON para aplicar varios votos en una transacción: {"votos": [{"tipo_objeto", "id", "voto"}]}"""
+    try:
+        votos = json.loads(request.body).get('votos', [])
+        votos = [dict(voto, id=int(voto['id'])) for voto in votos]
+    except (ValueError, TypeError, KeyError, AttributeError):
+        return JsonResponse({'error': 'Formato de votos inválido'}, status=400)
+    try:
+        resultados = votar_lote(request.user, votos)
+    except (HiloForo.DoesNotExist, RespuestaForo.DoesNotExist):
+        return JsonResponse({'error': 'Alguno de los objetos votados no existe'}, status=404)
+    except VotoInvalido as e:
+        return JsonResponse({'error': str(e)}, status=400)
+    return JsonResponse({'resultados': resultados})
+
 @login_required
 def eliminar_hilo(request, hilo_id):
     """Vista para eliminar un hilo (solo admin/pasante)"""
@@ -800,78 +1082,59 @@ from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib.auth.decorators import login_required
 from django.http import JsonResponse
 from .models import (PreguntaTestPersonalizado, OpcionRespuestaPersonalizado, 
-                    RespuestaTestPersonalizado, ResultadoTestPersonalizado, ContenidoPersonalizado)
+                    RespuestaTestPersonalizado, ResultadoTestPersonalizado, ResumenResultados,
+                    ContenidoPersonalizado)
+
+RESULTADOS_TEST_POR_PAGINA = 20
+# Resultados más recientes de los pacientes filtrados que entran en las cifras de su cohorte
+MAX_COHORTE_PACIENTE = 1000
+PACIENTES_POR_FILTRO = 50
 
 @login_required
 def realizar_test(request):
     """Vista para que los pacientes realicen el test"""
-    print("🔍 DEBUG: Entrando a realizar_test")
-    print(f"🔍 DEBUG: Método: {request.method}")
-    print(f"🔍 DEBUG: Usuario: {request.user}")
-    
     if request.method == 'POST':
-        print("🔍 DEBUG: Procesando POST...")
-        # Procesar respuestas
-        puntaje_total = 0
-        respuestas = []
-        
-        for key, value in request.POST.items():
-            if key.startswith('pregunta_'):
-                pregunta_id = key.replace('pregunta_', '')
-                try:
-                    pregunta = PreguntaTestPersonalizado.objects.get(id=pregunta_id)
-                    opcion = OpcionRespuestaPersonalizado.objects.get(id=value)
-                    puntaje_total += opcion.puntaje
-                    
-                    # Guardar respuesta
-                    respuesta = RespuestaTestPersonalizado(
-                        paciente=request.user,
-                        pregunta=pregunta,
-                        opcion_elegida=opcion
-                    )
-                    respuestas.append(respuesta)
-                    
-                except (PreguntaTestPersonalizado.DoesNotExist, OpcionRespuestaPersonalizado.DoesNotExist):
-                    pass
-        
-        # Guardar todas las respuestas
-        RespuestaTestPersonalizado.objects.bulk_create(respuestas)
-        
-        # Calcular diagnóstico
-        diagnostico = calcular_diagnostico(puntaje_total)
-        
-        # Guardar resultado
-        resultado = ResultadoTestPersonalizado(
-            paciente=request.user,
-            puntaje_total=puntaje_total,
-            diagnostico=diagnostico
-        )
-        resultado.save()
-        
-        print(f"🔍 DEBUG: Test completado - Puntaje: {puntaje_total}")
-        return redirect('miapp:resultado_test', resultado_id=resultado.id)  # ← ¡IMPORTANTE!
+        try:
+            resultado = registrar_envio(request.user, request.POST)
+        except EnvioInvalido as error:
+            messages.error(request, str(error))
+            return redirect('miapp:realizar_test')
+        borradores.descartar(request)
+        logger.info('Test registrado: resultado %s del usuario %s', resultado.id, request.user.id)
+        return redirect('miapp:resultado_test', resultado_id=resultado.id)
     
     else:
-        print("🔍 DEBUG: Mostrando formulario GET")
         # Mostrar el test
-        preguntas = PreguntaTestPersonalizado.objects.all().order_by('numero')
-        print(f"🔍 DEBUG: Preguntas encontradas: {preguntas.count()}")
-        
+        cuestionario = cuestionarios.actual()
         return render(request, 'miapp/realizar_test.html', {
-            'preguntas': preguntas,
+            'cuestionario': cuestionario,
+            'preguntas': cuestionario.preguntas,
+            'borrador': borradores.leer(request)['respuestas'],
             'seccion_actual': 'test'
         })
 
-def calcular_diagnostico(puntaje_total):
-    """Función para calcular el diagnóstico basado en el puntaje"""
-    if puntaje_total <= 20:
-        return "Bienestar emocional adecuado. Continúa con tus estrategias de afrontamiento positivas."
-    elif puntaje_total <= 40:
-        return "Leve malestar emocional. Podrías beneficiarte de estrategias adicionales de manejo del estrés."
-    elif puntaje_total <= 60:
-        return "Malestar emocional moderado. Recomendable buscar apoyo psicológico y practicar técnicas de relajación."
-    else:
-        return "Malestar emocional significativo. Es importante buscar ayuda profesional de psicología."
+@login_required
+@require_POST
+def autoguardar_test(request):
+    """
+    Endpoint JSON del borrador del test: {"version", "respuestas": {pregunta_id: opcion_id|null}, "finalizar"}.
+
+    Guarda solo los cambios recibidos; con "finalizar" corrige el borrador completo y devuelve la URL del resultado.
+    """
+    try:
+        datos = json.loads(request.body)
+        version, cambios = datos.get('version'), datos.get('respuestas') or {}
+    except (ValueError, AttributeError):
+        return JsonResponse({'error': 'Formato de borrador inválido'}, status=400)
+    try:
+        respuestas = borradores.aplicar(request, version, cambios)
+        if datos.get('finalizar'):
+            resultado = registrar_envio(request.user, borradores.como_envio(request))
+            borradores.descartar(request)
+            return JsonResponse({'redirect': reverse('miapp:resultado_test', args=[resultado.id])})
+    except EnvioInvalido as e:
+        return JsonResponse({'error': str(e)}, status=400)
+    return JsonResponse({'guardadas': len(respuestas), 'total': cuestionarios.actual().total})
 
 @login_required
 def resultado_test(request, resultado_id):
@@ -879,44 +1142,135 @@ def resultado_test(request, resultado_id):
     resultado = get_object_or_404(ResultadoTestPersonalizado, id=resultado_id, paciente=request.user)
     return render(request, 'miapp/resultado_test.html', {
         'resultado': resultado,
+        'recursos_recomendados': recomendaciones.actuales().de_puntaje(
+            resultado.puntaje_total, resultado.version_bandas_id
+        ),
         'seccion_actual': 'test'
     })
 
 @login_required
 def ver_resultados_pasante(request):
     """Vista para que los pasantes vean los resultados DETALLADOS de los pacientes"""
-    print("🔍 DEBUG: Entrando a ver_resultados_pasante")
-    print(f"🔍 DEBUG: Usuario: {request.user.username}")
-    print(f"🔍 DEBUG: Es pasante: {request.user.userprofile.es_pasante()}")
-    
     if not request.user.userprofile.es_pasante() and not request.user.userprofile.es_admin():
-        print("🔍 DEBUG: Redirigiendo - no es pasante ni admin")
         return redirect('miapp:index')
     
-    resultados = ResultadoTestPersonalizado.objects.all().order_by('-fecha_test')
-    print(f"🔍 DEBUG: Resultados encontrados: {resultados.count()}")
+    filtrados, paciente, desde, hasta = _resultados_filtrados(request)
+    resultados = filtrados.select_related('paciente').prefetch_related(
+        Prefetch(
+            'respuestas',
+            queryset=RespuestaTestPersonalizado.objects.select_related(
+                'pregunta', 'opcion_elegida'
+            ).order_by('pregunta__numero'),
+        )
+    )
     
-    # Agregar respuestas detalladas a cada resultado
-    resultados_detallados = []
-    for resultado in resultados:
-        respuestas = RespuestaTestPersonalizado.objects.filter(
-            paciente=resultado.paciente
-        ).select_related('pregunta', 'opcion_elegida')
-        
-        print(f"🔍 DEBUG: Resultado de {resultado.paciente.username} - {respuestas.count()} respuestas")
-        
-        resultados_detallados.append({
-            'resultado': resultado,
-            'respuestas': respuestas
-        })
+    pagina = Paginator(resultados, RESULTADOS_TEST_POR_PAGINA).get_page(request.GET.get('page'))
+    # Las respuestas de la página ya vienen del prefetch; no se vuelven a leer
+    for resultado in pagina:
+        resultado.resumen_secciones = calcular_resumen_por_seccion(resultado.respuestas.all())
     
-    print(f"🔍 DEBUG: Enviando {len(resultados_detallados)} resultados al template")
+    if paciente:
+        # Los agregados no distinguen pacientes: se resumen sus resultados más recientes, con tope
+        cohorte = tendencias.resumen_de(filtrados[:MAX_COHORTE_PACIENTE])
+    else:
+        # Sin paciente la cohorte son días completos, que ya están sumados en los agregados diarios
+        cohorte = tendencias.resumen_entre(desde, hasta)
     
     return render(request, 'miapp/pasante/ver_resultados.html', {
-        'resultados_detallados': resultados_detallados,
+        'pagina': pagina,
+        'cohorte': cohorte,
+        'cohorte_acotada': bool(paciente) and cohorte['total'] >= MAX_COHORTE_PACIENTE,
+        'paciente_actual': paciente,
+        'desde': desde,
+        'hasta': hasta,
+        'seccion_actual': 'resultados'
+    })
+
+def _pacientes_que_coinciden(texto):
+    """Ids de los usuarios llamados `texto` o, si no hay ninguno, cuyo nombre empieza por `texto`"""
+    # Igualdad y prefijo usan el índice de username; un '%texto%' recorrería la tabla entera
+    exacto = User.objects.filter(username=texto).values_list('id', flat=True).first()
+    if exacto is not None:
+        return [exacto]
+    return list(
+        User.objects.filter(username__startswith=texto).order_by('username')
+        .values_list('id', flat=True)[:PACIENTES_POR_FILTRO]
+    )
+
+def _resultados_filtrados(request):
+    """Resultados filtrados por paciente y rango de fechas (?paciente=&desde=&hasta=), más recientes primero"""
+    paciente = request.GET.get('paciente', '').strip()
+    desde = _leer_fecha(request.GET.get('desde'))
+    hasta = _leer_fecha(request.GET.get('hasta'))
+    
+    resultados = ResultadoTestPersonalizado.objects.order_by('-fecha_test', '-id')
+    if paciente:
+        # Filtro por paciente_id para usar resultado_paciente_fecha_idx en lugar de recorrer auth_user
+        resultados = resultados.filter(paciente_id__in=_pacientes_que_coinciden(paciente))
+    # Rangos sobre la columna (no fecha_test__date) para que se use el índice
+    if desde:
+        resultados = resultados.filter(fecha_test__gte=_inicio_del_dia(desde))
+    if hasta:
+        resultados = resultados.filter(fecha_test__lt=_inicio_del_dia(hasta + timedelta(days=1)))
+    return resultados, paciente, desde, hasta
+
+@login_required
+def exportar_resultados(request, formato):
+    """Descarga de resultados con sus respuestas en CSV o JSON Lines, generada en streaming"""
+    if not request.user.userprofile.es_pasante() and not request.user.userprofile.es_admin():
+        return redirect('miapp:index')
+    if formato not in exportacion.FORMATOS:
+        raise Http404
+    
+    resultados, _, _, _ = _resultados_filtrados(request)
+    generar, tipo = exportacion.FORMATOS[formato]
+    respuesta = StreamingHttpResponse(generar(resultados), content_type=tipo)
+    nombre = f"resultados_{timezone.localdate():%Y%m%d}.{formato}"
+    respuesta['Content-Disposition'] = f'attachment; filename="{nombre}"'
+    return respuesta
+
+PERIODO_POR_DEFECTO = {'dia': 30, 'semana': 7 * 12}
+
+def _serie_tendencias(request):
+    periodo = request.GET.get('periodo')
+    if periodo not in tendencias.PERIODOS:
+        periodo = 'semana'
+    hasta = _leer_fecha(request.GET.get('hasta')) or timezone.localdate()
+    desde = _leer_fecha(request.GET.get('desde')) or hasta - timedelta(days=PERIODO_POR_DEFECTO[periodo])
+    return desde, hasta, tendencias.serie(periodo, desde, hasta)
+
+@login_required
+def tendencias_resultados(request):
+    """Panel de tendencias de los resultados, leído solo de los agregados diarios/semanales"""
+    if not request.user.userprofile.es_pasante() and not request.user.userprofile.es_admin():
+        return redirect('miapp:index')
+    
+    desde, hasta, datos = _serie_tendencias(request)
+    return render(request, 'miapp/pasante/tendencias.html', {
+        'datos': datos,
+        'desde': desde,
+        'hasta': hasta,
+        'periodos': ResumenResultados.PERIODO_CHOICES,
         'seccion_actual': 'resultados'
     })
 
+@login_required
+def tendencias_resultados_json(request):
+    if not request.user.userprofile.es_pasante() and not request.user.userprofile.es_admin():
+        return JsonResponse({'error': 'No autorizado'}, status=403)
+    
+    desde, hasta, datos = _serie_tendencias(request)
+    return JsonResponse({'desde': desde, 'hasta': hasta, **datos})
+
+def _leer_fecha(valor):
+    try:
+        return parse_date(valor or '')
+    except ValueError:
+        return None
+
+def _inicio_del_dia(fecha):
+    return timezone.make_aware(datetime.combine(fecha, time.min))
+
 @login_required
 def subir_contenido_personalizado(request, paciente_id):
     """Vista para que los pasantes suban contenido personalizado"""
@@ -930,8 +1284,18 @@ def subir_contenido_personalizado(request, paciente_id):
         titulo = request.POST.get('titulo')
         descripcion = request.POST.get('descripcion')
         tipo_contenido = request.POST.get('tipo_contenido')
-        archivo = request.FILES.get('archivo')
-        url = request.POST.get('url')
+        url = request.POST.get('url', '')
+        
+        if not titulo or not descripcion or not tipo_contenido:
+            messages.error(request, 'Por favor completa todos los campos obligatorios (Título, Descripción, Tipo).')
+            return redirect('miapp:subir_contenido_personalizado', paciente_id=paciente_id)
+        
+        # La subida por fragmentos se adjunta solo con el formulario ya válido
+        try:
+            archivo = subidas.archivo_del_formulario(request, ContenidoPersonalizado, 'archivo')
+        except subidas.SubidaInvalida as e:
+            messages.error(request, str(e))
+            return redirect('miapp:subir_contenido_personalizado', paciente_id=paciente_id)
         
         contenido = ContenidoPersonalizado(
             pasante=request.user,
@@ -952,6 +1316,66 @@ def subir_contenido_personalizado(request, paciente_id):
         'seccion_actual': 'contenido'
     })
 
+def _es_equipo(usuario):
+    perfil = getattr(usuario, 'userprofile', None)
+    return perfil is not None and (perfil.es_pasante() or perfil.es_admin())
+
+def _subida_del_usuario(request, subida_id):
+    return get_object_or_404(SubidaParcial, pk=subida_id, usuario=request.user)
+
+@login_required
+@require_POST
+def iniciar_subida(request):
+    """Subida por fragmentos (subidas.py), paso 1: {"nombre", "tamano"} -> {"id", "recibido", "fragmento"}"""
+    if not _es_equipo(request.user):
+        return JsonResponse({'error': 'No tienes permisos para subir archivos'}, status=403)
+    try:
+        datos = json.loads(request.body)
+        subida = subidas.iniciar(request.user, datos.get('nombre'), datos.get('tamano'))
+    except (ValueError, AttributeError) as e:
+        # SubidaInvalida es un ValueError con un mensaje para el usuario
+        mensaje = str(e) if isinstance(e, subidas.SubidaInvalida) else 'Formato inválido'
+        return JsonResponse({'error': mensaje}, status=400)
+    return JsonResponse({'id': str(subida.id), 'recibido': 0, 'fragmento': subidas.TAMANO_FRAGMENTO}, status=201)
+
+@login_required
+@require_http_methods(['GET', 'PUT'])
+def subida_fragmentada(request, subida_id):
+    """GET: bytes recibidos (para reanudar). PUT ?offset=N: añade el cuerpo crudo como siguiente fragmento"""
+    subida = _subida_del_usuario(request, subida_id)
+    if request.method == 'GET':
+        return JsonResponse({'recibido': subida.recibido, 'tamano': subida.tamano, 'finalizada': bool(subida.sha256)})
+    try:
+        offset = int(request.GET.get('offset', ''))
+        longitud = int(request.headers.get('Content-Length') or 0)
+        recibido = subidas.agregar_fragmento(subida, offset, request, longitud)
+    except subidas.OffsetIncorrecto as e:
+        return JsonResponse({'error': str(e), 'recibido': e.recibido}, status=409)
+    except subidas.SubidaInvalida as e:
+        return JsonResponse({'error': str(e), 'recibido': subida.recibido}, status=400)
+    except ValueError:
+        return JsonResponse({'error': 'Falta el offset del fragmento'}, status=400)
+    return JsonResponse({'recibido': recibido})
+
+@login_required
+@require_POST
+def finalizar_subida(request, subida_id):
+    """Paso final: comprueba tamaño y SHA-256 ({"sha256"} opcional). El formulario envía luego <campo>_subida=id"""
+    subida = _subida_del_usuario(request, subida_id)
+    try:
+        datos = json.loads(request.body) if request.content_type == 'application/json' else {}
+        subidas.finalizar(subida, datos.get('sha256'))
+    except subidas.SubidaInvalida as e:
+        return JsonResponse({'error': str(e)}, status=400)
+    except (ValueError, AttributeError):
+        return JsonResponse({'error': 'Formato inválido'}, status=400)
+    return JsonResponse({'id': str(subida.id), 'sha256': subida.sha256, 'tamano': subida.tamano})
+
+@require_safe
+def servir_medio(request, ruta):
+    """Archivos de MEDIA_ROOT; el contenido personalizado solo para su paciente y el equipo"""
+    return medios.servir(request, ruta)
+
 @login_required
 def ver_contenido_personalizado(request):
     """Vista para que los pacientes vean su contenido personalizado"""
@@ -973,8 +1397,6 @@ def calcular_resumen_por_seccion(respuestas):
 
 def ver_como_usuario(request):
     """Vista para que los pasantes vean el sitio como usuarios normales"""
-    print("🔍 DEBUG: Activando modo 'Ver como Usuario'")
-    
     # Verificar que sea pasante o admin
     if not hasattr(request.user, 'userprofile') or (
         not request.user.userprofile.es_pasante() and 
@@ -985,30 +1407,17 @@ def ver_como_usuario(request):
     # Guardar en sesión que está en modo "ver como usuario"
     request.session['viewing_as_user'] = True
     request.session['original_user_type'] = request.user.userprofile.tipo_usuario
-    print(f"🔍 DEBUG: Usuario {request.user.username} entrando en modo usuario")
+    logger.info('Usuario %s entra en modo "ver como usuario"', request.user.username)
     
     return redirect('miapp:index')
 
 def volver_a_pasante(request):
     """Volver al modo pasante"""
-    print("🔍 DEBUG: Volviendo al modo pasante")
-    
     if 'viewing_as_user' in request.session:
         del request.session['viewing_as_user']
     if 'original_user_type' in request.session:
         del request.session['original_user_type']
     
-    print(f"🔍 DEBUG: Usuario {request.user.username} volviendo a modo pasante")
+    logger.info('Usuario %s vuelve al modo pasante', request.user.username)
     return redirect('miapp:pasante_dashboard')
 
-
-@login_required
-def recursos(request):
-    """Vista para los recursos - Versión mejorada"""
-    try:
-        recursos_list = Recurso.objects.filter(es_publico=True)
-        return render(request, 'miapp/recursos.html', {'recursos': recursos_list})
-    except Exception as e:
-        print(f"🔍 ERROR en vista recursos: {e}")
-        # Si hay error, redirigir a una página segura
-        return redirect('miapp:index')
@@ -0,0 +1,121 @@
+"""
+Contador de visitas con escritura diferida para los hilos del foro.
+
+Las visitas se acumulan en memoria (por proceso) y se vuelcan cada
+VISITAS_INTERVALO_VOLCADO segundos con un único UPDATE que solo toca la
+columna `visitas` mediante F(), así que no se pierden incrementos
+concurrentes ni se modifica `actualizado_en`.
+
+La primera visita pendiente programa un temporizador que vuelca el buffer
+como mucho VISITAS_INTERVALO_VOLCADO segundos después, aunque el worker no
+reciba más peticiones; al salir del proceso se vuelca lo que quede. Si el
+proceso muere sin salir (SIGKILL, OOM) se pierden como mucho las visitas de
+ese último intervalo.
+"""
+import atexit
+import logging
+import threading
+import time
+from collections import Counter
+
+from django.conf import settings
+from django.db import connections
+from django.db.models import Case, F, When
+
+from .models import HiloForo
+from .ranking import actualizar_hot
+
+logger = logging.getLogger(__name__)
+
+VISITAS_INTERVALO_VOLCADO = getattr(settings, 'VISITAS_INTERVALO_VOLCADO', 30)
+VISITAS_MAX_PENDIENTES = getattr(settings, 'VISITAS_MAX_PENDIENTES', 500)
+
+# Cuántos hilos vistos se recuerdan por sesión para contar visitas únicas
+HILOS_VISTOS_POR_SESION = 200
+
+_lock = threading.Lock()
+_pendientes = Counter()
+_ultimo_volcado = time.monotonic()
+_temporizador = None
+
+
+def registrar_visita(request, hilo_id):
+    """Suma una visita al hilo si la sesión no lo había visto antes. Devuelve True si contó"""
+    vistos = request.session.get('hilos_vistos', [])
+    if hilo_id in vistos:
+        return False
+    vistos.append(hilo_id)
+    request.session['hilos_vistos'] = vistos[-HILOS_VISTOS_POR_SESION:]
+
+    with _lock:
+        _pendientes[hilo_id] += 1
+        _programar_volcado()
+        debe_volcar = (
+            len(_pendientes) >= VISITAS_MAX_PENDIENTES
+            or time.monotonic() - _ultimo_volcado >= VISITAS_INTERVALO_VOLCADO
+        )
+    if debe_volcar:
+        try:
+            volcar_visitas()
+        except Exception:
+            # La visita ya cuenta: un fallo al volcar lo acumulado (también por otros hilos) no debe
+            # convertir la página en un 500. volcar_visitas() devuelve el lote al buffer y el temporizador reintenta
+            logger.exception('No se pudieron volcar las visitas pendientes')
+    return True
+
+
+def _programar_volcado():
+    """Con _lock tomado: asegura que haya un volcado programado para las visitas pendientes"""
+    global _temporizador
+    if _temporizador is None:
+        _temporizador = threading.Timer(VISITAS_INTERVALO_VOLCADO, _volcar_en_segundo_plano)
+        _temporizador.daemon = True
+        _temporizador.start()
+
+
+def _volcar_en_segundo_plano():
+    try:
+        volcar_visitas()
+    except Exception:
+        logger.exception('No se pudieron volcar las visitas pendientes')
+    finally:
+        # El temporizador corre en su propio hilo, con su propia conexión
+        connections.close_all()
+
+
+def visitas_pendientes(hilo_id):
+    """Visitas acumuladas en este proceso que aún no están en la base de datos"""
+    with _lock:
+        return _pendientes.get(hilo_id, 0)
+
+
+def volcar_visitas():
+    """Escribe en la base de datos las visitas acumuladas con un único UPDATE"""
+    global _pendientes, _ultimo_volcado, _temporizador
+    with _lock:
+        lote, _pendientes = _pendientes, Counter()
+        _ultimo_volcado = time.monotonic()
+        if _temporizador is not None:
+            _temporizador.cancel()
+            _temporizador = None
+    if not lote:
+        return 0
+
+    try:
+        HiloForo.objects.filter(pk__in=lote.keys()).update(
+            visitas=F('visitas') + Case(
+                *[When(pk=hilo_id, then=cantidad) for hilo_id, cantidad in lote.items()],
+                default=0,
+            )
+        )
+    except Exception:
+        # Si falla la escritura se devuelven los incrementos al buffer para el próximo volcado
+        with _lock:
+            _pendientes.update(lote)
+            _programar_volcado()
+        raise
+    actualizar_hot(lote.keys())
+    return sum(lote.values())
+
+
+atexit.register(volcar_visitas)
@@ -0,0 +1,130 @@
+"""
+Motor de votos para hilos y respuestas del foro.
+
+Cada voto hace upsert de la fila VotoHilo/VotoRespuesta y ajusta los
+contadores votos_positivos/votos_negativos del objeto votado en la misma
+transacción, con UPDATE + F() para no depender del valor leído en Python.
+"""
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F, OuterRef, Q, Subquery
+from django.db.models.functions import Coalesce
+
+from .models import HiloForo, RespuestaForo, VotoHilo, VotoRespuesta
+from .ranking import actualizar_hot
+
+TIPOS_VOTO = ('positivo', 'negativo')
+MAX_VOTOS_POR_LOTE = 100
+
+# tipo de objeto -> (modelo votado, modelo de voto, nombre del FK en el voto)
+OBJETIVOS_VOTO = {
+    'hilo': (HiloForo, VotoHilo, 'hilo'),
+    'respuesta': (RespuestaForo, VotoRespuesta, 'respuesta'),
+}
+
+_COLUMNA_CONTADOR = {'positivo': 'votos_positivos', 'negativo': 'votos_negativos'}
+
+
+class VotoInvalido(ValueError):
+    pass
+
+
+def votar(usuario, tipo_objeto, objeto_id, tipo_voto):
+    """
+    Registra, cambia o retira (tipo_voto vacío o None) el voto de `usuario`.
+
+    Devuelve un dict con los contadores actualizados y el voto vigente.
+    """
+    if tipo_objeto not in OBJETIVOS_VOTO:
+        raise VotoInvalido(f'Tipo de objeto desconocido: {tipo_objeto}')
+    if tipo_voto and tipo_voto not in TIPOS_VOTO:
+        raise VotoInvalido(f'Tipo de voto desconocido: {tipo_voto}')
+    modelo, modelo_voto, campo = OBJETIVOS_VOTO[tipo_objeto]
+
+    with transaction.atomic():
+        # Bloquea la fila votada: serializa los votos concurrentes sobre el mismo objeto
+        if not modelo.objects.select_for_update().filter(pk=objeto_id).exists():
+            raise modelo.DoesNotExist
+        filtro = {campo + '_id': objeto_id, 'usuario': usuario}
+        voto = modelo_voto.objects.select_for_update().filter(**filtro).first()
+        anterior = voto.tipo_voto if voto else None
+        nuevo = tipo_voto or None
+
+        if anterior != nuevo:
+            if voto is None:
+                try:
+                    with transaction.atomic():
+                        modelo_voto.objects.create(tipo_voto=nuevo, **filtro)
+                except IntegrityError:
+                    raise VotoInvalido('Voto duplicado, inténtalo de nuevo')
+            elif nuevo is None:
+                voto.delete()
+            else:
+                modelo_voto.objects.filter(pk=voto.pk).update(tipo_voto=nuevo)
+
+            cambios = {}
+            if anterior:
+                cambios[_COLUMNA_CONTADOR[anterior]] = F(_COLUMNA_CONTADOR[anterior]) - 1
+            if nuevo:
+                cambios[_COLUMNA_CONTADOR[nuevo]] = F(_COLUMNA_CONTADOR[nuevo]) + 1
+            modelo.objects.filter(pk=objeto_id).update(**cambios)
+            if tipo_objeto == 'hilo':
+                actualizar_hot([objeto_id])
+
+        positivos, negativos = modelo.objects.filter(pk=objeto_id).values_list(
+            'votos_positivos', 'votos_negativos'
+        ).get()
+
+    return {
+        'tipo_objeto': tipo_objeto,
+        'id': objeto_id,
+        'mi_voto': nuevo,
+        'votos_positivos': positivos,
+        'votos_negativos': negativos,
+    }
+
+
+def votar_lote(usuario, votos):
+    """
+    Aplica una lista de votos [{'tipo_objeto', 'id', 'voto'}] en una sola transacción.
+
+    Devuelve los resultados en el orden de `votos`, pero los aplica ordenados por (tipo_objeto, id):
+    dos lotes simultáneos bloquean las mismas filas en el mismo orden y no pueden interbloquearse.
+    """
+    if len(votos) > MAX_VOTOS_POR_LOTE:
+        raise VotoInvalido(f'Como máximo {MAX_VOTOS_POR_LOTE} votos por lote')
+    orden = sorted(range(len(votos)), key=lambda i: (str(votos[i].get('tipo_objeto')), votos[i].get('id')))
+    resultados = [None] * len(votos)
+    with transaction.atomic():
+        for i in orden:
+            voto = votos[i]
+            resultados[i] = votar(usuario, voto.get('tipo_objeto'), voto.get('id'), voto.get('voto'))
+    return resultados
+
+
+def anotar_mi_voto(respuestas, usuario):
+    """Añade `mi_voto` a cada respuesta del queryset con una subconsulta, sin una consulta por fila"""
+    return respuestas.annotate(
+        mi_voto=Subquery(
+            VotoRespuesta.objects.filter(respuesta=OuterRef('pk'), usuario=usuario).values('tipo_voto')[:1]
+        )
+    )
+
+
+def voto_de_usuario(hilo, usuario):
+    return VotoHilo.objects.filter(hilo=hilo, usuario=usuario).values_list('tipo_voto', flat=True).first()
+
+
+def reconciliar_contadores():
+    """Recalcula votos_positivos/votos_negativos desde las tablas de votos con agregación agrupada"""
+    actualizados = {}
+    for tipo_objeto, (modelo, modelo_voto, campo) in OBJETIVOS_VOTO.items():
+        conteos = modelo_voto.objects.filter(**{campo: OuterRef('pk')}).order_by().values(campo)
+        actualizados[tipo_objeto] = modelo.objects.update(
+            votos_positivos=Coalesce(Subquery(
+                conteos.annotate(n=Count('id', filter=Q(tipo_voto='positivo'))).values('n')
+            ), 0),
+            votos_negativos=Coalesce(Subquery(
+                conteos.annotate(n=Count('id', filter=Q(tipo_voto='negativo'))).values('n')
+            ), 0),
+        )
+    return actualizados
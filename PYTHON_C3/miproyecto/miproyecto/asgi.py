@@ -5,6 +5,11 @@ It exposes the ASGI callable as a module-level variable named ``application``.
 
 For more information on this file, see
 https://docs.djangoproject.com/en/5.2/howto/deployment/asgi/
+
+Los flujos en tiempo real del foro (Server-Sent Events, ver miapp/tiempo_real.py)
+solo funcionan sirviendo este punto de entrada, por ejemplo:
+
+    uvicorn miproyecto.asgi:application
 """
 
 import os
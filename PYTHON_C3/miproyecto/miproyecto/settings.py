@@ -85,6 +85,19 @@ DATABASES = {
     }
 }
 
+# 'referencia' es una caché compartida por todos los workers donde miapp/cache_referencia.py
+# guarda solo las versiones de los datos de referencia (los datos siguen en cada proceso).
+# Su tabla se crea en cada despliegue, después de migrate: python manage.py createcachetable
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'referencia': {
+        'BACKEND': 'django.core.cache.backends.db.DatabaseCache',
+        'LOCATION': 'miapp_cache',
+    },
+}
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
@@ -1,10 +1,15 @@
+import re
+
 from django.contrib import admin
-from django.urls import path, include
+from django.urls import path, include, re_path
 from django.conf import settings
-from django.conf.urls.static import static
+
+from miapp.views import servir_medio
 
 urlpatterns = [
     path('django-admin/', admin.site.urls),
     path('', include('miapp.urls')),
-] + static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
-
+    # Archivos subidos: ETag, rangos y permisos (miapp/medios.py); también en producción,
+    # donde con MEDIA_DESCARGA el envío lo hace el servidor web
+    re_path(r'^%s(?P<ruta>.+)$' % re.escape(settings.MEDIA_URL.lstrip('/')), servir_medio, name='medio'),
+]